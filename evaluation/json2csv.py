@@ -30,6 +30,14 @@ from collections import defaultdict
 from enum import Enum
 from dataclasses import dataclass
 import logging
+import sys
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# Compact JSONL answers are merged into template blocks exactly as the simulator writes them.
+from text_simulation.postprocess_responses import apply_imputed_answers
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -76,6 +84,10 @@ class AnswerExtractor:
             logger.error(f"Failed to load {json_path}: {e}")
             return {}
         
+        return self.extract_from_blocks(blocks, json_path, include_text_labels)
+    
+    def extract_from_blocks(self, blocks: Union[List, Dict], json_path: str, include_text_labels: bool = False) -> Dict[str, Any]:
+        """Extract answers from already-loaded answer blocks; ``json_path`` names the source for metadata."""
         # Extract metadata
         answers = self._extract_metadata(json_path)
         
@@ -567,6 +579,11 @@ class JSONToCSVConverter:
             logger.warning(f"No input pattern specified for {wave_name}")
             return None
 
+        template_pattern = wave_config.get('template_pattern')
+        if input_pattern.endswith('.jsonl') and not template_pattern:
+            logger.warning(f"Compact JSONL input for {wave_name} needs a template_pattern")
+            return None
+
         full_pattern = input_pattern.replace('{pid}', '*')
         json_files = sorted(glob.glob(full_pattern, recursive=True))
         if not json_files:
@@ -598,11 +615,20 @@ class JSONToCSVConverter:
         logger.info(f"🚀 Parallel processing with {workers} workers for {len(persona_groups)} personas")
 
         results_meta = []
-        tasks = [(pid, files, str(output_root)) for pid, files in persona_groups.items()]
+        if input_pattern.endswith('.jsonl'):
+            # 紧凑格式：每个 persona 一个 JSONL，答案需合并回模板
+            process_one = _process_one_persona_jsonl_to_csv
+            tasks = [
+                (pid, files, template_pattern.replace('{pid}', pid.split('_', 1)[1]), str(output_root))
+                for pid, files in persona_groups.items()
+            ]
+        else:
+            process_one = _process_one_persona_to_csv
+            tasks = [(pid, files, str(output_root)) for pid, files in persona_groups.items()]
 
         # 进程池执行
         with ProcessPoolExecutor(max_workers=workers) as exe:
-            futs = [exe.submit(_process_one_persona_to_csv, t) for t in tasks]
+            futs = [exe.submit(process_one, t) for t in tasks]
             for fut in as_completed(futs):
                 pid, csv_path, nrows = fut.result()
                 if nrows == 0:
@@ -1363,6 +1389,62 @@ def _process_one_persona_to_csv(args: Tuple[str, Sequence[str], str]) -> Tuple[s
         return pid, os.path.join(output_dir, f"{pid}.csv"), 0
 
 
+def read_imputed_answer_records(jsonl_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load a compact imputed-answer JSONL file (one record per simulation).
+
+    Returns ``{simulation_id: record}``; when a simulation was re-run, its last
+    record wins.
+    """
+    records = {}
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed line {line_no} in {jsonl_path}: {e}")
+                continue
+            records[record['simulation_id']] = record
+    return records
+
+
+def _process_one_persona_jsonl_to_csv(args: Tuple[str, Sequence[str], str, str]) -> Tuple[str, str, int]:
+    """
+    子进程中运行：处理单个 persona 的紧凑 JSONL 输出，落盘为 csv，并返回 (pid, csv_path, n_rows)
+    args: (pid, jsonl_files, template_path, output_dir)
+    """
+    pid, files, template_path, output_dir = args
+    out_path = os.path.join(output_dir, f"{pid}.csv")
+    try:
+        with open(template_path, 'r', encoding='utf-8') as f:
+            template = json.load(f)
+
+        records = {}
+        for jsonl_path in files:
+            records.update(read_imputed_answer_records(jsonl_path))
+
+        numeric_extractor = AnswerExtractor(ExtractionMode.NUMERIC)
+        persona_numeric = []
+        for sim_id in sorted(records):
+            blocks = apply_imputed_answers(template, records[sim_id].get('answers', {}))
+            numeric_ans = numeric_extractor.extract_from_blocks(blocks, template_path)
+            if numeric_ans:
+                numeric_ans.update({"PERSONA_ID": pid, "SIMULATION_ID": sim_id})
+                persona_numeric.append(numeric_ans)
+
+        if not persona_numeric:
+            return pid, out_path, 0
+
+        df_num = pd.DataFrame(persona_numeric)
+        df_num.to_csv(out_path, index=False)
+        return pid, out_path, len(df_num)
+    except Exception as e:
+        logger.warning(f"[{pid}] failed in worker: {e}")
+        return pid, out_path, 0
+
+
 def _save_dataframe(df: pd.DataFrame, output_path: str, description: str, add_description_row: bool = False, 
                     descriptions_dict: Optional[Dict[str, str]] = None):
     """Helper function to save a DataFrame with proper error handling."""
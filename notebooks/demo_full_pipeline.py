@@ -10,7 +10,6 @@ import yaml
 import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
-import time
 from text_simulation.full_pipeline_utils import *
 
 # API keys are loaded from ENV_PATH below; do not commit real keys into code.
@@ -365,12 +364,8 @@ output_sim_dir = RUN_OUTPUT_ROOT
 
 
 # Count how many simulations exist for each persona
-pid_sim_counts = {}
-if output_sim_dir.exists():
-    for pid_dir in output_sim_dir.iterdir():
-        if pid_dir.is_dir() and pid_dir.name.startswith("pid_"):
-            sim_dirs = [d for d in pid_dir.iterdir() if d.is_dir() and "sim" in d.name]
-            pid_sim_counts[pid_dir.name] = len(sim_dirs)
+# (queried from the run manifest instead of walking every sim directory)
+pid_sim_counts = persona_simulation_counts(output_sim_dir) if output_sim_dir.exists() else {}
 
 complete_pids = []
 incomplete_pids = []
@@ -410,12 +405,11 @@ else:
 
 
 # ============================================
-# Step 8: Run LLM Simulations (Sequential Mode)
+# Step 8: Run LLM Simulations (In-Process)
 # ============================================
 
-import subprocess
-import time
 import datetime
+from text_simulation.run_LLM_simulations import run_simulations_for
 
 # Display current configuration
 config_path = project_root / "text_simulation" / "configs" / "openai_config.yaml"
@@ -430,83 +424,29 @@ print(f"  Workers: {config['num_workers']}")
 print(f"  Force regenerate: {config['force_regenerate']}")
 print(f"  Number of Simulations Per Persona: {config['num_simulations_per_persona']}")
 print("=" * 60)
-print("Step 8: Run LLM Simulations (Sequential Mode)")
+print("Step 8: Run LLM Simulations (In-Process)")
 print("=" * 60)
-print("\nThis will run each persona one-by-one to prevent rate-limit or batch failures.\n")
+print("\nAll personas run in one event loop; the shared rate limiter handles API pacing.\n")
 
 if skip_simulations:
     print("✅ All personas already finished. Skipping simulation step.")
 else:
-    env = os.environ.copy()
-    env["PYTHONPATH"] = (
-        str(project_root)
-        + os.pathsep
-        + str(project_root / "text_simulation")
-        + os.pathsep
-        + env.get("PYTHONPATH", "")
-    )
-
-    # ✅ Create log file
-    log_path = project_root / f"simulation_run_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-    log_file = open(log_path, "w", encoding="utf-8")
+    config['num_simulations_per_persona'] = NUM_SIMULATIONS_PER_PERSONA
 
     print("=" * 60)
-    print(f"🧠 Starting sequential simulation run at {datetime.datetime.now()}")
-    print(f"📝 Logging to: {log_path}")
+    print(f"🧠 Starting simulation run for {len(pids_to_run)} personas at {datetime.datetime.now()}")
     print("=" * 60)
 
-    failed_pids = []
-
-    for pid in pids_to_run:
-        print(f"\n🚀 Running simulation for persona: {pid}")
-        print("-" * 60)
-        log_file.write(f"\n[{datetime.datetime.now()}] Running simulation for {pid}\n")
-
-        process = subprocess.Popen(
-            [
-                sys.executable,
-                str(project_root / "text_simulation" / "run_LLM_simulations.py"),
-                "--config",
-                str(project_root / "text_simulation" / "configs" / "openai_config.yaml"),
-                "--max_personas",
-                "1",  # 每次只跑一个人
-                "--num_simulations_per_persona",
-                str(NUM_SIMULATIONS_PER_PERSONA),
-                "--pids",
-                pid,
-            ],
-            cwd=str(project_root),
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-        )
-
-        for line in process.stdout:
-            print(line.rstrip())
-            log_file.write(line)
-
-        process.wait()
-
-        if process.returncode == 0:
-            print(f"✅ {pid} completed successfully.")
-            log_file.write(f"[{datetime.datetime.now()}] ✅ {pid} completed successfully.\n")
-        else:
-            print(f"❌ {pid} failed (exit code: {process.returncode})")
-            log_file.write(f"[{datetime.datetime.now()}] ❌ {pid} failed.\n")
-            failed_pids.append(pid)
-
-        # ✅ 每次之间暂停 5 秒，避免 API 限速
-        print("⏸️  Waiting 5 seconds before next persona...\n")
-        time.sleep(5)
+    summary = run_simulations_for(pids_to_run, config)
 
-    log_file.close()
+    # Per-job results are in <output_root>/run_log.jsonl, errors in simulation_errors.json.
+    failed_pids = sorted({prompt_id.split("_sim")[0] for prompt_id in summary["errors"]})
 
-    print("\n🎯 All sequential simulations finished.")
-    print(f"📘 Full log saved at: {log_path}")
+    print("\n🎯 All simulations finished.")
+    print(f"📘 Run log saved at: {Path(summary['output_root']) / 'run_log.jsonl'}")
 
     if failed_pids:
-        print(f"\n⚠️ The following personas failed: {', '.join(failed_pids)}")
+        print(f"\n⚠️ The following personas have failed simulations: {', '.join(failed_pids)}")
         fail_path = project_root / "failed_personas.txt"
         with open(fail_path, "w") as f:
             f.write("\n".join(failed_pids))
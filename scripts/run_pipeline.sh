@@ -38,6 +38,7 @@ echo "Step 3: Creating text simulation input..."
 poetry run python text_simulation/create_text_simulation_input.py 
 
 echo "Step 4: Running LLM simulation..."
-poetry run python text_simulation/run_LLM_simulations.py --config text_simulation/configs/openai_config.yaml --max_personas "$MAX_PERSONAS"
+# All personas run in one process and event loop (max_personas was written to the config above).
+poetry run python -c "from text_simulation.run_LLM_simulations import run_simulations_for; run_simulations_for(None, 'text_simulation/configs/openai_config.yaml')"
 
 echo "Pipeline completed!" 
\ No newline at end of file
@@ -0,0 +1,328 @@
+"""
+Provider batch-API execution mode for bulk simulations.
+
+Instead of one interactive request per simulation, jobs are serialized into
+provider batch-request JSONL files, submitted through the OpenAI Batch API or
+the Anthropic Message Batches API, polled until they finish, and streamed back
+through the same verification callback used by ``process_prompts_batch``.
+Jobs whose response fails verification (or errors) are resubmitted in a
+follow-up batch, up to ``config.max_retries`` rounds; jobs failing with a
+non-retryable error are not. Prompts are spooled to disk, so memory stays
+flat for large runs.
+
+Point ``provider_params.base_url`` at a local stand-in server (``mock_llm.py
+serve``) to exercise the whole path without a paid API.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import openai
+from tqdm import tqdm
+
+from text_simulation.llm_helper import (
+    LLMClientRegistry,
+    LLMConfig,
+    build_request_payload,
+    chat_completion_response_data,
+    claude_response_data,
+    job_record,
+    verify_llm_response,
+)
+from text_simulation.retry_policy import NON_RETRYABLE, RETRYABLE, classify_error, classify_status_code
+from text_simulation.run_metrics import RunMetrics
+
+BATCH_PROVIDERS = ("openai", "claude", "anthropic")
+OPENAI_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+OPENAI_BATCH_ENDPOINT = "/v1/chat/completions"
+# Message Batches error types that fail again when resubmitted unchanged.
+ANTHROPIC_NON_RETRYABLE_ERRORS = {
+    "invalid_request_error", "authentication_error", "billing_error", "permission_error", "not_found_error", "request_too_large",
+}
+
+
+def build_batch_request_line(prompt_id: str, prompt_text: str, config: LLMConfig, provider: str) -> Dict:
+    """One JSONL line of a provider batch-request file."""
+    body = build_request_payload(prompt_text, config, provider)
+    # The SDKs merge extra_body into the JSON body of online requests; do the same here
+    body.update(body.pop("extra_body", None) or {})
+    if provider == "openai":
+        return {"custom_id": prompt_id, "method": "POST", "url": OPENAI_BATCH_ENDPOINT, "body": body}
+    return {"custom_id": prompt_id, "params": body}
+
+
+def write_batch_request_files(
+    jobs: Iterable[Tuple[str, str]],
+    config: LLMConfig,
+    provider: str,
+    work_dir: Union[str, Path],
+    *,
+    prefix: str = "batch",
+    max_requests_per_file: int = 50000,
+    max_bytes_per_file: int = 190 * 1024 * 1024,
+) -> List[Path]:
+    """Stream jobs into size-limited batch-request JSONL files and return their paths."""
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    paths: List[Path] = []
+    out = None
+    n_requests = n_bytes = 0
+    try:
+        for prompt_id, prompt_text in jobs:
+            line = (json.dumps(build_batch_request_line(prompt_id, prompt_text, config, provider), ensure_ascii=False) + "\n").encode("utf-8")
+            if out is None or n_requests >= max_requests_per_file or n_bytes + len(line) > max_bytes_per_file:
+                if out is not None:
+                    out.close()
+                paths.append(work_dir / f"{prefix}_{len(paths):03d}.jsonl")
+                out = open(paths[-1], "wb")
+                n_requests = n_bytes = 0
+            out.write(line)
+            n_requests += 1
+            n_bytes += len(line)
+    finally:
+        if out is not None:
+            out.close()
+    return paths
+
+
+class _PromptSpool:
+    """
+    Prompts of a batch run written to a JSONL file; only each job's offset stays in memory.
+
+    Consecutive jobs sharing one prompt string object share one line.
+    """
+
+    def __init__(self, path: Path):
+        self.offsets: Dict[str, int] = {}
+        self._file = open(path, "w+b")
+        self._last: Tuple[Optional[int], Optional[str]] = (None, None)
+
+    def add(self, prompt_id: str, prompt_text: str) -> None:
+        offset, text = self._last
+        if text is not prompt_text:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write((json.dumps(prompt_text, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._last = (offset, prompt_text)
+        self.offsets[prompt_id] = offset
+
+    def get(self, prompt_id: str) -> str:
+        offset = self.offsets[prompt_id]
+        if self._last[0] != offset:
+            self._file.seek(offset)
+            self._last = (offset, json.loads(self._file.readline()))
+        return self._last[1]
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _batch_custom_ids(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)["custom_id"]
+
+
+def _append_batch_log(work_dir: Path, record: Dict) -> None:
+    with open(work_dir / "batch_log.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"time": time.time(), **record}) + "\n")
+
+
+async def _run_openai_batch_file(
+    path: Path, config: LLMConfig, clients: LLMClientRegistry, poll_interval: float
+) -> AsyncIterator[Tuple[str, Dict]]:
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set")
+    aclient = clients.openai_client(
+        config,
+        provider="openai",
+        api_key=api_key,
+        base_url=config.provider_params.get("base_url") or config.provider_params.get("api_base"),
+    )
+    with open(path, "rb") as f:
+        input_file = await aclient.files.create(file=(path.name, f.read()), purpose="batch")
+    batch = await aclient.batches.create(
+        input_file_id=input_file.id,
+        endpoint=OPENAI_BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+    _append_batch_log(path.parent, {"file": path.name, "batch_id": batch.id, "status": batch.status})
+    while batch.status not in OPENAI_TERMINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await aclient.batches.retrieve(batch.id)
+    _append_batch_log(path.parent, {"file": path.name, "batch_id": batch.id, "status": batch.status})
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await aclient.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                error = entry.get("error") or response.get("body", {}).get("error") or response
+                error_kind = classify_status_code(response.get("status_code") or 0) or RETRYABLE
+                yield entry["custom_id"], {"error": f"Batch request failed: {error}", "provider": "openai", "error_kind": error_kind}
+                continue
+            completion = openai.types.chat.ChatCompletion.model_validate(response["body"])
+            yield entry["custom_id"], chat_completion_response_data(completion)
+
+
+async def _run_anthropic_batch_file(
+    path: Path, config: LLMConfig, clients: LLMClientRegistry, poll_interval: float
+) -> AsyncIterator[Tuple[str, Dict]]:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+    aclient = clients.anthropic_client(config, api_key=api_key)
+    with open(path, "r", encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    batch = await aclient.messages.batches.create(requests=requests)
+    del requests
+    _append_batch_log(path.parent, {"file": path.name, "batch_id": batch.id, "status": batch.processing_status})
+    while batch.processing_status != "ended":
+        await asyncio.sleep(poll_interval)
+        batch = await aclient.messages.batches.retrieve(batch.id)
+    _append_batch_log(path.parent, {"file": path.name, "batch_id": batch.id, "status": batch.processing_status})
+
+    async for entry in await aclient.messages.batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            yield entry.custom_id, claude_response_data(entry.result.message)
+        else:
+            error = getattr(entry.result, "error", None) or entry.result.type
+            error_type = getattr(getattr(error, "error", None), "type", None)
+            error_kind = NON_RETRYABLE if error_type in ANTHROPIC_NON_RETRYABLE_ERRORS else RETRYABLE
+            yield entry.custom_id, {"error": f"Batch request {entry.result.type}: {error}", "provider": "claude", "error_kind": error_kind}
+
+
+async def run_batch_jobs(
+    jobs: Iterable[Tuple[str, str]],
+    config: LLMConfig,
+    provider: str,
+    *,
+    work_dir: Union[str, Path],
+    poll_interval: float = 30.0,
+    desc: Optional[str] = "Batch simulations",
+    on_result: Optional[Callable[[str, Dict, Dict], Any]] = None,
+    collect_results: bool = True,
+    metrics: Optional[RunMetrics] = None,
+) -> Dict[str, Dict]:
+    """
+    Run ``jobs`` through the provider batch API and verify each result.
+
+    Returns the same ``{prompt_id: response_data}`` mapping as
+    ``process_prompts_batch``: verified responses, or the last error per job.
+    ``on_result`` is called once per job when it is verified, fails with a
+    non-retryable error or, for jobs still failing after the last round, when
+    the run ends. With ``collect_results=False`` finished jobs are not kept
+    and an empty dict is returned. Records are also folded into ``metrics``;
+    only end-to-end latency, tokens and status are meaningful per job here,
+    since the provider runs the requests.
+    """
+    provider = provider.lower()
+    if provider not in BATCH_PROVIDERS:
+        raise ValueError(f"Batch execution mode supports {BATCH_PROVIDERS}, not {provider!r}")
+    run_batch_file = _run_openai_batch_file if provider == "openai" else _run_anthropic_batch_file
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    prompts = _PromptSpool(work_dir / "prompts.jsonl")
+    for prompt_id, prompt_text in jobs:
+        prompts.add(prompt_id, prompt_text)
+    pending: Dict[str, None] = dict.fromkeys(prompts.offsets)  # insertion-ordered set of unfinished jobs
+    results: Dict[str, Dict] = {}
+    cache = config.response_cache
+    verify_slots = asyncio.Semaphore(config.max_concurrent_requests)
+    pbar = tqdm(total=len(pending), desc=desc)
+    started = time.monotonic()
+    rounds_tried: Dict[str, int] = {}
+
+    def cache_key(prompt_id: str) -> str:
+        return cache.make_key(provider, build_request_payload(prompts.get(prompt_id), config, provider), prompt_id)
+
+    def finish(prompt_id: str) -> None:
+        info = {"attempts": rounds_tried.get(prompt_id), "latency_s": time.monotonic() - started}
+        record = job_record(prompt_id, results[prompt_id], info)
+        if metrics is not None:
+            metrics.observe(record)
+        if on_result is not None:
+            on_result(prompt_id, results[prompt_id], record)
+        if not collect_results:
+            del results[prompt_id]
+
+    def settle(prompt_id: str) -> None:
+        """Take a job out of later rounds with its current result."""
+        del pending[prompt_id]
+        finish(prompt_id)
+        pbar.update(1)
+
+    async def accept(prompt_id: str, response_data: Dict, round_idx: int, from_cache: bool = False) -> None:
+        if prompt_id not in pending:
+            return
+        if response_data.get("error"):
+            results[prompt_id] = response_data
+            if response_data.get("error_kind") == NON_RETRYABLE:
+                settle(prompt_id)
+            return
+        async with verify_slots:
+            verified = await verify_llm_response(prompt_id, response_data, prompts.get(prompt_id), config)
+        if not verified:
+            results[prompt_id] = {"error": f"Verification failed in batch round {round_idx + 1}", "prompt_id": prompt_id, "llm_response_data": response_data}
+            if from_cache:
+                cache.delete(cache_key(prompt_id))
+            return
+        if cache is not None and not from_cache:
+            cache.put(cache_key(prompt_id), response_data)
+        results[prompt_id] = response_data
+        settle(prompt_id)
+
+    try:
+        async with LLMClientRegistry(config.max_concurrent_requests) as clients:
+            for round_idx in range(config.max_retries):
+                if not pending:
+                    break
+                if cache is not None and cache.readable:
+                    for prompt_id in list(pending):
+                        cached = cache.get(cache_key(prompt_id))
+                        if cached is not None:
+                            await accept(prompt_id, {**cached, "cache_hit": True}, round_idx, from_cache=True)
+                    if not pending:
+                        break
+
+                paths = write_batch_request_files(
+                    ((prompt_id, prompts.get(prompt_id)) for prompt_id in list(pending)),
+                    config, provider, work_dir, prefix=f"round{round_idx:02d}",
+                )
+                print(f"Batch round {round_idx + 1}: submitting {len(pending)} requests in {len(paths)} file(s).")
+                for prompt_id in pending:
+                    rounds_tried[prompt_id] = round_idx + 1
+
+                async def consume(path: Path) -> None:
+                    try:
+                        async for prompt_id, response_data in run_batch_file(path, config, clients, poll_interval):
+                            await accept(prompt_id, response_data, round_idx)
+                    except Exception as e:
+                        _append_batch_log(work_dir, {"file": path.name, "error": str(e)})
+                        print(f"Batch file {path.name} failed: {e}")
+                        if classify_error(e) == NON_RETRYABLE:
+                            # e.g. a rejected input file or a missing API key: resubmitting cannot help
+                            for prompt_id in _batch_custom_ids(path):
+                                if prompt_id in pending:
+                                    results[prompt_id] = {"error": f"Batch file {path.name} failed: {e}", "prompt_id": prompt_id, "error_kind": NON_RETRYABLE}
+                                    settle(prompt_id)
+
+                await asyncio.gather(*(consume(path) for path in paths))
+                for prompt_id in pending:
+                    results.setdefault(prompt_id, {"error": f"No batch result returned in round {round_idx + 1}", "prompt_id": prompt_id})
+        for prompt_id in pending:
+            finish(prompt_id)
+    finally:
+        prompts.close()
+        pbar.close()
+    return results
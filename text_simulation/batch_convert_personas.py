@@ -1,44 +1,165 @@
+import hashlib
 import json
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from tqdm import tqdm
-from convert_persona_to_text import convert_persona_to_text
+import convert_persona_to_text as converter
+from convert_persona_to_text import extract_persona_id, persona_to_text
 
-def batch_convert_personas(persona_json_dir: str, output_text_dir: str, variant: str = "full") -> None:
+# Sidecar manifest in the output directory: for every converted persona, the key it was
+# converted with (input content hash, variant, converter version, summary hash).
+MANIFEST_FILENAME = ".batch_convert_manifest.json"
+SUMMARY_VARIANTS = ("summary", "summary+text", "combine")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def converter_version() -> str:
+    """Hash of the converter source: editing a formatting rule invalidates every converted persona."""
+    with open(converter.__file__, 'rb') as f:
+        return _sha256(f.read())[:16]
+
+
+def _summary_hash(input_path: str, variant: str) -> Optional[str]:
+    """Hash of the persona summary that the summary variants read (see read_persona_summary)."""
+    if variant not in SUMMARY_VARIANTS:
+        return None
+    summary_path = os.path.join("..", "data", "mega_persona_summary_text", f"pid_{extract_persona_id(input_path)}_mega_persona.txt")
+    try:
+        with open(summary_path, 'rb') as f:
+            return _sha256(f.read())
+    except OSError:
+        return None
+
+
+def load_manifest(output_text_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(output_text_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_text_dir: str, manifest: Dict[str, Dict]) -> None:
+    path = os.path.join(output_text_dir, MANIFEST_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _convert_one(task: Tuple[str, str, str, str, Optional[Dict]]) -> Tuple[str, str, Optional[Dict]]:
+    """
+    Convert one persona unless its manifest entry shows it is up to date.
+
+    Returns ``(json_file, status, manifest_entry)`` with status ``skipped`` (key unchanged),
+    ``unchanged`` (re-converted to identical text, file not rewritten), ``converted`` or ``failed``.
+    """
+    json_file, input_path, output_path, variant, previous = task
+    with open(input_path, 'rb') as f:
+        raw = f.read()
+    entry = {
+        "input_sha256": _sha256(raw),
+        "variant": variant,
+        "converter": converter_version(),
+        "summary_sha256": _summary_hash(input_path, variant),
+    }
+    if previous is not None and all(previous.get(k) == v for k, v in entry.items()) and os.path.exists(output_path):
+        return json_file, "skipped", previous
+
+    text = persona_to_text(input_path, variant, content=raw.decode('utf-8'))
+    if text is None:
+        return json_file, "failed", None
+    data = text.encode('utf-8')
+    entry["output_sha256"] = _sha256(data)
+    try:
+        with open(output_path, 'rb') as f:
+            if f.read() == data:
+                return json_file, "unchanged", entry
+    except OSError:
+        pass
+    try:
+        with open(output_path, 'wb') as f:  # bytes, so the text is written exactly as hashed
+            f.write(data)
+    except Exception as e:
+        print(f"Error writing output file: {e}")
+        return json_file, "failed", None
+    return json_file, "converted", entry
+
+
+def batch_convert_personas(persona_json_dir: str, output_text_dir: str, variant: str = "full",
+                           workers: Optional[int] = None, force: bool = False) -> Dict[str, int]:
     """
     Batch convert persona JSON files to text files.
-    
+
+    Conversion is incremental: a sidecar manifest in ``output_text_dir`` records the
+    content hash of each input, the variant and the converter version, and personas
+    whose key is unchanged are skipped. Re-converted personas whose text came out
+    identical are not rewritten.
+
     Args:
         persona_json_dir: Directory containing persona JSON files
         output_text_dir: Directory to save output text files
         variant: Type of conversion ("full", "demographic", "summary", "summary+text", "combine")
+        workers: Worker processes (default: all cores; 1 converts in this process)
+        force: Re-convert every persona regardless of the manifest
+
+    Returns:
+        Number of personas per status (converted, unchanged, skipped, failed)
     """
+    counts = {"converted": 0, "unchanged": 0, "skipped": 0, "failed": 0}
     if not os.path.exists(persona_json_dir):
         print(f"Persona JSON directory not found: {persona_json_dir}")
-        return
-    
+        return counts
+
     os.makedirs(output_text_dir, exist_ok=True)
-    json_files = [f for f in os.listdir(persona_json_dir) if f.endswith('.json') and f.startswith('pid_')]
-    
+    json_files = sorted(f for f in os.listdir(persona_json_dir) if f.endswith('.json') and f.startswith('pid_'))
+
     if not json_files:
         print(f"No persona JSON files found in {persona_json_dir}")
-        return
-    
-    print(f"Found {len(json_files)} persona JSON files to convert.")
-    successful = 0
-    failed = 0
-    
-    for json_file in tqdm(json_files, desc="Converting personas to text"):
-        input_path = os.path.join(persona_json_dir, json_file)
-        output_path = os.path.join(output_text_dir, json_file.replace('.json', '.txt'))
-        
-        if convert_persona_to_text(input_path, output_path, variant):
-            successful += 1
-        else:
-            failed += 1
-            print(f"Failed to convert {json_file}")
-    
-    print(f"\nConversion complete. Successful: {successful}, Failed: {failed}")
+        return counts
+
+    manifest = {} if force else load_manifest(output_text_dir)
+    tasks = [
+        (json_file, os.path.join(persona_json_dir, json_file),
+         os.path.join(output_text_dir, json_file.replace('.json', '.txt')), variant, manifest.get(json_file))
+        for json_file in json_files
+    ]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    print(f"Found {len(json_files)} persona JSON files to convert ({workers} worker{'s' if workers > 1 else ''}).")
+
+    try:
+        with tqdm(total=len(tasks), desc="Converting personas to text") as pbar:
+            if workers == 1:
+                results = map(_convert_one, tasks)
+                executor = None
+            else:
+                executor = ProcessPoolExecutor(max_workers=workers)
+                results = executor.map(_convert_one, tasks, chunksize=max(1, min(32, len(tasks) // (4 * workers))))
+            try:
+                for json_file, status, entry in results:
+                    counts[status] += 1
+                    if entry is None:
+                        manifest.pop(json_file, None)
+                        print(f"Failed to convert {json_file}")
+                    else:
+                        manifest[json_file] = entry
+                    pbar.update(1)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        save_manifest(output_text_dir, manifest)  # keep the finished personas when interrupted
+
+    print(f"\nConversion complete. Converted: {counts['converted']}, Unchanged: {counts['unchanged']}, "
+          f"Skipped (up to date): {counts['skipped']}, Failed: {counts['failed']}")
+    return counts
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch convert persona JSON files to text files.")
@@ -46,5 +167,7 @@ if __name__ == "__main__":
     parser.add_argument('--output_text_dir', required=True, help='Directory to save output text files')
     parser.add_argument('--variant', choices=["full", "demographic", "summary", "summary+text", "combine"],
                       default="full", help="Variant of persona to generate")
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Re-convert every persona, ignoring the manifest')
     args = parser.parse_args()
-    batch_convert_personas(args.persona_json_dir, args.output_text_dir, args.variant) 
\ No newline at end of file
+    batch_convert_personas(args.persona_json_dir, args.output_text_dir, args.variant, args.workers, args.force)
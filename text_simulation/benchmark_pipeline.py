@@ -0,0 +1,636 @@
+"""
+Offline benchmark of the non-LLM pipeline stages on a synthetic Twin-2K-500 fixture.
+
+Generates N personas shaped like the Twin-2K-500 release (mega persona JSON,
+wave-4 and wave 1-3 answer blocks, wave CSVs with the Qualtrics description
+and ImportId rows), simulates K LLM responses per persona with ``MockLLM``
+and times each stage of the pipeline on them:
+
+    personas      batch_convert_personas
+    questions     convert_question_json_to_text.process_json_file (every answer block)
+    prompts       create_combined_prompts
+    verification  save_and_verify_response (save + parse + validate + imputed answers)
+    json2csv      evaluation/json2csv.py --all
+    mad           compute_mad_summary
+    analysis      AnalysisRunner.run
+
+Every stage runs in a freshly spawned process, so its peak RSS is its own;
+the report gives wall time, CPU time (including worker processes), peak RSS
+and time per item. Stages whose optional dependencies are not installed
+(matplotlib, openpyxl, statsmodels, ...) are reported as skipped.
+
+    python text_simulation/benchmark_pipeline.py --personas 100 --sims 10 --output bench.json
+    python text_simulation/benchmark_pipeline.py --personas 100 --sims 10 --baseline bench.json
+    python text_simulation/benchmark_pipeline.py --scaling --work-dir /tmp/bench --output scaling.json
+
+``--scaling`` runs the 100/500/2058 personas x 1/10/50 simulations grid;
+the largest point writes about 100k simulation outputs, so give it a
+``--work-dir`` with a few GB free. With ``--baseline`` the run exits 1 when a
+stage got slower or bigger than the baseline by more than ``--tolerance``.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for _path in (PROJECT_ROOT, PROJECT_ROOT / "text_simulation"):  # the converters import their siblings by bare name
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+STAGES = ("personas", "questions", "prompts", "verification", "json2csv", "mad", "analysis")
+SCALING_PERSONAS = (100, 500, 2058)
+SCALING_SIMS = (1, 10, 50)
+FIXTURE_VERSION = 1
+
+# The wave-4 survey: (question type, QuestionID, answer scale, benchmark columns). Matrix rows and
+# multi-statement sliders give one benchmark column each; the names and scales are the columns
+# scored by evaluation/mad_accuracy_evaluation.py (QID9 is mapped by evaluation/column_mapping.csv).
+WAVE4_QUESTIONS: List[Tuple[str, str, Optional[Tuple[int, int]], List[str]]] = [
+    ("Matrix", "QID300", (1, 5), [f"False Cons. self _{i}" for i in range(1, 11)]),
+    ("Slider", "QID301", (0, 100), [f"False cons. others _{i}" for i in (1, 2, 3, 4, 5, 6, 7, 10, 11, 12)]),
+    ("Slider", "QID156", (0, 100), ["Q156_1"]),
+    ("Slider", "QID154", (0, 100), ["Form A _1"]),
+    ("MC", "QID157", (1, 6), ["Q157"]),
+    ("MC", "QID158", (1, 6), ["Q158"]),
+    ("Matrix", "QID159", (1, 6), [f"Q159_{i}" for i in (1, 2, 3)]),
+    ("Matrix", "QID160", (1, 6), [f"Q160_{i}" for i in (1, 2, 3)]),
+    ("MC", "QID161", (1, 7), ["Q161"]),
+    ("MC", "QID162", (1, 7), ["Q162"]),
+    *[("MC", f"QID{c}", (1, 10), [f"Q{c}"]) for c in (164, 166, 168, 170)],
+    *[("MC", f"QID{c}", (1, 5), [f"Q{c}"]) for c in range(171, 177)],
+    *[("MC", f"QID{c}", (1, 6), [f"Q{c}"]) for c in (177, 178, 179)],
+    ("Slider", "QID181", (0, 20), ["Q181"]),
+    ("Slider", "QID182", (0, 20), ["Q182"]),
+    *[("MC", f"QID{c}", (1, 2), [f"Q{c}"]) for c in (183, 184)],
+    *[("MC", f"QID{c}", (1, 10), [f"Q{c}"]) for c in (189, 190, 191)],
+    *[("MC", f"QID{c}", (1, 2), [f"Q{c}"]) for c in (192, 193)],
+    *[("MC", f"QID{c}", (1, 6), [f"Q{c}"]) for c in (194, 195)],
+    ("Matrix", "QID198", (1, 2), [f"Q198_{i}" for i in range(1, 11)]),
+    ("Matrix", "QID203", (1, 2), [f"Q203_{i}" for i in range(1, 7)]),
+    ("Matrix", "QID204", (1, 7), [f"nonseparabilty bene _{i}" for i in range(1, 5)]),
+    ("Matrix", "QID205", (1, 7), [f"nonseparability ris _{i}" for i in range(1, 5)]),
+    ("MC", "QID206", (1, 4), ["Omission bias "]),
+    ("MC", "QID207", (1, 2), ["Denominator neglect "]),
+    ("Matrix", "QID9", (1, 2), [f"{i}_Q295" for i in range(1, 41)]),
+    ("TE", "QID208", None, []),
+]
+
+_WORDS = (
+    "people often think about how much they would pay for a product when the price changes and what "
+    "others in their community might choose if the situation were described in a different way today"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize()
+
+
+def _question(rng: random.Random, question_type: str, qid: str, scale: Optional[Tuple[int, int]], rows: int, text_words: int = 24) -> Dict[str, Any]:
+    """One question of the answer-block schema, with a random answer."""
+    question = {"QuestionID": qid, "QuestionType": question_type, "QuestionText": f"<div>{_sentence(rng, text_words)}?</div>"}
+    if question_type == "MC":
+        options = [_sentence(rng, 4) for _ in range(scale[1])]
+        position = rng.randint(1, len(options))
+        question.update({"Options": options, "Settings": {"Selector": "SAVR"},
+                         "Answers": {"SelectedByPosition": position, "SelectedText": options[position - 1]}})
+    elif question_type == "Matrix":
+        columns = [_sentence(rng, 2) for _ in range(scale[1])]
+        positions = [rng.randint(1, len(columns)) for _ in range(rows)]
+        question.update({"Columns": columns, "Rows": [_sentence(rng, 8) for _ in range(rows)],
+                         "RowsID": [str(i + 1) for i in range(rows)], "Settings": {"Selector": "Likert"},
+                         "Answers": {"SelectedByPosition": positions, "SelectedText": [columns[p - 1] for p in positions]}})
+    elif question_type == "Slider":
+        low, high = scale
+        question.update({"NumericConstraints": {"MinValue": low, "MaxValue": high},
+                         "Answers": {"Values": [rng.randint(low, high) for _ in range(rows)]}})
+        if rows > 1:
+            question.update({"Statements": [_sentence(rng, 6) for _ in range(rows)], "StatementsID": [str(i + 1) for i in range(rows)]})
+        else:
+            question["Statements"] = [""]
+    else:
+        question.update({"Settings": {"Selector": "SL"}, "Answers": {"Text": _sentence(rng, 12)}})
+    return question
+
+
+def _answer_text(question: Dict[str, Any], position: int) -> Any:
+    """Label of a numeric answer, as in the wave *_labels_* CSVs."""
+    if question["QuestionType"] == "MC":
+        return question["Options"][position - 1]
+    if question["QuestionType"] == "Matrix":
+        return question["Columns"][position - 1]
+    return position
+
+
+def _redraw(rng: random.Random, question: Dict[str, Any], keep: float) -> Dict[str, Any]:
+    """A copy of ``question`` whose answers are re-drawn with probability ``1 - keep`` each (a later wave)."""
+    question = json.loads(json.dumps(question))
+    answers = question["Answers"]
+    if question["QuestionType"] == "MC" and rng.random() > keep:
+        position = rng.randint(1, len(question["Options"]))
+        answers.update({"SelectedByPosition": position, "SelectedText": question["Options"][position - 1]})
+    elif question["QuestionType"] == "Matrix":
+        for i in range(len(answers["SelectedByPosition"])):
+            if rng.random() > keep:
+                position = rng.randint(1, len(question["Columns"]))
+                answers["SelectedByPosition"][i] = position
+                answers["SelectedText"][i] = question["Columns"][position - 1]
+    elif question["QuestionType"] == "Slider":
+        low, high = question["NumericConstraints"]["MinValue"], question["NumericConstraints"]["MaxValue"]
+        answers["Values"] = [v if rng.random() <= keep else rng.randint(low, high) for v in answers["Values"]]
+    return question
+
+
+def _numeric_answers(question: Dict[str, Any]) -> List[Any]:
+    answers = question["Answers"]
+    if question["QuestionType"] == "MC":
+        return [answers["SelectedByPosition"]]
+    if question["QuestionType"] == "Matrix":
+        return answers["SelectedByPosition"]
+    if question["QuestionType"] == "Slider":
+        return answers["Values"]
+    return []
+
+
+class PipelineFixture:
+    """
+    Synthetic inputs for ``num_personas`` personas under ``root``, laid out like the project's ``data/``.
+
+    The survey text is shared by all personas (as in the real release, only the answers
+    differ); wave-4 answers repeat the wave 1-3 answers with probability 0.7.
+
+    Args:
+        root: Fixture directory; its ``data/`` is the stages' input.
+        num_personas: Number of personas.
+        persona_questions: Questions in each mega persona JSON (the persona profile length).
+        seed: Seed of every random draw.
+    """
+
+    def __init__(self, root: Path, num_personas: int, persona_questions: int = 500, seed: int = 0):
+        self.root = Path(root)
+        self.num_personas = num_personas
+        self.persona_questions = persona_questions
+        self.seed = seed
+        self.data_dir = self.root / "data"
+        self.persona_json_dir = self.data_dir / "mega_persona_json" / "mega_persona"
+        self.answer_blocks_dir = self.data_dir / "mega_persona_json" / "answer_blocks"
+        self.wave_csv_dir = self.data_dir / "wave_csv"
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {"version": FIXTURE_VERSION, "personas": self.num_personas,
+                "persona_questions": self.persona_questions, "seed": self.seed}
+
+    def pids(self) -> List[str]:
+        return [f"pid_{i + 1}" for i in range(self.num_personas)]
+
+    def exists(self) -> bool:
+        marker = self.root / "fixture.json"
+        if not marker.exists():
+            return False
+        with open(marker, "r", encoding="utf-8") as f:
+            return json.load(f) == self.spec
+
+    def survey(self) -> List[Dict[str, Any]]:
+        """The wave-4 survey blocks, answers not yet drawn per persona."""
+        rng = random.Random(f"{self.seed}:survey")
+        questions = [{"QuestionType": "DB", "QuestionText": f"<p>{_sentence(rng, 40)}.</p>"}]
+        for question_type, qid, scale, columns in WAVE4_QUESTIONS:
+            questions.append(_question(rng, question_type, qid, scale, max(len(columns), 1), text_words=60))
+        return [{"ElementType": "Block", "Questions": questions}]
+
+    def generate(self) -> None:
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        for directory in (self.persona_json_dir, self.answer_blocks_dir, self.wave_csv_dir):
+            directory.mkdir(parents=True)
+        survey = self.survey()
+        survey_questions = [q for q in survey[0]["Questions"] if q["QuestionType"] != "DB"]
+        columns = [column for _, _, _, names in WAVE4_QUESTIONS for column in names]
+        import_ids = []
+        for (_, qid, _, names), question in zip(WAVE4_QUESTIONS, survey_questions):
+            if len(names) == 1:
+                import_ids.append(qid)
+            elif names:
+                import_ids += [f"{qid}_{row_id}" for row_id in (question.get("RowsID") or question.get("StatementsID"))]
+        descriptions = [
+            f"{question['QuestionText'][:60]} - {row}"
+            for question, (_, _, _, names) in zip(survey_questions, WAVE4_QUESTIONS) for row in range(len(names))
+        ]
+        header_rows = [
+            ["TWIN_ID", "Finished", *columns, "randDollarsString"],
+            ["Twin ID", "Finished", *descriptions, "randDollarsString"],
+            ['{"ImportId":"twin_id"}', '{"ImportId":"finished"}', *(json.dumps({"ImportId": i}) for i in import_ids),
+             '{"ImportId":"randDollarsString"}'],
+        ]
+        numbers_rows, labels_rows = {"wave1_3": [], "wave4": []}, {"wave1_3": [], "wave4": []}
+
+        for pid in self.pids():
+            rng = random.Random(f"{self.seed}:{pid}")
+            persona_blocks, block = [], None
+            for i in range(self.persona_questions):
+                if i % 25 == 0:
+                    block = {"ElementType": "Block", "Questions": [{"QuestionType": "DB", "QuestionText": _sentence(rng, 30)}]}
+                    persona_blocks.append(block)
+                question_type = rng.choice(("MC", "MC", "Matrix", "Slider", "TE"))
+                block["Questions"].append(_question(rng, question_type, f"QID{1000 + i}", (0, 100) if question_type == "Slider" else (1, rng.randint(2, 7)), rng.randint(1, 5)))
+            with open(self.persona_json_dir / f"{pid}_mega_persona.json", "w", encoding="utf-8") as f:
+                json.dump(persona_blocks, f)
+
+            # The 40 products and prices of the pricing question (QID9), as in the randDollarsString column.
+            prices = ";".join(f"product{rng.randint(1, 200)}: ${rng.randint(1, 2000) / 100:.2f}" for _ in range(40))
+            waves = {"wave1_3": [_redraw(rng, q, keep=0.0) for q in survey_questions]}
+            waves["wave4"] = [_redraw(rng, q, keep=0.7) for q in waves["wave1_3"]]
+            for wave, questions in waves.items():
+                blocks = [{**survey[0], "Questions": [survey[0]["Questions"][0], *questions]}]
+                with open(self.answer_blocks_dir / f"{pid}_wave4_Q_{wave}_A.json", "w", encoding="utf-8") as f:
+                    json.dump(blocks, f)
+                twin_id = pid.split("_", 1)[1]
+                numbers = [v for q in questions for v in _numeric_answers(q)]
+                labels = [_answer_text(q, v) for q in questions for v in _numeric_answers(q)]
+                numbers_rows[wave].append([twin_id, "TRUE", *numbers, prices])
+                labels_rows[wave].append([twin_id, "TRUE", *labels, prices])
+
+        csv_files = {
+            "wave_4_numbers_anonymized.csv": numbers_rows["wave4"],
+            **{f"wave_{w}_labels_anonymized.csv": labels_rows["wave1_3"] for w in (1, 2, 3)},
+            "wave_4_labels_anonymized.csv": labels_rows["wave4"],
+        }
+        for filename, rows in csv_files.items():
+            with open(self.wave_csv_dir / filename, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(header_rows + rows)
+        with open(self.root / "fixture.json", "w", encoding="utf-8") as f:
+            json.dump(self.spec, f)
+
+
+def _run_paths(fixture_root: Path, run_dir: Path) -> Dict[str, Path]:
+    return {
+        "fixture": fixture_root,
+        "persona_json": fixture_root / "data" / "mega_persona_json" / "mega_persona",
+        "answer_blocks": fixture_root / "data" / "mega_persona_json" / "answer_blocks",
+        "wave_csv": fixture_root / "data" / "wave_csv",
+        "text_personas": run_dir / "text_personas",
+        "text_questions": run_dir / "text_questions",
+        "prompts": run_dir / "text_simulation_input",
+        "trial": run_dir / "text_simulation_output",
+    }
+
+
+class _StageClock:
+    """Wall and CPU seconds (including worker processes) of the measured parts of a stage."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.cpu_s: Optional[float] = 0.0 if resource is not None else None
+
+    @contextlib.contextmanager
+    def measure(self):
+        cpu_before = _cpu_seconds()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - started
+            if cpu_before is not None:
+                self.cpu_s += _cpu_seconds() - cpu_before
+
+
+def _stage_personas(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from batch_convert_personas import batch_convert_personas
+
+    with clock.measure():
+        counts = batch_convert_personas(str(paths["persona_json"]), str(paths["text_personas"]), "full")
+    return len(list(paths["text_personas"].glob("*.txt"))), counts
+
+
+def _stage_questions(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from convert_question_json_to_text import process_json_file
+
+    paths["text_questions"].mkdir(parents=True, exist_ok=True)
+    input_files = sorted(paths["answer_blocks"].glob("*_wave4_Q_wave4_A.json"))
+    with clock.measure():
+        for input_file in input_files:
+            process_json_file(str(input_file), str(paths["text_questions"]))
+    return len(input_files), {}
+
+
+def _stage_prompts(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from text_simulation.create_text_simulation_input import create_combined_prompts
+
+    with clock.measure():
+        create_combined_prompts(str(paths["text_personas"]), str(paths["text_questions"]), str(paths["prompts"]))
+    prompt_files = list(paths["prompts"].glob("*_prompt.txt"))
+    return len(prompt_files), {"prompt_mb": round(sum(p.stat().st_size for p in prompt_files) / 2 ** 20, 1)}
+
+
+def _stage_verification(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from text_simulation.mock_llm import MockLLM
+    from text_simulation.run_LLM_simulations import save_and_verify_response
+
+    prompt_files = sorted(paths["prompts"].glob("*_prompt.txt"))
+    if not prompt_files:
+        raise FileNotFoundError(f"No prompts in {paths['prompts']}; run the prompts stage first")
+    with open(paths["answer_blocks"] / "pid_1_wave4_Q_wave4_A.json", "r", encoding="utf-8") as f:
+        mock = MockLLM(answer_block=json.load(f), seed=options["seed"])
+    verified, total = 0, 0
+    for prompt_file in prompt_files:
+        pid = prompt_file.name[: -len("_prompt.txt")]
+        prompt = prompt_file.read_text(encoding="utf-8")
+        responses = []
+        for sim in range(options["sims"]):
+            prompt_id = f"{pid}_sim{sim + 1:03d}"
+            text = mock.survey_response(prompt, random.Random(f"{options['seed']}:{prompt_id}"))
+            responses.append((prompt_id, {"response_text": text, "usage_details": mock.usage(prompt, [text]), "provider": "mock"}))
+        with clock.measure():  # the verifier only, not the mock answers
+            for prompt_id, response in responses:
+                result = save_and_verify_response(
+                    prompt_id, response, prompt,
+                    output_root=str(paths["trial"]),
+                    question_json_base_dir=str(paths["answer_blocks"]),
+                    imputed_output_format=options["imputed_output_format"],
+                )
+                verified += result is True
+                total += 1
+    return total, {"failed": total - verified}
+
+
+def _stage_json2csv(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    import logging
+
+    import yaml
+    from evaluation import json2csv
+
+    logging.getLogger().setLevel(logging.WARNING)
+    trial = paths["trial"]
+    imputed = trial / "answer_blocks_llm_imputed"
+    if options["imputed_output_format"] == "jsonl":
+        llm_wave = {"input_pattern": str(imputed / "pid_{pid}.jsonl"),
+                    "template_pattern": str(paths["answer_blocks"] / "pid_{pid}_wave4_Q_wave4_A.json")}
+    else:
+        llm_wave = {"input_pattern": str(imputed / "pid_{pid}" / "**" / "pid_{pid}_*wave4_Q_wave4_A.json")}
+    waves = {
+        "wave1_3": {"input_pattern": str(paths["answer_blocks"] / "pid_{pid}_wave4_Q_wave1_3_A.json")},
+        "wave4": {"input_pattern": str(paths["answer_blocks"] / "pid_{pid}_wave4_Q_wave4_A.json")},
+        "llm_imputed": llm_wave,
+    }
+    for wave, wave_config in waves.items():
+        wave_config.update({
+            "output_csv": f"${{trial_dir}}/csv_comparison/responses_{wave}.csv",
+            "output_csv_formatted": f"${{trial_dir}}/csv_comparison/csv_formatted/responses_{wave}_formatted.csv",
+            "output_csv_labeled": f"${{trial_dir}}/csv_comparison/csv_formatted_label/responses_{wave}_label_formatted.csv",
+        })
+    config = {
+        "trial_dir": str(trial),
+        "max_personas": None,
+        "waves": waves,
+        "benchmark_csv": str(paths["wave_csv"] / "wave_4_numbers_anonymized.csv"),
+        "column_mapping": str(PROJECT_ROOT / "evaluation" / "column_mapping.csv"),
+        "save_question_mapping": True,
+        "question_mapping_output": "${trial_dir}/csv_comparison/question_mapping.csv",
+        "generate_randdollar_breakdown": True,
+        "randdollar_output": "${trial_dir}/csv_comparison/randdollar_breakdown.csv",
+    }
+    if options.get("json2csv_workers"):
+        config["parallel_workers"] = options["json2csv_workers"]
+    config_path = trial / "benchmark_eval_config.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+
+    sys.argv = ["json2csv.py", "--config", str(config_path), "--all"]
+    with clock.measure():
+        exit_code = json2csv.main()
+    if exit_code:
+        raise RuntimeError(f"json2csv exited with {exit_code}")
+    return options["personas"] * options["sims"], {}
+
+
+def _stage_mad(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from evaluation.mad_accuracy_evaluation import compute_mad_summary
+
+    output_dir = paths["trial"] / "accuracy_evaluation"
+    excel_path = output_dir / "mad_accuracy_summary.xlsx"
+    with clock.measure():
+        compute_mad_summary(
+            str(paths["trial"] / "csv_comparison" / "csv_formatted"), str(excel_path),
+            str(output_dir / "mad_accuracy.png"), "Synthetic benchmark",
+        )
+    if not excel_path.exists():
+        raise RuntimeError("compute_mad_summary wrote no summary")
+    return options["personas"] * options["sims"], {}
+
+
+def _stage_analysis(paths: Dict[str, Path], options: Dict[str, Any], clock: _StageClock) -> Tuple[int, Dict[str, Any]]:
+    from evaluation.within_between_subjects import AnalysisRunner
+
+    os.chdir(paths["fixture"])  # the human wave label CSVs are read from ./data/wave_csv
+    runner = AnalysisRunner(str(paths["trial"]))
+    with clock.measure():
+        runner.run()
+    if not os.path.exists(runner.output_filename):
+        raise RuntimeError("AnalysisRunner wrote no workbook")
+    return options["personas"], {}
+
+
+_STAGE_FUNCTIONS = {
+    "personas": _stage_personas,
+    "questions": _stage_questions,
+    "prompts": _stage_prompts,
+    "verification": _stage_verification,
+    "json2csv": _stage_json2csv,
+    "mad": _stage_mad,
+    "analysis": _stage_analysis,
+}
+
+
+def _peak_rss_mb(who: int) -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)  # bytes on macOS, KiB on Linux
+
+
+def _cpu_seconds() -> Optional[float]:
+    if resource is None:
+        return None
+    return sum(u.ru_utime + u.ru_stime for u in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def _run_stage(stage: str, fixture_root: str, run_dir: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs in a spawned process: one stage, with its timings and peak RSS."""
+    os.environ["TQDM_DISABLE"] = "1"
+    paths = _run_paths(Path(fixture_root), Path(run_dir))
+    clock = _StageClock()
+    rss_before = _peak_rss_mb(resource.RUSAGE_SELF) if resource else None
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # per-file progress prints
+            items, detail = _STAGE_FUNCTIONS[stage](paths, options, clock)
+    except ImportError as e:
+        return {"status": "skipped", "error": f"missing dependency: {e.name or e}"}
+    except Exception as e:
+        return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    return {
+        "status": "ok",
+        "seconds": round(clock.seconds, 3),
+        "items": items,
+        "ms_per_item": round(1000 * clock.seconds / items, 3) if items else None,
+        "cpu_s": round(clock.cpu_s, 3) if clock.cpu_s is not None else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "workers_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        **detail,
+    }
+
+
+def _directory_mb(path: Path) -> float:
+    return round(sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2 ** 20, 1)
+
+
+def benchmark(fixture: PipelineFixture, sims: int, stages: Sequence[str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs ``stages`` (in pipeline order) on ``fixture`` with ``sims`` simulations per persona."""
+    run_dir = fixture.root / f"sims_{sims}"
+    if run_dir.exists():
+        shutil.rmtree(run_dir)  # every run starts cold
+    run_dir.mkdir(parents=True)
+    options = {**options, "personas": fixture.num_personas, "sims": sims, "seed": fixture.seed}
+    result = {"personas": fixture.num_personas, "sims": sims, "stages": {}}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result["stages"][stage] = executor.submit(_run_stage, stage, str(fixture.root), str(run_dir), options).result()
+        print(f"  {stage:<13} {_format_stage(result['stages'][stage])}", flush=True)
+    result["total_s"] = round(sum(s.get("seconds", 0.0) for s in result["stages"].values()), 3)
+    result["output_mb"] = _directory_mb(run_dir)
+    if not options.get("keep_outputs"):
+        shutil.rmtree(run_dir)
+    return result
+
+
+def _format_stage(stage: Dict[str, Any]) -> str:
+    if stage["status"] != "ok":
+        return f"{stage['status']}: {stage['error']}"
+    rss = f"{stage['peak_rss_mb']:.0f} MB" if stage.get("peak_rss_mb") is not None else "n/a"
+    if stage.get("workers_peak_rss_mb"):
+        rss += f" (workers {stage['workers_peak_rss_mb']:.0f} MB)"
+    per_item = f"{stage['ms_per_item']:.2f}ms/item" if stage.get("ms_per_item") is not None else ""
+    cpu = f"cpu {stage['cpu_s']:.1f}s" if stage.get("cpu_s") is not None else ""
+    return f"{stage['seconds']:>8.2f}s  {per_item:>15}  {cpu:>11}  peak RSS {rss}"
+
+
+def format_scaling(results: List[Dict[str, Any]]) -> str:
+    """Seconds per stage for every grid point, to see which stage grows fastest."""
+    stages = [s for s in STAGES if any(s in r["stages"] for r in results)]
+    lines = [f"{'personas':>8} {'sims':>5} " + " ".join(f"{s:>12}" for s in stages) + f" {'total':>9}"]
+    for r in results:
+        cells = []
+        for stage in stages:
+            stage_result = r["stages"].get(stage)
+            cells.append(f"{stage_result['seconds']:>11.2f}s" if stage_result and stage_result["status"] == "ok" else f"{'-':>12}")
+        lines.append(f"{r['personas']:>8} {r['sims']:>5} " + " ".join(cells) + f" {r['total_s']:>8.2f}s")
+    return "\n".join(lines)
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float, min_seconds: float = 0.5) -> List[str]:
+    """
+    Stages that got more than ``tolerance`` slower, or bigger in peak RSS, than in the baseline.
+
+    Time differences under ``min_seconds`` are ignored as noise.
+    """
+    previous = {(r["personas"], r["sims"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        before_run = previous.get((r["personas"], r["sims"]))
+        if before_run is None:
+            continue
+        for stage, now in r["stages"].items():
+            before = before_run["stages"].get(stage)
+            if not before or now["status"] != "ok" or before["status"] != "ok":
+                continue
+            label = f"{stage} ({r['personas']} personas x {r['sims']} sims)"
+            if now["seconds"] > (1 + tolerance) * before["seconds"] and now["seconds"] - before["seconds"] >= min_seconds:
+                regressions.append(f"{label}: {now['seconds']:.2f}s vs baseline {before['seconds']:.2f}s")
+            if now.get("peak_rss_mb") and before.get("peak_rss_mb") and now["peak_rss_mb"] > (1 + tolerance) * before["peak_rss_mb"]:
+                regressions.append(f"{label}: peak RSS {now['peak_rss_mb']:.0f} MB vs baseline {before['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def machine_info() -> Dict[str, Any]:
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the non-LLM pipeline stages on a synthetic Twin-2K-500 fixture.")
+    parser.add_argument("--personas", type=int, nargs="+", default=[100], help="Persona counts to benchmark.")
+    parser.add_argument("--sims", type=int, nargs="+", default=[1], help="Simulations per persona to benchmark.")
+    parser.add_argument("--scaling", action="store_true",
+                        help=f"Run the {'/'.join(map(str, SCALING_PERSONAS))} personas x {'/'.join(map(str, SCALING_SIMS))} sims grid.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to run; each reads the outputs of the stages before it.")
+    parser.add_argument("--persona-questions", type=int, default=500, help="Questions per synthetic mega persona.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--imputed-output-format", choices=["blocks", "jsonl"], default="blocks")
+    parser.add_argument("--json2csv-workers", type=int, default=None, help="json2csv worker processes (default: its own).")
+    parser.add_argument("--work-dir", default=None,
+                        help="Keep fixtures here and reuse them across runs (default: a temporary directory).")
+    parser.add_argument("--keep-outputs", action="store_true", help="Keep the stage outputs under the work dir.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON (e.g. to use as a baseline).")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run; exit 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / RSS growth against the baseline.")
+    args = parser.parse_args()
+    if args.scaling:
+        args.personas, args.sims = list(SCALING_PERSONAS), list(SCALING_SIMS)
+
+    options = {
+        "imputed_output_format": args.imputed_output_format,
+        "json2csv_workers": args.json2csv_workers,
+        "keep_outputs": args.keep_outputs,
+    }
+    results = []
+    with contextlib.ExitStack() as stack:
+        work_dir = Path(args.work_dir) if args.work_dir else Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="pipeline_benchmark_")))
+        for num_personas in args.personas:
+            fixture = PipelineFixture(work_dir / f"personas_{num_personas}", num_personas, args.persona_questions, args.seed)
+            if not fixture.exists():
+                started = time.perf_counter()
+                fixture.generate()
+                print(f"Generated {num_personas} synthetic personas in {time.perf_counter() - started:.1f}s "
+                      f"({_directory_mb(fixture.data_dir)} MB) → {fixture.root}")
+            for sims in args.sims:
+                print(f"{num_personas} personas x {sims} sims:")
+                results.append(benchmark(fixture, sims, args.stages, options))
+
+    if len(results) > 1:
+        print(format_scaling(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine_info():
+            print(f"Note: the baseline was recorded on {baseline.get('machine')}")
+        regressions = compare_to_baseline(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 import re
 import argparse
 from pathlib import Path
+from typing import Optional
 
 def strip_html(text: any) -> str:
     """Strip HTML tags from text and normalize whitespace. Handles non-string inputs.
@@ -207,42 +208,40 @@ def extract_persona_id(input_path: str) -> str:
         return match.group(1)
     return ""
 
-def convert_persona_to_text(input_path: str, output_path: str, variant: str = "full") -> bool:
+def persona_to_text(input_path: str, variant: str = "full", content: Optional[str] = None) -> Optional[str]:
     """
-    Convert a persona JSON file to a text file.
+    Text of a persona JSON file, or None if it cannot be read or parsed.
     
     Args:
-        input_path: Path to the input JSON file
-        output_path: Path to save the output text file
+        input_path: Path to the input JSON file (also used to find the persona summary)
         variant: Type of conversion ("full", "demographic", "summary", "summary+text", "combine")
-    
-    Returns:
-        bool: True if conversion was successful, False otherwise
+        content: The file's content if already read
     """
     try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            # First read the content as a string
-            content = f.read()
-            # Parse the JSON string (which may be wrapped in quotes)
-            if content.startswith('"') and content.endswith('"'):
-                content = content[1:-1]  # Remove surrounding quotes
-                content = content.replace('\\"', '"')  # Unescape quotes
-            # Now parse the actual JSON content
-            data_elements = json.loads(content)
-            if not isinstance(data_elements, list):
-                # If it's a dict like the wave response, try to get 'Elements' key
-                if isinstance(data_elements, dict) and "Elements" in data_elements:
-                    data_elements = data_elements.get("Elements", [])
-                else:
-                    print("Error: Input JSON is not in the expected format (list of elements or dict with 'Elements' key).")
-                    return False
+        if content is None:
+            with open(input_path, 'r', encoding='utf-8') as f:
+                # First read the content as a string
+                content = f.read()
+        # Parse the JSON string (which may be wrapped in quotes)
+        if content.startswith('"') and content.endswith('"'):
+            content = content[1:-1]  # Remove surrounding quotes
+            content = content.replace('\\"', '"')  # Unescape quotes
+        # Now parse the actual JSON content
+        data_elements = json.loads(content)
+        if not isinstance(data_elements, list):
+            # If it's a dict like the wave response, try to get 'Elements' key
+            if isinstance(data_elements, dict) and "Elements" in data_elements:
+                data_elements = data_elements.get("Elements", [])
+            else:
+                print("Error: Input JSON is not in the expected format (list of elements or dict with 'Elements' key).")
+                return None
 
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_path}")
-        return False
+        return None
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from {input_path}: {e}")
-        return False
+        return None
     
     all_text_output_lines = []
     
@@ -270,9 +269,27 @@ def convert_persona_to_text(input_path: str, output_path: str, variant: str = "f
     else:  # full
         _recursively_extract_text_from_elements(data_elements, all_text_output_lines)
     
+    return ''.join(all_text_output_lines)
+
+def convert_persona_to_text(input_path: str, output_path: str, variant: str = "full") -> bool:
+    """
+    Convert a persona JSON file to a text file.
+    
+    Args:
+        input_path: Path to the input JSON file
+        output_path: Path to save the output text file
+        variant: Type of conversion ("full", "demographic", "summary", "summary+text", "combine")
+    
+    Returns:
+        bool: True if conversion was successful, False otherwise
+    """
+    text = persona_to_text(input_path, variant)
+    if text is None:
+        return False
+    
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(''.join(all_text_output_lines))
+            f.write(text)
         return True
     except Exception as e:
         print(f"Error writing output file: {e}")
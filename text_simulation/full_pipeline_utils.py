@@ -2,6 +2,8 @@ import shutil
 from pathlib import Path
 import pandas as pd
 
+from text_simulation.run_manifest import RunManifest, manifest_path, open_run_manifest
+
 def clean_simulation_dirs(project_root, output_root=None, confirm=True, dry_run=False):
     """
     Clean up intermediate and output directories before a new large-scale simulation run.
@@ -107,6 +109,7 @@ def detect_error_simulations(output_root: str):
     """
     Scan through each persona folder under text_simulation_output
     and detect simulation runs containing files with 'error' in their names.
+    When the run has a manifest (run_manifest.sqlite), it is queried instead.
 
     Parameters
     ----------
@@ -125,6 +128,21 @@ def detect_error_simulations(output_root: str):
     if not output_root.exists():
         raise FileNotFoundError(f"❌ Output folder not found: {output_root}")
 
+    if manifest_path(output_root).exists():
+        with RunManifest(manifest_path(output_root)) as manifest:
+            df_errors = pd.DataFrame(
+                [{"persona_id": row["persona_id"], "sim_folder": row["prompt_id"], "error_files": row["error"] or row["status"]}
+                 for row in manifest.problems()],
+                columns=["persona_id", "sim_folder", "error_files"],
+            )
+        print(f"🔍 Queried run manifest: {manifest_path(output_root)}\n")
+        if not df_errors.empty:
+            print(f"⚠️ Found {len(df_errors)} simulations containing errors.\n")
+            print(df_errors.head())
+        else:
+            print("✅ No error simulations recorded in the run manifest.")
+        return df_errors
+
     print(f"🔍 Scanning simulation outputs in: {output_root}\n")
 
     # iterate through persona directories
@@ -155,11 +173,23 @@ def detect_error_simulations(output_root: str):
     return df_errors
 
 
+def persona_simulation_counts(output_root):
+    """
+    Completed simulations per persona, ``{pid: count}``.
+
+    Uses the run manifest (rebuilt from disk once if the run predates it), so
+    the count is a single query rather than a walk over every sim directory.
+    """
+    with open_run_manifest(output_root) as manifest:
+        return manifest.persona_counts()
+
+
 def clean_error_simulations_no_confirm(output_root: str):
     """
     Detect and delete simulation folders containing 'error' files.
     Additionally, detect missing simulation numbers (e.g., if 1,2,5 exist → detect 3,4 missing).
-    Does NOT rename folders.
+    Does NOT rename folders. When the run has a manifest (run_manifest.sqlite),
+    the errored/failed simulations come from it and are removed from it too.
 
     Parameters
     ----------
@@ -181,6 +211,33 @@ def clean_error_simulations_no_confirm(output_root: str):
     if not output_root.exists():
         raise FileNotFoundError(f"❌ Output folder not found: {output_root}")
 
+    if manifest_path(output_root).exists():
+        with RunManifest(manifest_path(output_root)) as manifest:
+            for row in manifest.problems():
+                sim_dir = output_root / row["persona_id"] / row["prompt_id"]
+                record = {
+                    "persona_id": row["persona_id"],
+                    "sim_folder": row["prompt_id"],
+                    "deleted_path": str(sim_dir),
+                    "error_files": row["error"] or row["status"]
+                }
+                try:
+                    if sim_dir.exists():
+                        shutil.rmtree(sim_dir)
+                    manifest.delete([row["prompt_id"]])
+                    deleted_records.append(record)
+                    print(f"🗑️ Deleted {sim_dir.name} ({record['error_files']})")
+                except Exception as e:
+                    print(f"❌ Failed to delete {sim_dir}: {e}")
+        df_deleted = pd.DataFrame(deleted_records)
+        if not df_deleted.empty:
+            print(f"\n✅ Deleted {len(df_deleted)} simulation folders recorded as errors in the run manifest.")
+        else:
+            print("✅ No error simulations recorded in the run manifest.")
+        return {
+            "deleted_df": df_deleted
+        }
+
     print(f"🔍 Scanning for error-containing or missing simulations in: {output_root}\n")
 
     for pid_dir in sorted(output_root.glob("pid_*")):
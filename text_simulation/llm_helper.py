@@ -1,12 +1,41 @@
 import os
-from typing import Dict, Optional, Union, Callable, List, Tuple, Any
+import re
+import json
+import hashlib
+import math
+import time
+import datetime
+import functools
+import inspect
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Dict, Optional, Union, Callable, Iterable, Iterator, List, Tuple, Any
 import openai
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import httpx
 import asyncio
+import itertools
+from collections import deque
 from tqdm.asyncio import tqdm_asyncio
 
+from text_simulation.create_text_simulation_input import COMBINED_PROMPT_SEPARATOR
+from text_simulation.retry_policy import NON_RETRYABLE, VERIFICATION_FAILED, RetryPolicy, classify_error
+from text_simulation.run_metrics import (
+    RunMetrics,
+    add_job_metric,
+    bind_job_metrics,
+    count_job_event,
+    job_metrics,
+    set_job_metric,
+    token_counts,
+    unbind_job_metrics,
+)
+
+if TYPE_CHECKING:
+    from text_simulation.mock_llm import MockLLM
+    from text_simulation.postprocess_responses import PartialReask
+    from text_simulation.response_cache import ResponseCache
+
 load_dotenv()
 
 # System instruction for Gemini
@@ -21,6 +50,32 @@ class VerificationFailedError(Exception):
         self.prompt_id = prompt_id
         self.llm_response_data = llm_response_data
 
+class VerificationOutcome:
+    """
+    Detailed result a verification callback may return instead of a bool.
+
+    Truthy when verified. ``failed_keys`` names the missing or invalid answer
+    keys ("Qn") out of ``total_keys``, so a failed response can be completed
+    by re-asking only those questions (see ``LLMConfig.partial_reask``).
+    """
+
+    __slots__ = ("verified", "failed_keys", "total_keys")
+
+    def __init__(self, verified: bool, failed_keys: Optional[List[str]] = None, total_keys: int = 0):
+        self.verified = verified
+        self.failed_keys = failed_keys
+        self.total_keys = total_keys
+
+    def __bool__(self) -> bool:
+        return self.verified
+
+    def __getstate__(self):
+        return self.verified, self.failed_keys, self.total_keys
+
+    def __setstate__(self, state):
+        self.verified, self.failed_keys, self.total_keys = state
+
+
 class LLMConfig:
     def __init__(
         self,
@@ -32,7 +87,12 @@ class LLMConfig:
         max_concurrent_requests: int = 5,
         provider_params: Optional[Dict[str, Any]] = None,
         verification_callback: Optional[Callable[..., bool]] = None,
-        verification_callback_args: Optional[Dict] = None
+        verification_callback_args: Optional[Dict] = None,
+        response_cache: Optional["ResponseCache"] = None,
+        verification_executor: Optional[Executor] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        partial_reask: Optional["PartialReask"] = None,
+        hedge_policy: Optional["HedgePolicy"] = None
     ):
         self.model_name = model_name
         self.temperature = temperature
@@ -43,17 +103,44 @@ class LLMConfig:
         self.provider_params = provider_params if provider_params is not None else {}
         self.verification_callback = verification_callback
         self.verification_callback_args = verification_callback_args if verification_callback_args is not None else {}
+        self.response_cache = response_cache # Verified responses keyed by request hash + prompt_id
+        self.verification_executor = verification_executor # None: asyncio's default thread pool
+        self.retry_policy = retry_policy or RetryPolicy() # One policy (and retry budget) per run
+        self.partial_reask = partial_reask # Re-ask only failed questions; needs a VerificationOutcome from the callback
+        self.hedge_policy = hedge_policy # Duplicate straggling requests; None disables hedging
 
 
 def _without_none_values(data: Dict[str, Any]) -> Dict[str, Any]:
     return {k: v for k, v in data.items() if v is not None}
 
 
+def _prefix_caching(config: LLMConfig) -> bool:
+    return bool(config.provider_params.get("prefix_caching", False))
+
+
+def split_cacheable_prefix(prompt: str) -> Tuple[str, str]:
+    """
+    Split a combined prompt into (persona prefix, question suffix).
+
+    The prefix (header + persona profile) is identical for every simulation of
+    a persona, so it is the part providers can cache. Prompts without the
+    combined-prompt separator have no cacheable prefix.
+    """
+    head, sep, tail = prompt.partition(COMBINED_PROMPT_SEPARATOR)
+    if not sep:
+        return "", prompt
+    return head, sep + tail
+
+
 def _build_chat_messages(prompt: str, config: LLMConfig) -> List[Dict[str, str]]:
-    return [
-        {"role": "system", "content": config.system_instruction},
-        {"role": "user", "content": prompt},
-    ]
+    messages = [{"role": "system", "content": config.system_instruction}]
+    prefix, suffix = split_cacheable_prefix(prompt) if _prefix_caching(config) else ("", prompt)
+    if prefix:
+        # Stable persona block as its own message so OpenAI/DeepSeek automatic
+        # prefix caching sees an identical leading segment for every simulation.
+        messages.append({"role": "user", "content": prefix})
+    messages.append({"role": "user", "content": suffix})
+    return messages
 
 
 def _pop_internal_params(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -67,12 +154,673 @@ def _pop_internal_params(params: Dict[str, Any]) -> Dict[str, Any]:
         "max_tokens_param",
         "supports_temperature",
         "gemini_generation_config",
+        "http2",
+        "keepalive_expiry",
+        "max_connections",
+        "max_keepalive_connections",
+        "requests_per_minute",
+        "tokens_per_minute",
+        "chars_per_token",
+        "samples_per_request",
+        "prefix_caching",
+        "gemini_cache_ttl",
+        "adaptive_concurrency",
+        "min_concurrency",
+        "max_concurrency",
+        "concurrency_backoff",
+        "latency_spike_factor",
+        "mock_latency",
+        "mock_rate_429",
+        "mock_rate_500",
+        "mock_invalid_rate",
+        "mock_answer_block",
+        "mock_seed",
     ):
         if key in params:
             internal[key] = params.pop(key)
     return internal
 
 
+def _request_timeout(config: LLMConfig) -> float:
+    return config.provider_params.get("request_timeout", 1000.0)
+
+
+def estimate_prompt_tokens(prompt: str, config: LLMConfig) -> int:
+    """Cheap pre-dispatch estimate of input tokens (characters / chars_per_token)."""
+    chars_per_token = float(config.provider_params.get("chars_per_token", 4.0))
+    return int(math.ceil((len(config.system_instruction or "") + len(prompt)) / chars_per_token))
+
+
+def _parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate-limit reset values such as '1s', '6m0s', '250ms', '2.5' or an RFC 3339 timestamp."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(num + unit for num, unit in parts) == value:
+        scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+        return sum(float(num) * scale[unit] for num, unit in parts)
+    try:
+        reset_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            reset_at = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return max(reset_at.timestamp() - time.time(), 0.0)
+
+
+def _retry_after_seconds(headers) -> Optional[float]:
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    return _parse_reset_duration(headers.get("retry-after"))
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most ``capacity`` units per minute."""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.available = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)  # a single oversized request must still be admissible
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def sync_remaining(self, remaining: float) -> None:
+        """Trust the provider when it reports less headroom than we think we have."""
+        self._refill()
+        self.available = min(self.available, float(remaining))
+
+
+class RateLimiter:
+    """
+    Admission controller with requests-per-minute and tokens-per-minute buckets.
+
+    Configured through ``provider_params`` (``requests_per_minute``,
+    ``tokens_per_minute``, ``chars_per_token``). Token usage is reserved from an
+    estimate before dispatch and reconciled against ``usage_details`` afterwards.
+    ``Retry-After`` and ``x-ratelimit-*`` / ``anthropic-ratelimit-*`` headers pause
+    admissions or shrink the local buckets so the batch runs at the quota ceiling
+    instead of oscillating between bursts of 429s and long backoffs.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, config: LLMConfig) -> "RateLimiter":
+        params = config.provider_params
+        return cls(params.get("requests_per_minute"), params.get("tokens_per_minute"))
+
+    async def acquire(self, estimated_tokens: int) -> int:
+        """Wait until one request of ``estimated_tokens`` fits in both buckets; returns the reservation."""
+        async with self._lock:  # FIFO admission: waiters queue behind the lock
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if self.requests:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens:
+                    wait = max(wait, self.tokens.wait_time(estimated_tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(estimated_tokens)
+        return estimated_tokens
+
+    def would_wait(self, estimated_tokens: int) -> bool:
+        """Whether a request of ``estimated_tokens`` would have to wait for admission right now."""
+        if self._lock.locked() or self._paused_until > time.monotonic():
+            return True
+        return bool(
+            (self.requests and self.requests.wait_time(1) > 0)
+            or (self.tokens and self.tokens.wait_time(estimated_tokens) > 0)
+        )
+
+    def reconcile(self, reserved_tokens: int, actual_tokens: Optional[int]) -> None:
+        if self.tokens and actual_tokens:
+            self.tokens.consume(actual_tokens - reserved_tokens)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers) -> None:
+        if not headers:
+            return
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}") or headers.get(f"anthropic-ratelimit-{kind}-remaining")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            if bucket:
+                bucket.sync_remaining(remaining)
+            if remaining <= 0:
+                reset = _parse_reset_duration(
+                    headers.get(f"x-ratelimit-reset-{kind}") or headers.get(f"anthropic-ratelimit-{kind}-reset")
+                )
+                if reset:
+                    self.pause(reset)
+
+    def observe_error(self, exc: Exception) -> None:
+        status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+        if status != 429 and not isinstance(exc, openai.RateLimitError):
+            return
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        self.observe_headers(headers)
+        # Without a server-supplied delay the failed request backs off on its own through the
+        # retry policy's jitter; pausing the whole provider would stall every worker.
+        retry_after = _retry_after_seconds(headers)
+        if retry_after:
+            self.pause(retry_after)
+
+
+def _is_congestion_error(exc: BaseException) -> bool:
+    """Rate-limit (429) errors and timeouts: signs of sending more than the provider absorbs."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return (
+        status == 429
+        or isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError, TimeoutError))
+    )
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on in-flight requests for one provider.
+
+    Enabled with ``provider_params.adaptive_concurrency``. The limit starts at
+    ``max_concurrent_requests`` (``num_workers``) and stays within
+    ``min_concurrency`` .. ``max_concurrency`` (default 4x the start). While the
+    limit is saturated, every healthy completion adds ``1 / limit``, i.e. one
+    slot per round of requests. A rate-limit error, a timeout, or a latency
+    above ``latency_spike_factor`` (default 3) times the smoothed latency
+    multiplies it by ``concurrency_backoff`` (default 0.5), at most once per
+    smoothed latency, so the 429s of requests already in flight when the limit
+    was cut count as one congestion event.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: Optional[int] = None,
+        backoff: float = 0.5,
+        latency_spike_factor: float = 3.0,
+        warmup: int = 10,
+    ):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit or 4 * initial))
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_spike_factor = latency_spike_factor
+        self.warmup = warmup
+        self.in_flight = 0
+        self.decreases = 0
+        self._latency_ewma: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @classmethod
+    def from_config(cls, config: LLMConfig) -> Optional["AdaptiveConcurrencyLimiter"]:
+        params = config.provider_params
+        if not params.get("adaptive_concurrency"):
+            return None
+        return cls(
+            config.max_concurrent_requests,
+            min_limit=int(params.get("min_concurrency", 1)),
+            max_limit=params.get("max_concurrency"),
+            backoff=float(params.get("concurrency_backoff", 0.5)),
+            latency_spike_factor=float(params.get("latency_spike_factor", 3.0)),
+        )
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, exc: Optional[BaseException] = None, congested: bool = False) -> None:
+        """``congested``: a 429 was seen even though the SDK's own retries then succeeded."""
+        async with self._condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if congested or (exc is not None and _is_congestion_error(exc)):
+                self._decrease()
+            elif exc is None:
+                spike = (
+                    self._samples >= self.warmup
+                    and latency > self.latency_spike_factor * self._latency_ewma
+                )
+                self._samples += 1
+                self._latency_ewma = latency if self._latency_ewma is None else 0.9 * self._latency_ewma + 0.1 * latency
+                if spike:
+                    self._decrease()
+                elif saturated:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self._latency_ewma or 0.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+
+
+class HedgePolicy:
+    """
+    Hedged requests: duplicate a call that runs longer than most calls of the run.
+
+    A call still running after the ``percentile`` of the last ``window``
+    successful call latencies (once ``min_samples`` were seen) gets one
+    duplicate; the first successful response wins and the other call is
+    cancelled. Hedges are capped at ``budget`` times the number of calls, and
+    are skipped while the rate limiter or the adaptive concurrency limit
+    would make the duplicate wait, so hedging never adds load the provider
+    is not absorbing. One policy (and its statistics) is shared by a run.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        window: int = 500,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self.skipped = 0
+        self._latencies: deque = deque(maxlen=window)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["HedgePolicy"]:
+        """From run-config keys ``hedge_requests`` (enables), ``hedge_percentile``, ``hedge_budget``,
+        ``hedge_min_samples`` and ``hedge_min_delay``; None when hedging is off."""
+        if not config.get("hedge_requests"):
+            return None
+        return cls(
+            percentile=float(config.get("hedge_percentile", 95.0)),
+            budget=float(config.get("hedge_budget", 0.05)),
+            min_samples=int(config.get("hedge_min_samples", 20)),
+            min_delay=float(config.get("hedge_min_delay", 1.0)),
+        )
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a running call is hedged, or None while warming up."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        rank = max(1, math.ceil(self.percentile / 100 * len(ordered)))
+        return max(self.min_delay, ordered[rank - 1])
+
+    def _try_acquire(self) -> bool:
+        if self.hedges + 1 > self.budget * self.calls:
+            return False
+        self.hedges += 1
+        return True
+
+    async def _timed(self, call: Callable[[], Any]):
+        started = time.monotonic()
+        result = await call()
+        self._latencies.append(time.monotonic() - started)
+        return result
+
+    async def run(self, call: Callable[[], Any], congested: Callable[[], bool] = lambda: False):
+        """Await ``call()``, hedging it once if it straggles and ``congested()`` is false."""
+        self.calls += 1
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._timed(call))]
+        try:
+            skipped = False
+            while not tasks[0].done():
+                delay = self.delay()
+                if delay is None:  # warming up: look again once more calls have finished
+                    await asyncio.wait(tasks, timeout=self.min_delay)
+                    continue
+                remaining = delay - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.wait(tasks, timeout=remaining)
+                    continue
+                if congested():
+                    # A duplicate would only queue behind other requests: check again one delay later.
+                    self.skipped += not skipped
+                    skipped = True
+                    await asyncio.wait(tasks, timeout=delay)
+                    continue
+                if self._try_acquire():
+                    add_job_metric("hedged_requests")
+                    tasks.append(asyncio.ensure_future(self._timed(call)))
+                break
+            winner, result = await _first_successful(tasks)
+            if winner is not tasks[0]:
+                self.wins += 1
+                set_job_metric("hedge_won", True)
+            return result
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.wins,
+            "skipped_congested": self.skipped,
+            "delay_s": round(delay, 3) if delay is not None else None,
+        }
+
+
+async def _first_successful(tasks: List[asyncio.Future]) -> Tuple[asyncio.Future, Any]:
+    """(task, result) of the first task to return a response without an error; else the last outcome."""
+    pending = set(tasks)
+    fallback = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None and not (isinstance(task.result(), dict) and task.result().get("error")):
+                return task, task.result()
+            fallback = task
+    if fallback.exception() is not None:
+        raise fallback.exception()
+    return fallback, fallback.result()
+
+
+def adaptive_concurrency_bounds(config: LLMConfig) -> Tuple[int, int]:
+    """(initial, maximum) number of concurrent requests for a batch under ``config``."""
+    limiter = AdaptiveConcurrencyLimiter.from_config(config)
+    if limiter is None:
+        return config.max_concurrent_requests, config.max_concurrent_requests
+    return int(limiter.limit), limiter.max_limit
+
+
+class _PreParsedResponse:
+    """Raw-response stand-in for SDKs without a raw-response API (Gemini): no headers, already parsed."""
+
+    headers = None
+
+    def __init__(self, parsed):
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+async def _send_with_rate_limit(
+    limiter: RateLimiter,
+    estimated_tokens: int,
+    send: Callable[[], Any],
+    usage_tokens: Callable[[Any], Optional[int]],
+    concurrency: Optional[AdaptiveConcurrencyLimiter] = None,
+):
+    """Admit, send and reconcile one SDK call. ``send`` must return a raw SDK response."""
+    admission_started = time.monotonic()
+    if concurrency is not None:
+        await concurrency.acquire()
+        set_job_metric("concurrency_limit", round(concurrency.limit, 2))
+    try:
+        reserved = await limiter.acquire(estimated_tokens)
+    except BaseException:
+        if concurrency is not None:
+            await concurrency.release(0.0)
+        raise
+    sent = time.monotonic()
+    add_job_metric("rate_limit_wait_s", sent - admission_started)
+    set_job_metric("_request_sent", sent)
+    set_job_metric("_rate_limited", False)
+    set_job_metric("ttfb_s", None)
+    error = None
+    try:
+        raw_response = await send()
+    except BaseException as exc:
+        error = exc
+        if isinstance(exc, Exception):
+            limiter.observe_error(exc)
+        raise
+    finally:
+        elapsed = time.monotonic() - sent
+        add_job_metric("request_s", elapsed)
+        if concurrency is not None:
+            await concurrency.release(elapsed, error, congested=bool((job_metrics() or {}).get("_rate_limited")))
+    metrics = job_metrics()
+    if metrics is not None and metrics.get("ttfb_s") is None:
+        # No response hook saw the headers (custom transport): fall back to the full round trip.
+        metrics["ttfb_s"] = time.monotonic() - sent
+    limiter.observe_headers(raw_response.headers)
+    response = raw_response.parse()
+    if inspect.isawaitable(response):  # anthropic's async raw responses parse asynchronously
+        response = await response
+    limiter.reconcile(reserved, usage_tokens(response))
+    return response
+
+
+async def _note_request_sent(request: httpx.Request) -> None:
+    """httpx request hook: runs for every HTTP attempt, including the SDK's own retries."""
+    set_job_metric("_request_sent", time.monotonic())
+
+
+async def _note_first_byte(response: httpx.Response) -> None:
+    """httpx response hook: runs when the response headers arrive, before the body is read."""
+    metrics = job_metrics()
+    if metrics is None:
+        return
+    if metrics.get("_request_sent") is not None:
+        metrics["ttfb_s"] = time.monotonic() - metrics["_request_sent"]
+    if response.status_code >= 400:
+        # Includes error responses that end in an exception handled by the retry policy.
+        count_job_event("http_errors", str(response.status_code))
+    if response.status_code == 429:
+        metrics["_rate_limited"] = True
+
+
+class LLMClientRegistry:
+    """
+    Pooled async SDK clients shared by every call of one batch run.
+
+    Clients are keyed by (provider, base_url, timeout) so that all prompts of a
+    batch reuse the same connection pool instead of paying a TCP+TLS handshake
+    per call. Pool limits default to ``max_concurrent_requests`` and can be tuned
+    through ``provider_params``: ``max_connections``, ``max_keepalive_connections``,
+    ``keepalive_expiry`` (seconds) and ``http2`` (requires the ``h2`` package).
+    Claude uses one ``anthropic.AsyncAnthropic`` client and Gemini one
+    ``GenerativeModel`` per model/generation config, both natively async.
+    The registry also owns one ``RateLimiter`` and, in adaptive mode, one
+    ``AdaptiveConcurrencyLimiter`` per provider for the batch.
+    """
+
+    def __init__(self, max_concurrent_requests: int = 5):
+        self.max_concurrent_requests = max_concurrent_requests
+        self._clients: Dict[Tuple, Any] = {}
+        self._http_clients: List[httpx.AsyncClient] = []
+        self._sdk_clients: List[Any] = []
+        self._gemini_configured = False
+        self._rate_limiters: Dict[str, RateLimiter] = {}
+        self._concurrency_limiters: Dict[str, Optional[AdaptiveConcurrencyLimiter]] = {}
+        self._gemini_caches: Dict[str, Any] = {}
+        self._gemini_cache_locks: Dict[str, asyncio.Lock] = {}
+        self._mock: Optional["MockLLM"] = None
+
+    def _new_http_client(self, config: LLMConfig) -> httpx.AsyncClient:
+        params = config.provider_params
+        max_connections = int(params.get("max_connections") or self.max_concurrent_requests)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=int(params.get("max_keepalive_connections") or max_connections),
+            keepalive_expiry=params.get("keepalive_expiry", 30.0),
+        )
+        client = httpx.AsyncClient(
+            timeout=_request_timeout(config),
+            limits=limits,
+            http2=bool(params.get("http2", False)),
+            event_hooks={"request": [_note_request_sent], "response": [_note_first_byte]},
+        )
+        self._http_clients.append(client)
+        return client
+
+    def rate_limiter(self, config: LLMConfig, *, provider: str) -> RateLimiter:
+        if provider not in self._rate_limiters:
+            self._rate_limiters[provider] = RateLimiter.from_config(config)
+        return self._rate_limiters[provider]
+
+    def concurrency_limiter(self, config: LLMConfig, *, provider: str) -> Optional[AdaptiveConcurrencyLimiter]:
+        """The provider's AIMD limiter, or None unless ``adaptive_concurrency`` is enabled."""
+        if provider not in self._concurrency_limiters:
+            self._concurrency_limiters[provider] = AdaptiveConcurrencyLimiter.from_config(config)
+        return self._concurrency_limiters[provider]
+
+    def openai_client(self, config: LLMConfig, *, provider: str, api_key: str, base_url: Optional[str] = None) -> openai.AsyncOpenAI:
+        key = (provider, base_url, _request_timeout(config))
+        if key not in self._clients:
+            self._clients[key] = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=self._new_http_client(config),
+                max_retries=0,  # retries are decided by config.retry_policy
+            )
+        return self._clients[key]
+
+    def anthropic_client(self, config: LLMConfig, *, api_key: str):
+        import anthropic
+
+        key = ("anthropic", config.provider_params.get("base_url"), _request_timeout(config))
+        if key not in self._clients:
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                base_url=config.provider_params.get("base_url"),
+                timeout=_request_timeout(config),
+                max_retries=0,  # retries are decided by config.retry_policy
+            )
+            self._sdk_clients.append(client)
+            self._clients[key] = client
+        return self._clients[key]
+
+    def gemini_model(self, config: LLMConfig, *, api_key: str, generation_config: Dict[str, Any]):
+        import google.generativeai as genai
+
+        if not self._gemini_configured:
+            genai.configure(api_key=api_key)
+            self._gemini_configured = True
+        key = (
+            "gemini",
+            config.model_name,
+            config.system_instruction,
+            json.dumps(generation_config, sort_keys=True, default=str),
+        )
+        if key not in self._clients:
+            self._clients[key] = genai.GenerativeModel(
+                model_name=config.model_name,
+                system_instruction=config.system_instruction,
+                generation_config=generation_config,
+            )
+        return self._clients[key]
+
+    async def gemini_cached_model(self, config: LLMConfig, *, api_key: str, generation_config: Dict[str, Any], prefix: str):
+        """
+        GenerativeModel bound to a Gemini CachedContent holding system instruction + ``prefix``.
+
+        Returns None when the prefix cannot be cached (e.g. below the model's
+        minimum cacheable size); callers then send the full prompt uncached.
+        """
+        import google.generativeai as genai
+
+        if not self._gemini_configured:
+            genai.configure(api_key=api_key)
+            self._gemini_configured = True
+        prefix_key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        lock = self._gemini_cache_locks.setdefault(prefix_key, asyncio.Lock())
+        async with lock:  # one CachedContent per persona prefix, even under concurrency
+            if prefix_key not in self._gemini_caches:
+                try:
+                    self._gemini_caches[prefix_key] = await asyncio.to_thread(
+                        genai.caching.CachedContent.create,
+                        model=config.model_name,
+                        system_instruction=config.system_instruction,
+                        contents=[prefix],
+                        ttl=datetime.timedelta(seconds=float(config.provider_params.get("gemini_cache_ttl", 3600))),
+                    )
+                except Exception as e:
+                    print(f"Gemini context caching unavailable, sending uncached prompts: {e}")
+                    self._gemini_caches[prefix_key] = None
+        cached_content = self._gemini_caches[prefix_key]
+        if cached_content is None:
+            return None
+        key = ("gemini-cached", prefix_key, json.dumps(generation_config, sort_keys=True, default=str))
+        if key not in self._clients:
+            self._clients[key] = genai.GenerativeModel.from_cached_content(cached_content, generation_config=generation_config)
+        return self._clients[key]
+
+    def mock_llm(self, config: LLMConfig) -> "MockLLM":
+        """The batch's simulated provider for ``provider="mock"`` (``mock_*`` provider_params)."""
+        if self._mock is None:
+            from text_simulation.mock_llm import MockLLM
+
+            self._mock = MockLLM.from_params(config.provider_params)
+        return self._mock
+
+    async def aclose(self) -> None:
+        for cached_content in self._gemini_caches.values():
+            if cached_content is not None:
+                try:
+                    await asyncio.to_thread(cached_content.delete)
+                except Exception:
+                    pass  # expires on its own after the TTL
+        self._gemini_caches.clear()
+        for client in self._http_clients:
+            await client.aclose()
+        for client in self._sdk_clients:
+            await client.close()
+        self._http_clients.clear()
+        self._sdk_clients.clear()
+        self._clients.clear()
+
+    async def __aenter__(self) -> "LLMClientRegistry":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
 def _force_json_output(config: LLMConfig) -> bool:
     return bool(config.provider_params.get("force_json_output", True))
 
@@ -97,7 +845,7 @@ def _openai_supports_temperature(config: LLMConfig) -> bool:
     return not _looks_like_openai_reasoning_model(config.model_name)
 
 
-def _chat_completion_kwargs(prompt: str, config: LLMConfig, *, provider: str) -> Dict[str, Any]:
+def _chat_completion_kwargs(prompt: str, config: LLMConfig, *, provider: str, num_samples: int = 1) -> Dict[str, Any]:
     params = dict(config.provider_params)
     _pop_internal_params(params)
     extra_body = params.pop("extra_body", None)
@@ -120,76 +868,194 @@ def _chat_completion_kwargs(prompt: str, config: LLMConfig, *, provider: str) ->
 
     if _force_json_output(config) and "response_format" not in kwargs:
         kwargs["response_format"] = {"type": "json_object"}
+    if num_samples > 1:
+        kwargs["n"] = num_samples
+    if provider == "openai" and _prefix_caching(config):
+        prefix, _ = split_cacheable_prefix(prompt)
+        if prefix:
+            # Routes requests sharing a persona prefix to the same cache shard
+            extra_body = {**(extra_body or {}), "prompt_cache_key": hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]}
     if extra_body:
         kwargs["extra_body"] = extra_body
     return _without_none_values(kwargs)
 
 
+def _claude_message_kwargs(prompt: str, config: LLMConfig) -> Dict[str, Any]:
+    params = dict(config.provider_params)
+    _pop_internal_params(params)
+    thinking = params.get("thinking")
+    kwargs = {
+        "model": config.model_name,
+        "system": config.system_instruction,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": config.max_tokens or 4096,
+        **params,
+    }
+    prefix, suffix = split_cacheable_prefix(prompt) if _prefix_caching(config) else ("", prompt)
+    if prefix:
+        # cache_control marks the end of the cached segment (system + persona profile)
+        kwargs["messages"] = [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": suffix},
+            ],
+        }]
+    if config.temperature is not None and not thinking:
+        kwargs["temperature"] = config.temperature
+    return _without_none_values(kwargs)
+
+
+def _gemini_generation_config(config: LLMConfig) -> Dict[str, Any]:
+    params = dict(config.provider_params)
+    internal = _pop_internal_params(params)
+    return _without_none_values({
+        "temperature": config.temperature,
+        "max_output_tokens": config.max_tokens,
+        "response_mime_type": "application/json" if _force_json_output(config) else None,
+        **internal.get("gemini_generation_config", {}),
+        **params,
+    })
+
+
+def build_request_payload(prompt: str, config: LLMConfig, provider: str) -> Dict[str, Any]:
+    """The provider request exactly as it would be sent, used for cache keys."""
+    provider = provider.lower()
+    if provider in {"openai", "deepseek"}:
+        return _chat_completion_kwargs(prompt, config, provider=provider)
+    if provider in {"claude", "anthropic"}:
+        return _claude_message_kwargs(prompt, config)
+    if provider == "gemini":
+        return {
+            "model": config.model_name,
+            "system_instruction": config.system_instruction,
+            "generation_config": _gemini_generation_config(config),
+            "contents": prompt,
+        }
+    if provider == "mock":
+        return {
+            "model": config.model_name,
+            "system_instruction": config.system_instruction,
+            "provider_params": config.provider_params,
+            "prompt": prompt,
+        }
+    raise ValueError(f"Unsupported provider: {provider}")
+
+
 def _openai_usage_details(response) -> Dict[str, int]:
     usage = getattr(response, "usage", None)
+    prompt_details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    # OpenAI reports prefix-cache hits in prompt_tokens_details, DeepSeek as prompt_cache_hit_tokens
+    cached_tokens = getattr(prompt_details, "cached_tokens", None) if prompt_details else None
+    if cached_tokens is None and usage:
+        cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
     return {
         "prompt_token_count": getattr(usage, "prompt_tokens", 0) if usage else 0,
         "completion_token_count": getattr(usage, "completion_tokens", 0) if usage else 0,
         "total_token_count": getattr(usage, "total_tokens", 0) if usage else 0,
+        "cached_prompt_token_count": cached_tokens or 0,
     }
 
-@retry(
-    stop=stop_after_attempt(5), # Max 5 retries for the direct API call itself
-    wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((ConnectionError, TimeoutError, openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.APIError)),
-    reraise=True
-)
-async def _get_openai_response_direct(prompt: str, config: LLMConfig) -> Dict[str, Union[str, Dict]]:
+
+def _openai_total_tokens(response) -> Optional[int]:
+    return _openai_usage_details(response)["total_token_count"]
+
+
+def chat_completion_response_data(response) -> Dict[str, Union[str, Dict]]:
+    """Normalize an OpenAI-compatible ChatCompletion into our llm_response_data dict."""
+    message = response.choices[0].message
+    result = {
+        "response_text": message.content,
+        "usage_details": _openai_usage_details(response),
+    }
+    reasoning_content = getattr(message, "reasoning_content", None)
+    if reasoning_content:
+        result["reasoning_content"] = reasoning_content
+    return result
+
+
+def chat_completion_choices_data(response) -> List[Dict[str, Union[str, Dict]]]:
+    """One llm_response_data dict per choice of an n>1 ChatCompletion.
+
+    The provider reports usage for the whole request, so each choice carries an
+    even share of it plus ``samples_in_request``.
+    """
+    n = len(response.choices)
+    usage_share = {k: v // n for k, v in _openai_usage_details(response).items()}
+    usage_share["samples_in_request"] = n
+    out = []
+    for choice in response.choices:
+        data = {"response_text": choice.message.content, "usage_details": dict(usage_share)}
+        reasoning_content = getattr(choice.message, "reasoning_content", None)
+        if reasoning_content:
+            data["reasoning_content"] = reasoning_content
+        out.append(data)
+    return out
+
+
+def claude_response_data(response) -> Dict[str, Union[str, Dict]]:
+    """Normalize an Anthropic Message into our llm_response_data dict."""
+    response_text = "".join(
+        block.text for block in response.content if getattr(block, "type", None) == "text"
+    )
+    usage = getattr(response, "usage", None)
+    cache_read = (getattr(usage, "cache_read_input_tokens", 0) or 0) if usage else 0
+    cache_write = (getattr(usage, "cache_creation_input_tokens", 0) or 0) if usage else 0
+    usage_details = {
+        # input_tokens excludes cached segments; count them so prompt totals stay comparable
+        "prompt_token_count": (getattr(usage, "input_tokens", 0) if usage else 0) + cache_read + cache_write,
+        "completion_token_count": getattr(usage, "output_tokens", 0) if usage else 0,
+        "cached_prompt_token_count": cache_read,
+        "cache_creation_token_count": cache_write,
+    }
+    usage_details["total_token_count"] = usage_details["prompt_token_count"] + usage_details["completion_token_count"]
+    return {"response_text": response_text, "usage_details": usage_details}
+
+async def _get_openai_response_direct(prompt: str, config: LLMConfig, clients: LLMClientRegistry, num_samples: int = 1) -> Dict[str, Union[str, Dict]]:
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    async with httpx.AsyncClient(timeout=config.provider_params.get("request_timeout", 1000.0)) as client:
-        aclient = openai.AsyncOpenAI(api_key=api_key, http_client=client)
-        response = await aclient.chat.completions.create(**_chat_completion_kwargs(prompt, config, provider="openai"))
-        message = response.choices[0].message
-        return {
-            "response_text": message.content,
-            "usage_details": _openai_usage_details(response),
-        }
 
+    aclient = clients.openai_client(
+        config,
+        provider="openai",
+        api_key=api_key,
+        base_url=config.provider_params.get("base_url") or config.provider_params.get("api_base"),
+    )
+    response = await _send_with_rate_limit(
+        clients.rate_limiter(config, provider="openai"),
+        estimate_prompt_tokens(prompt, config),
+        lambda: aclient.chat.completions.with_raw_response.create(**_chat_completion_kwargs(prompt, config, provider="openai", num_samples=num_samples)),
+        _openai_total_tokens,
+        clients.concurrency_limiter(config, provider="openai"),
+    )
+    if num_samples > 1:
+        return {"choices": chat_completion_choices_data(response), "usage_details": _openai_usage_details(response)}
+    return chat_completion_response_data(response)
 
-@retry(
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((ConnectionError, TimeoutError, openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.APIError)),
-    reraise=True
-)
-async def _get_deepseek_response_direct(prompt: str, config: LLMConfig) -> Dict[str, Union[str, Dict]]:
+
+async def _get_deepseek_response_direct(prompt: str, config: LLMConfig, clients: LLMClientRegistry) -> Dict[str, Union[str, Dict]]:
     api_key = os.environ.get("DEEPSEEK_API_KEY")
     if not api_key:
         raise ValueError("DEEPSEEK_API_KEY environment variable not set")
 
-    async with httpx.AsyncClient(timeout=config.provider_params.get("request_timeout", 1000.0)) as client:
-        aclient = openai.AsyncOpenAI(
-            api_key=api_key,
-            base_url=config.provider_params.get("base_url") or config.provider_params.get("api_base") or "https://api.deepseek.com",
-            http_client=client,
-        )
-        response = await aclient.chat.completions.create(**_chat_completion_kwargs(prompt, config, provider="deepseek"))
-        message = response.choices[0].message
-        result = {
-            "response_text": message.content,
-            "usage_details": _openai_usage_details(response),
-        }
-        reasoning_content = getattr(message, "reasoning_content", None)
-        if reasoning_content:
-            result["reasoning_content"] = reasoning_content
-        return result
+    aclient = clients.openai_client(
+        config,
+        provider="deepseek",
+        api_key=api_key,
+        base_url=config.provider_params.get("base_url") or config.provider_params.get("api_base") or "https://api.deepseek.com",
+    )
+    response = await _send_with_rate_limit(
+        clients.rate_limiter(config, provider="deepseek"),
+        estimate_prompt_tokens(prompt, config),
+        lambda: aclient.chat.completions.with_raw_response.create(**_chat_completion_kwargs(prompt, config, provider="deepseek")),
+        _openai_total_tokens,
+        clients.concurrency_limiter(config, provider="deepseek"),
+    )
+    return chat_completion_response_data(response)
 
 
-@retry(
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((ConnectionError, TimeoutError)),
-    reraise=True
-)
-async def _get_claude_response_direct(prompt: str, config: LLMConfig) -> Dict[str, Union[str, Dict]]:
+async def _get_claude_response_direct(prompt: str, config: LLMConfig, clients: LLMClientRegistry) -> Dict[str, Union[str, Dict]]:
     try:
         import anthropic
     except ImportError as exc:
@@ -199,42 +1065,18 @@ async def _get_claude_response_direct(prompt: str, config: LLMConfig) -> Dict[st
     if not api_key:
         raise ValueError("ANTHROPIC_API_KEY environment variable not set")
 
-    params = dict(config.provider_params)
-    _pop_internal_params(params)
-    thinking = params.get("thinking")
-    kwargs = {
-        "model": config.model_name,
-        "system": config.system_instruction,
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": config.max_tokens or 4096,
-        **params,
-    }
-    if config.temperature is not None and not thinking:
-        kwargs["temperature"] = config.temperature
-    response = await asyncio.to_thread(
-        lambda: anthropic.Anthropic(api_key=api_key, timeout=config.provider_params.get("request_timeout", 1000.0)).messages.create(**_without_none_values(kwargs))
+    kwargs = _claude_message_kwargs(prompt, config)
+    aclient = clients.anthropic_client(config, api_key=api_key)
+    response = await _send_with_rate_limit(
+        clients.rate_limiter(config, provider="claude"),
+        estimate_prompt_tokens(prompt, config),
+        lambda: aclient.messages.with_raw_response.create(**kwargs),
+        lambda r: (r.usage.input_tokens + r.usage.output_tokens) if getattr(r, "usage", None) else None,
+        clients.concurrency_limiter(config, provider="claude"),
     )
-    response_text = "".join(
-        block.text for block in response.content if getattr(block, "type", None) == "text"
-    )
-    usage = getattr(response, "usage", None)
-    usage_details = {
-        "prompt_token_count": getattr(usage, "input_tokens", 0) if usage else 0,
-        "completion_token_count": getattr(usage, "output_tokens", 0) if usage else 0,
-    }
-    usage_details["total_token_count"] = usage_details["prompt_token_count"] + usage_details["completion_token_count"]
-    return {"response_text": response_text, "usage_details": usage_details}
+    return claude_response_data(response)
 
-@retry(
-    stop=stop_after_attempt(5), # Max 5 retries for the direct API call itself
-    wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((
-        ConnectionError, 
-        TimeoutError 
-    )), 
-    reraise=True
-)
-async def _get_gemini_response_direct(prompt: str, config: LLMConfig) -> Dict[str, Union[str, Dict]]:
+async def _get_gemini_response_direct(prompt: str, config: LLMConfig, clients: LLMClientRegistry) -> Dict[str, Union[str, Dict]]:
     try:
         import google.generativeai as genai
     except ImportError as exc:
@@ -244,26 +1086,26 @@ async def _get_gemini_response_direct(prompt: str, config: LLMConfig) -> Dict[st
     if not api_key:
         raise ValueError("GOOGLE_API_KEY environment variable not set")
 
-    genai.configure(api_key=api_key)
-    params = dict(config.provider_params)
-    internal = _pop_internal_params(params)
-    generation_config = _without_none_values({
-        "temperature": config.temperature,
-        "max_output_tokens": config.max_tokens,
-        "response_mime_type": "application/json" if _force_json_output(config) else None,
-        **internal.get("gemini_generation_config", {}),
-        **params,
-    })
+    generation_config = _gemini_generation_config(config)
+    model = None
+    contents = prompt
+    prefix, suffix = split_cacheable_prefix(prompt) if _prefix_caching(config) else ("", prompt)
+    if prefix:
+        model = await clients.gemini_cached_model(config, api_key=api_key, generation_config=generation_config, prefix=prefix)
+        if model is not None:
+            contents = suffix
+    if model is None:
+        model = clients.gemini_model(config, api_key=api_key, generation_config=generation_config)
 
-    response = await asyncio.get_event_loop().run_in_executor(
-        None,
-        lambda: genai.GenerativeModel(
-            model_name=config.model_name,
-            system_instruction=config.system_instruction,
-            generation_config=generation_config,
-        ).generate_content(
-            prompt,
-        )
+    async def send():
+        return _PreParsedResponse(await model.generate_content_async(contents))
+
+    response = await _send_with_rate_limit(
+        clients.rate_limiter(config, provider="gemini"),
+        estimate_prompt_tokens(prompt, config),
+        send,
+        lambda r: getattr(r.usage_metadata, "total_token_count", None) if r.usage_metadata else None,
+        clients.concurrency_limiter(config, provider="gemini"),
     )
 
     # Check for blocked prompt or other non-fatal issues in the response directly
@@ -296,7 +1138,8 @@ async def _get_gemini_response_direct(prompt: str, config: LLMConfig) -> Dict[st
         "prompt_token_count": usage_metadata.prompt_token_count if usage_metadata else 0,
         "candidates_token_count": usage_metadata.candidates_token_count if hasattr(usage_metadata, 'candidates_token_count') else 0,
         "thoughts_token_count": usage_metadata.thoughts_token_count if hasattr(usage_metadata, 'thoughts_token_count') else 0,
-        "total_token_count": usage_metadata.total_token_count if hasattr(usage_metadata, 'total_token_count') else 0
+        "total_token_count": usage_metadata.total_token_count if hasattr(usage_metadata, 'total_token_count') else 0,
+        "cached_prompt_token_count": getattr(usage_metadata, 'cached_content_token_count', 0) or 0,
     }
     if hasattr(usage_metadata, 'prompt_tokens_details') and usage_metadata.prompt_tokens_details:
         current_token_stats["prompt_tokens_details"] = [
@@ -306,22 +1149,229 @@ async def _get_gemini_response_direct(prompt: str, config: LLMConfig) -> Dict[st
     return {"response_text": response.text, "usage_details": current_token_stats}
 
 
+async def _get_mock_response_direct(prompt: str, config: LLMConfig, clients: LLMClientRegistry) -> Dict[str, Union[str, Dict]]:
+    mock = clients.mock_llm(config)
+
+    async def send():
+        return _PreParsedResponse(await mock.complete(prompt))
+
+    return await _send_with_rate_limit(
+        clients.rate_limiter(config, provider="mock"),
+        estimate_prompt_tokens(prompt, config),
+        send,
+        lambda r: r["usage_details"]["total_token_count"],
+        clients.concurrency_limiter(config, provider="mock"),
+    )
+
+
+# Providers whose API returns several independent samples for one prompt (``n``).
+MULTI_SAMPLE_PROVIDERS = {"openai"}
+
+
+def samples_per_request(config: LLMConfig, provider: str) -> int:
+    """How many simulations of one prompt may share a request (provider_params.samples_per_request)."""
+    if provider.lower() not in MULTI_SAMPLE_PROVIDERS:
+        return 1
+    return max(1, int(config.provider_params.get("samples_per_request", 1)))
+
+
 async def get_llm_response_with_internal_retry(
-    prompt: str, config: LLMConfig, provider: str
+    prompt: str, config: LLMConfig, provider: str, clients: Optional[LLMClientRegistry] = None, num_samples: int = 1
 ) -> Dict[str, Union[str, Dict]]:
-    try:
+    """
+    Returns one llm_response_data dict, or for ``num_samples > 1`` a dict whose
+    ``choices`` holds one llm_response_data dict per sample.
+    """
+    if clients is None:
+        # Standalone call: use a short-lived registry so connections are still closed.
+        async with LLMClientRegistry(config.max_concurrent_requests) as own_clients:
+            return await get_llm_response_with_internal_retry(prompt, config, provider, own_clients, num_samples)
+
+    async def call():
+        if num_samples > 1 and provider.lower() not in MULTI_SAMPLE_PROVIDERS:
+            raise ValueError(f"Provider {provider} does not support multiple samples per request")
         if provider.lower() == "gemini":
-            return await _get_gemini_response_direct(prompt, config)
+            return await _get_gemini_response_direct(prompt, config, clients)
         elif provider.lower() == "openai":
-            return await _get_openai_response_direct(prompt, config)
+            return await _get_openai_response_direct(prompt, config, clients, num_samples)
         elif provider.lower() == "deepseek":
-            return await _get_deepseek_response_direct(prompt, config)
+            return await _get_deepseek_response_direct(prompt, config, clients)
         elif provider.lower() in {"claude", "anthropic"}:
-            return await _get_claude_response_direct(prompt, config)
+            return await _get_claude_response_direct(prompt, config, clients)
+        elif provider.lower() == "mock":
+            return await _get_mock_response_direct(prompt, config, clients)
         else:
             raise ValueError(f"Unsupported provider: {provider}")
-    except Exception as e: # Catch exceptions from the direct calls after their retries
-        return {"error": f"LLM API call failed after internal retries: {str(e)}", "provider": provider}
+
+    def congested() -> bool:
+        limiter_key = "claude" if provider.lower() == "anthropic" else provider.lower()
+        concurrency = clients.concurrency_limiter(config, provider=limiter_key)
+        return (
+            clients.rate_limiter(config, provider=limiter_key).would_wait(estimate_prompt_tokens(prompt, config))
+            or (concurrency is not None and concurrency.in_flight >= int(concurrency.limit))
+        )
+
+    policy = config.retry_policy
+    backoff = policy.backoff()
+    for attempt in range(policy.api_attempts):
+        try:
+            if config.hedge_policy is not None:
+                return await config.hedge_policy.run(call, congested)
+            return await call()
+        except Exception as e:
+            error_kind = classify_error(e)
+            if error_kind == NON_RETRYABLE or attempt == policy.api_attempts - 1 or not _acquire_retry(policy):
+                set_job_metric("error_class", type(e).__name__)
+                return {"error": f"LLM API call failed after internal retries: {str(e)}", "provider": provider, "error_kind": error_kind}
+            add_job_metric("api_retries")
+            count_job_event("api_retry_errors", type(e).__name__)
+            await asyncio.sleep(backoff.next_delay())
+
+
+VERIFICATION_EXECUTORS = ("thread", "process")
+
+
+def make_verification_executor(kind: str = "thread", max_workers: Optional[int] = None) -> Executor:
+    """
+    Executor for verification callbacks, sized independently of LLM concurrency.
+
+    "process" moves the CPU-bound parse/validate/dump work out of the event
+    loop's process, so verification cannot hold the GIL while requests are
+    being dispatched. The callback, its kwargs and the response data must then
+    be picklable (a module-level function such as ``save_and_verify_response``).
+    Worker processes are long-lived, so module-level caches (e.g. answer-block
+    templates) are reused across jobs.
+    """
+    if kind not in VERIFICATION_EXECUTORS:
+        raise ValueError(f"verification executor must be one of {VERIFICATION_EXECUTORS}, got {kind!r}")
+    max_workers = max_workers or os.cpu_count() or 1
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify")
+
+
+def _timed_call(fn: Callable, *args, **kwargs) -> Tuple[float, float, Any]:
+    """Run ``fn`` and return (start, end, result) wall-clock times, as seen by the executor worker."""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+async def verify_llm_response(prompt_id: str, llm_response_data: Dict, prompt_text: str, config: LLMConfig) -> bool:
+    if not config.verification_callback:
+        return True
+    count_job_event("verification_attempts", prompt_id)
+    submitted = time.time()
+    # The callback must be synchronous as it deals with file I/O and potentially CPU-bound tasks from postprocess_responses
+    started, finished, verified = await asyncio.get_running_loop().run_in_executor(
+        config.verification_executor,
+        functools.partial(
+            _timed_call,
+            config.verification_callback,
+            prompt_id,
+            llm_response_data, # Pass the successful LLM response
+            prompt_text, # Pass original prompt text for saving
+            **config.verification_callback_args
+        )
+    )
+    # Time queued behind other verifications vs. time spent saving, parsing and validating
+    add_job_metric("verify_wait_s", max(0.0, started - submitted))
+    add_job_metric("verify_s", finished - started)
+    return verified
+
+
+def _note_attempt(job_info: Optional[Dict[str, Dict]], prompt_ids: List[str], attempt: int) -> None:
+    if job_info is not None:
+        for prompt_id in prompt_ids:
+            job_info.setdefault(prompt_id, {})["attempts"] = attempt + 1
+
+
+def job_record(prompt_id: str, response_data: Dict, info: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Flat, JSON-serializable summary of one finished job for run logs.
+
+    ``status`` is ``ok``, ``failed`` (a response was received but never
+    verified) or ``error`` (the LLM call itself failed); ``error_class`` is the
+    final exception class name, or ``VerificationFailed``, and ``error_kind``
+    the retry-policy category (``retryable``, ``non_retryable`` or
+    ``verification_failed``) when known. Stage timings (in
+    seconds) come from the job's metrics, see ``text_simulation.run_metrics``.
+    """
+    info = info or {}
+    llm_data = response_data.get("llm_response_data") or response_data
+    usage_details = llm_data.get("usage_details") if isinstance(llm_data, dict) else None
+    if not response_data.get("error"):
+        status, error_class, error_kind = "ok", None, None
+    elif "llm_response_data" in response_data:
+        status, error_class, error_kind = "failed", "VerificationFailed", VERIFICATION_FAILED
+    else:
+        status, error_class, error_kind = "error", info.get("error_class") or "Error", response_data.get("error_kind")
+
+    def seconds(key):
+        return round(info[key], 4) if info.get(key) is not None else None
+
+    return {
+        "prompt_id": prompt_id,
+        "status": status,
+        "error": response_data.get("error"),
+        "error_class": error_class,
+        "error_kind": error_kind,
+        "latency_s": seconds("latency_s"),
+        "queue_wait_s": seconds("queue_wait_s"),
+        "rate_limit_wait_s": seconds("rate_limit_wait_s"),
+        "ttfb_s": seconds("ttfb_s"),
+        "request_s": seconds("request_s"),
+        "verify_wait_s": seconds("verify_wait_s"),
+        "verify_s": seconds("verify_s"),
+        "attempts": info.get("attempts"),
+        "api_retries": info.get("api_retries", 0),
+        "api_retry_errors": info.get("api_retry_errors"),
+        "http_errors": info.get("http_errors"),
+        "verification_attempts": info.get("verification_attempts", 0),
+        "partial_reasks": info.get("partial_reasks", 0),
+        "retry_budget_denied": bool(info.get("retry_budget_denied")),
+        "concurrency_limit": info.get("concurrency_limit"),
+        "hedged_requests": info.get("hedged_requests", 0),
+        "hedge_won": bool(info.get("hedge_won")),
+        "cache_hit": bool(response_data.get("cache_hit")),
+        **token_counts(usage_details),
+        "usage_details": usage_details,
+        "finished_at": time.time(),
+    }
+
+
+class JsonlRunLog:
+    """
+    Append-only JSONL run log with one ``job_record`` per finished job.
+
+    Each line is flushed as soon as the job finishes, so a crashed run keeps
+    every record written so far. Usable directly as ``on_result`` for
+    ``process_prompts_batch``.
+    """
+
+    def __init__(self, path: Union[str, "os.PathLike"]):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def __call__(self, prompt_id: str, response_data: Dict, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "JsonlRunLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _acquire_retry(policy: RetryPolicy) -> bool:
+    """Take one retry from the run's budget; records a denial on the current job."""
+    if policy.budget.try_acquire():
+        return True
+    set_job_metric("retry_budget_denied", True)
+    return False
 
 
 async def _process_single_prompt_attempt_with_verification(
@@ -329,15 +1379,42 @@ async def _process_single_prompt_attempt_with_verification(
     prompt_text: str,
     config: LLMConfig,
     provider: str,
-    semaphore: asyncio.Semaphore
+    semaphore: asyncio.Semaphore,
+    clients: LLMClientRegistry,
+    job_info: Optional[Dict[str, Dict]] = None
 ):
     async with semaphore: # Manage concurrency for LLM calls
         last_exception_details = None
+        cache = config.response_cache
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(provider, build_request_payload(prompt_text, config, provider), prompt_id)
+            # A cached response is checked once, outside the retry loop, so a stale entry costs no attempt
+            if cache.readable:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    _note_attempt(job_info, [prompt_id], 0)
+                    cached = {**cached, "cache_hit": True}
+                    try:
+                        if await verify_llm_response(prompt_id, cached, prompt_text, config):
+                            return prompt_id, cached
+                    except Exception as e:
+                        set_job_metric("error_class", type(e).__name__)
+                    # The cached answer no longer verifies (e.g. validator changed): drop it and ask the LLM
+                    cache.delete(cache_key)
+        policy = config.retry_policy
+        policy.budget.record_job()
+        backoff = policy.backoff()
+        # After a partly valid response, only its failed questions are re-asked and merged into it.
+        reask_keys: Optional[List[str]] = None
+        previous_response_data = None
         for attempt in range(config.max_retries):
-            llm_response_data = None
+            _note_attempt(job_info, [prompt_id], attempt)
             try:
-                # Step 1: Get LLM response (this now has its own tenacity retry)
-                llm_response_data = await get_llm_response_with_internal_retry(prompt_text, config, provider)
+                # Step 1: Get LLM response
+                request_prompt = config.partial_reask.prompt(prompt_text, reask_keys) if reask_keys else prompt_text
+                # Retries of the call itself follow config.retry_policy
+                llm_response_data = await get_llm_response_with_internal_retry(request_prompt, config, provider, clients)
 
                 if "error" in llm_response_data and llm_response_data["error"]:
                     # print(f"LLM call failed for {prompt_id} (attempt {attempt + 1}/{config.max_retries}): {llm_response_data['error']}. This is a final LLM error.")
@@ -345,84 +1422,313 @@ async def _process_single_prompt_attempt_with_verification(
                     # No more retries in *this* loop if the LLM call itself reported a final error.
                     return prompt_id, llm_response_data 
 
+                if reask_keys:
+                    add_job_metric("partial_reasks")
+                    merged = config.partial_reask.merge(previous_response_data, llm_response_data, reask_keys)
+                    if merged is None:
+                        # The follow-up answer did not parse: keep the previous response and ask again
+                        last_exception_details = {"error": f"Unparseable partial re-ask on attempt {attempt + 1}", "prompt_id": prompt_id, "llm_response_data": llm_response_data}
+                        if attempt == config.max_retries - 1 or not _acquire_retry(policy):
+                            return prompt_id, last_exception_details
+                        await asyncio.sleep(backoff.next_delay())
+                        continue
+                    llm_response_data = merged
 
                 # Step 2: Perform verification if callback is provided
                 if config.verification_callback:
                     # The callback needs original_prompt_content. We should pass it if needed by callback_args.
                     # For now, assuming callback_args includes what's needed or callback gets it.
                     # It's better if callback_args contains static info, and dynamic info like llm_response_data is passed directly.
-                    
-                    # The callback must be synchronous as it deals with file I/O and potentially CPU-bound tasks from postprocess_responses
-                    verified = await asyncio.to_thread(
-                        config.verification_callback,
-                        prompt_id,
-                        llm_response_data, # Pass the successful LLM response
-                        prompt_text, # Pass original prompt text for saving
-                        **config.verification_callback_args 
-                    )
+                    verified = await verify_llm_response(prompt_id, llm_response_data, prompt_text, config)
                     if not verified:
                         # print(f"Verification failed for {prompt_id} (LLM attempt {attempt + 1}/{config.max_retries}). Retrying entire sequence...")
                         last_exception_details = {"error": f"Verification failed on attempt {attempt + 1}", "prompt_id": prompt_id, "llm_response_data": llm_response_data}
                         if attempt == config.max_retries - 1:
                             return prompt_id, last_exception_details # Final verification failure
-                        # Wait before retrying the whole sequence (LLM call + verification)
-                        await asyncio.sleep(min(2 * 2 ** attempt, 30))  # Simple exponential backoff
+                        if not _acquire_retry(policy):
+                            return prompt_id, last_exception_details
+                        reask_keys = None
+                        if (
+                            config.partial_reask is not None
+                            and isinstance(verified, VerificationOutcome)
+                            and config.partial_reask.worthwhile(verified.failed_keys, verified.total_keys)
+                        ):
+                            reask_keys, previous_response_data = verified.failed_keys, llm_response_data
+                        # Wait before retrying (LLM call + verification)
+                        await asyncio.sleep(backoff.next_delay())
                         continue # Go to next attempt in the outer loop
                 
                 # If LLM call successful and (no verification OR verification successful)
+                if cache_key:
+                    cache.put(cache_key, llm_response_data)
                 return prompt_id, llm_response_data
 
             except Exception as e: # Catch unexpected exceptions during the attempt
-                # print(f"Unexpected error for {prompt_id} (attempt {attempt + 1}/{config.max_retries}): {str(e)}. Retrying...")
-                last_exception_details = {"error": f"Unexpected error: {str(e)}", "prompt_id": prompt_id}
-                if attempt == config.max_retries - 1:
+                # LLM call errors come back as error dicts, so this is the verification callback, the
+                # partial re-ask merge or the cache: retry like a failed verification, not by exception type.
+                set_job_metric("error_class", type(e).__name__)
+                last_exception_details = {"error": f"Unexpected error: {str(e)}", "prompt_id": prompt_id, "error_kind": VERIFICATION_FAILED}
+                if attempt == config.max_retries - 1 or not _acquire_retry(policy):
                     return prompt_id, last_exception_details # Final unexpected error
-                await asyncio.sleep(min(2 * 2 ** attempt, 30))  # Simple exponential backoff
+                await asyncio.sleep(backoff.next_delay())
                 continue
         
         # Fallback if loop finishes without returning (should ideally be caught by attempt == config.max_retries - 1 checks)
         return prompt_id, last_exception_details if last_exception_details else {"error": f"Exhausted all {config.max_retries} retries for {prompt_id} with no specific final error."}
 
 
+async def _process_prompt_group_with_verification(
+    prompt_ids: List[str],
+    prompt_text: str,
+    config: LLMConfig,
+    provider: str,
+    semaphore: asyncio.Semaphore,
+    clients: LLMClientRegistry,
+    job_info: Optional[Dict[str, Dict]] = None
+) -> List[Tuple[str, Dict]]:
+    """
+    Multi-sample variant of ``_process_single_prompt_attempt_with_verification``.
+
+    Several simulations of the same prompt share one request with ``n`` choices;
+    each choice is verified as its own prompt_id, and only the choices that fail
+    verification are re-requested (with a smaller ``n``).
+    """
+    async with semaphore:
+        results: Dict[str, Dict] = {}
+        cache = config.response_cache
+        cache_keys: Dict[str, str] = {}
+        if cache is not None:
+            payload = build_request_payload(prompt_text, config, provider)
+            cache_keys = {pid: cache.make_key(provider, payload, pid) for pid in prompt_ids}
+            if cache.readable:
+                for pid in prompt_ids:
+                    cached = cache.get(cache_keys[pid])
+                    if cached is None:
+                        continue
+                    cached = {**cached, "cache_hit": True}
+                    try:
+                        if await verify_llm_response(pid, cached, prompt_text, config):
+                            results[pid] = cached
+                            continue
+                    except Exception as e:
+                        set_job_metric("error_class", type(e).__name__)
+                    cache.delete(cache_keys[pid])
+        pending = [pid for pid in prompt_ids if pid not in results]
+        policy = config.retry_policy
+        policy.budget.record_job(len(prompt_ids))
+        backoff = policy.backoff()
+
+        for attempt in range(config.max_retries):
+            if not pending:
+                break
+            _note_attempt(job_info, pending, attempt)
+            try:
+                llm_response_data = await get_llm_response_with_internal_retry(
+                    prompt_text, config, provider, clients, num_samples=len(pending)
+                )
+                if llm_response_data.get("error"):
+                    # Final LLM error after internal retries, same as the single-prompt path
+                    for pid in pending:
+                        results[pid] = llm_response_data
+                    break
+                choices = llm_response_data["choices"] if len(pending) > 1 else [llm_response_data]
+                samples = list(zip(pending, choices))
+                verified = await asyncio.gather(*(
+                    verify_llm_response(pid, data, prompt_text, config) for pid, data in samples
+                ))
+                still_pending = pending[len(samples):]
+                for pid in still_pending:
+                    results[pid] = {"error": f"Provider returned {len(choices)} of {len(pending)} requested choices", "prompt_id": pid}
+                for (pid, data), ok in zip(samples, verified):
+                    if ok:
+                        results[pid] = data
+                        if cache_keys:
+                            cache.put(cache_keys[pid], data)
+                    else:
+                        results[pid] = {"error": f"Verification failed on attempt {attempt + 1}", "prompt_id": pid, "llm_response_data": data}
+                        still_pending.append(pid)
+                pending = still_pending
+            except Exception as e: # Catch unexpected exceptions during the attempt
+                set_job_metric("error_class", type(e).__name__)
+                # Raised by verification or the cache, never by the LLM call: retried like a failed verification
+                for pid in pending:
+                    results[pid] = {"error": f"Unexpected error: {str(e)}", "prompt_id": pid, "error_kind": VERIFICATION_FAILED}
+            if pending and attempt < config.max_retries - 1:
+                if not _acquire_retry(policy):
+                    break
+                await asyncio.sleep(backoff.next_delay())
+
+        return [(pid, results[pid]) for pid in prompt_ids]
+
+
+def _group_identical_prompts(prompts: Iterable[Tuple[str, str]], group_size: int) -> Iterator[Tuple[List[str], str]]:
+    """Group consecutive jobs that share the same prompt text into chunks of at most ``group_size``."""
+    for prompt_text, jobs in itertools.groupby(prompts, key=lambda job: job[1]):
+        prompt_ids = [pid for pid, _ in jobs]
+        for start in range(0, len(prompt_ids), group_size):
+            yield prompt_ids[start:start + group_size], prompt_text
+
+
+async def _raise_if_worker_died(main: asyncio.Future, workers: List[asyncio.Task]) -> None:
+    """Await ``main`` but surface a crashed worker instead of waiting forever."""
+    done, _ = await asyncio.wait([main, *workers], return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        if task is not main:
+            task.result()
+            raise RuntimeError("LLM worker exited unexpectedly")
+    main.result()
+
+
 async def process_prompts_batch(
-    prompts: List[Tuple[str, str]],
+    prompts: Iterable[Tuple[str, str]],
     config: LLMConfig,
     provider: str = "gemini",
-    desc: Optional[str] = "Processing LLM prompts and verifying"
+    desc: Optional[str] = "Processing LLM prompts and verifying",
+    on_result: Optional[Callable[[str, Dict, Dict], Any]] = None,
+    collect_results: bool = True,
+    total: Optional[int] = None,
+    metrics: Optional[RunMetrics] = None
 ) -> Dict[str, Dict[str, Union[str, Dict]]]:
-    semaphore = asyncio.Semaphore(config.max_concurrent_requests)
+    """
+    Run and verify all prompts; returns ``{prompt_id: response_data}``.
+
+    ``prompts`` may be any iterable, including a lazy generator: a fixed pool of
+    ``max_concurrent_requests`` workers pulls from a bounded queue that is fed
+    on demand, so startup is immediate and memory stays flat regardless of the
+    number of jobs. Jobs sharing one prompt should share one string object.
+    ``total`` sizes the progress bar when ``prompts`` has no ``len()``.
+
+    ``on_result(prompt_id, response_data, record)`` is called (and awaited if it
+    returns an awaitable) as each job finishes, with ``record`` from
+    ``job_record``. With ``collect_results=False`` nothing is kept in memory and
+    an empty dict is returned, so callers can stream results to disk instead.
+
+    Every record is also folded into ``metrics`` (a fresh ``RunMetrics`` if not
+    given), whose latency percentiles, tokens/sec and error rate are shown live
+    on the progress bar; read ``metrics.snapshot()`` for the run summary.
+    """
+    # In adaptive mode the pool is sized for the upper bound and the provider's
+    # AdaptiveConcurrencyLimiter decides how many requests are actually in flight.
+    _, num_workers = adaptive_concurrency_bounds(config)
+    semaphore = asyncio.Semaphore(num_workers)
     results = {}
-    
-    tasks = [
-        _process_single_prompt_attempt_with_verification(pid, p_text, config, provider, semaphore)
-        for pid, p_text in prompts
-    ]
-    
-    for future in tqdm_asyncio(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
-        prompt_id, response_data = await future
-        results[prompt_id] = response_data
-            
+    group_size = samples_per_request(config, provider)
+    job_info: Dict[str, Dict] = {}
+    if metrics is None:
+        metrics = RunMetrics()
+    if total is None and hasattr(prompts, "__len__"):
+        total = len(prompts)
+
+    # A unit is one request's worth of jobs: a single prompt, or an n>1 group.
+    if group_size > 1:
+        units = _group_identical_prompts(prompts, group_size)
+    else:
+        units = (([pid], p_text) for pid, p_text in prompts)
+    if _prefix_caching(config):
+        # A lane holds all units of one persona prefix. Its first unit runs alone to
+        # warm the provider cache; the rest are queued ahead of new personas so the
+        # persona's jobs stay back-to-back while the cache is warm.
+        items = (("lane", list(lane_units)) for _, lane_units in itertools.groupby(units, key=lambda unit: unit[1]))
+    else:
+        items = (("unit", unit) for unit in units)
+
+    # Priority 0: remaining units of a warmed lane; 1: fresh items from the producer.
+    # Entries carry their enqueue time for the per-job queue-wait metric.
+    queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+    credits = asyncio.Semaphore(2 * num_workers)  # bounds fresh items queued or in flight
+    sequence = itertools.count()
+
+    async with LLMClientRegistry(num_workers) as clients:
+        with tqdm_asyncio(total=total, desc=desc) as pbar:
+
+            async def run_unit(pids, p_text, enqueued_at):
+                started = time.monotonic()
+                # Bound to this worker task, so the SDK call, retries and verification add to it.
+                unit_metrics = {"queue_wait_s": started - enqueued_at}
+                token = bind_job_metrics(unit_metrics)
+                try:
+                    if group_size > 1:
+                        outcome = await _process_prompt_group_with_verification(pids, p_text, config, provider, semaphore, clients, job_info)
+                    else:
+                        outcome = [await _process_single_prompt_attempt_with_verification(pids[0], p_text, config, provider, semaphore, clients, job_info)]
+                finally:
+                    unbind_job_metrics(token)
+                latency = time.monotonic() - started
+                verification_attempts = unit_metrics.pop("verification_attempts", {})
+                for prompt_id, response_data in outcome:
+                    info = {
+                        **unit_metrics,
+                        **job_info.pop(prompt_id, {}),
+                        "latency_s": latency,
+                        "verification_attempts": verification_attempts.get(prompt_id, 0),
+                    }
+                    record = job_record(prompt_id, response_data, info)
+                    metrics.observe(record)
+                    if on_result is not None:
+                        maybe_awaitable = on_result(prompt_id, response_data, record)
+                        if asyncio.iscoroutine(maybe_awaitable):
+                            await maybe_awaitable
+                    if collect_results:
+                        results[prompt_id] = response_data
+                    postfix = metrics.postfix()
+                    if postfix is not None:
+                        pbar.set_postfix(postfix, refresh=False)
+                    pbar.update(1)
+
+            async def producer():
+                for item in items:
+                    await credits.acquire()
+                    queue.put_nowait((1, next(sequence), item, True, time.monotonic()))
+
+            async def worker():
+                while True:
+                    _, _, (kind, payload), fresh, enqueued_at = await queue.get()
+                    try:
+                        if kind == "lane":
+                            await run_unit(*payload[0], enqueued_at)
+                            for unit in payload[1:]:
+                                queue.put_nowait((0, next(sequence), ("unit", unit), False, time.monotonic()))
+                        else:
+                            await run_unit(*payload, enqueued_at)
+                    finally:
+                        if fresh:
+                            credits.release()
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(num_workers)]
+            producer_task = asyncio.create_task(producer())
+            try:
+                await _raise_if_worker_died(producer_task, workers)
+                await _raise_if_worker_died(asyncio.ensure_future(queue.join()), workers)
+            finally:
+                for task in [producer_task, *workers]:
+                    task.cancel()
+                await asyncio.gather(producer_task, *workers, return_exceptions=True)
+
     return results
 
 # Example usage (remains similar, but LLMConfig now takes callback info)
 if __name__ == "__main__":
-    async def mock_verification_callback(prompt_id, llm_response_data, original_prompt_text, **kwargs):
+    failed_once = set()
+
+    def mock_verification_callback(prompt_id, llm_response_data, original_prompt_text, **kwargs):
         print(f"  (Mock Verify for {prompt_id}): Called with LLM response containing '{llm_response_data.get('response_text', '')[:30]}...'. Args: {kwargs}")
         # Simulate saving
         # print(f"  (Mock Verify for {prompt_id}): Saving LLM response and original prompt '{original_prompt_text[:30]}...' to disk...")
         # Simulate verification failure for specific pids for testing
-        if prompt_id == "p2" and kwargs.get("fail_p2_verification_once", False):
-            kwargs["fail_p2_verification_once"] = False # So it passes on retry
+        if prompt_id == "p2" and kwargs.get("fail_p2_verification_once", False) and prompt_id not in failed_once:
+            failed_once.add(prompt_id) # So it passes on retry (kwargs is a fresh copy per call)
             print(f"  (Mock Verify for {prompt_id}): Verification FAILED (simulated).")
             return False
         print(f"  (Mock Verify for {prompt_id}): Verification PASSED (simulated).")
         return True
 
     async def main():
-        # Test Gemini
-        gemini_config = LLMConfig(
-            model_name="models/gemini-1.5-flash-preview-0514",
+        # Offline run against the mock provider (see text_simulation/mock_llm.py); no API key needed.
+        mock_config = LLMConfig(
+            model_name="mock",
             temperature=0.7, max_tokens=50, max_retries=3, max_concurrent_requests=2,
+            provider_params={"mock_latency": "lognormal:0.2:0.5", "mock_rate_429": 0.1},
             verification_callback=mock_verification_callback,
             verification_callback_args={"path_info": "/dummy/path", "fail_p2_verification_once": True} # Custom args for callback
         )
@@ -433,15 +1739,15 @@ if __name__ == "__main__":
             ("p4", "This prompt might be blocked for safety reasons.") # Test potential blocking
         ]
         
-        print("\nProcessing Gemini prompts with mock verification...")
-        results_gemini = await process_prompts_batch(prompts, gemini_config, provider="gemini", desc="Gemini Calls+Verify")
-        for pid, resp in results_gemini.items():
+        print("\nProcessing mock provider prompts with mock verification...")
+        mock_results = await process_prompts_batch(prompts, mock_config, provider="mock", desc="Mock Calls+Verify")
+        for pid, resp in mock_results.items():
             if "error" in resp and resp["error"]:
-                print(f"Gemini - Prompt {pid} FINAL ERROR: {resp['error']}")
+                print(f"Mock - Prompt {pid} FINAL ERROR: {resp['error']}")
                 if resp.get("llm_response_data") and resp["llm_response_data"] != resp: # Avoid printing self if error object *is* llm_response_data
                     print(f"  LLM data at failure: {resp['llm_response_data']}")
             else:
-                print(f"Gemini - Prompt {pid} FINAL OK. Response: '{resp.get('response_text', '')[:50]}...' Tokens: {resp.get('usage_details', {}).get('total_token_count')}")
+                print(f"Mock - Prompt {pid} FINAL OK. Response: '{resp.get('response_text', '')[:50]}...' Tokens: {resp.get('usage_details', {}).get('total_token_count')}")
         
         # Test OpenAI
         # Ensure OPENAI_API_KEY is set if you uncomment this
@@ -0,0 +1,753 @@
+"""
+Deterministic mock LLM provider, local OpenAI-compatible server and load test.
+
+Exercises the job engine (``process_prompts_batch``), rate limiting, retries
+and verification at scale without a paid API:
+
+* ``provider="mock"`` in ``llm_helper`` answers in-process through ``MockLLM``;
+* ``python text_simulation/mock_llm.py serve --port 8089`` runs an HTTP
+  stand-in for ``POST /v1/chat/completions``; point the openai provider at it
+  with ``provider_params.base_url: http://127.0.0.1:8089/v1``. It also stubs
+  the OpenAI Batch and Anthropic Message Batches APIs, so
+  ``execution_mode: batch`` runs offline too (claude: ``base_url:
+  http://127.0.0.1:8089``);
+* ``python text_simulation/mock_llm.py loadtest`` reports throughput, latency
+  percentiles and verifier overhead at 1/16/128/512 concurrent requests and
+  can compare them against a saved baseline.
+
+Both answer with survey JSON that passes verification for an answer block
+template (``mock_answer_block``, a small built-in sample by default) after a
+latency drawn from a configurable distribution, and inject 429 / 500 errors
+and incomplete answers at configurable rates. Every draw comes from an RNG
+seeded with (seed, prompt, call number of that prompt): the n-th call with a
+given prompt gets the same latency, error and answers whatever the concurrency.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import email.policy
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# One question of each type the verifier knows, shaped like the wave-4 answer blocks
+# (whose "Answers" hold the persona's real answers).
+SAMPLE_ANSWER_BLOCK = [
+    {
+        "ElementType": "Block",
+        "Questions": [
+            {"QuestionType": "DB", "QuestionText": "The following questions are about your views."},
+            {
+                "QuestionType": "MC",
+                "QuestionText": "Which of the two programs would you favor?",
+                "Options": ["I strongly favor program A", "I favor program A", "I favor program B", "I strongly favor program B"],
+                "Settings": {"Selector": "SAVR"},
+                "Answers": {"SelectedByPosition": 2, "SelectedText": "I favor program A"},
+            },
+            {
+                "QuestionType": "Matrix",
+                "QuestionText": "Would you support or oppose...",
+                "Columns": ["Strongly oppose", "Somewhat oppose", "Neither", "Somewhat support", "Strongly support"],
+                "Rows": ["Placing a tax on carbon emissions?", "A law that requires paid family leave?", "Increasing deportations?"],
+                "Answers": {"SelectedByPosition": [4, 5, 2], "SelectedText": ["Somewhat support", "Strongly support", "Somewhat oppose"]},
+            },
+            {
+                "QuestionType": "Slider",
+                "QuestionText": "The probability that Jack is one of the 30 engineers is ___%.",
+                "Statements": [""],
+                "NumericConstraints": {"MinValue": 0, "MaxValue": 100},
+                "Answers": {"Values": [30]},
+            },
+            {
+                "QuestionType": "TE",
+                "QuestionText": "In a few words, why?",
+                "Settings": {"Selector": "SL"},
+                "Answers": {"Text": "It seemed most likely."},
+            },
+        ],
+    }
+]
+
+_REASK_KEYS = re.compile(r"Answer ONLY the following questions: ((?:Q\d+(?:, )?)+)\.")
+
+
+class LatencyModel:
+    """
+    Response latency distribution, written as ``kind:arg[:arg]``.
+
+    ``fixed:S``, ``uniform:LOW:HIGH``, ``exponential:MEAN`` or
+    ``lognormal:MEDIAN:SIGMA`` (seconds); the lognormal default has the long
+    right tail of real provider latencies.
+    """
+
+    KINDS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, kind: str = "lognormal", *args: float):
+        if kind not in self.KINDS:
+            raise ValueError(f"latency kind must be one of {self.KINDS}, got {kind!r}")
+        defaults = {"fixed": (0.5,), "uniform": (0.2, 1.0), "exponential": (0.5,), "lognormal": (0.5, 0.5)}[kind]
+        self.kind = kind
+        self.args = tuple(float(a) for a in args) or defaults
+        if len(self.args) != len(defaults):
+            raise ValueError(f"{kind} latency takes {len(defaults)} argument(s), got {len(self.args)}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, *args = spec.split(":")
+        return cls(kind, *args)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.args)
+        if self.kind == "exponential":
+            return rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+        median, sigma = self.args
+        return median * math.exp(rng.gauss(0.0, sigma))
+
+    def __str__(self) -> str:
+        return ":".join([self.kind, *(f"{a:g}" for a in self.args)])
+
+
+class MockAPIError(Exception):
+    """Injected HTTP error with ``status_code``, so retry classification and rate limiting treat it like an SDK error."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _answer(question: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    question_type = question["QuestionType"]
+    if question_type == "Matrix":
+        columns = question.get("Columns") or ["1"]
+        positions = [rng.randint(1, len(columns)) for _ in (question.get("Rows") or [""])]
+        return {"Question Type": "Matrix", "Answers": {
+            "SelectedByPosition": positions, "SelectedText": [str(columns[p - 1]) for p in positions],
+        }}
+    if question_type == "Slider":
+        constraints = question.get("NumericConstraints") or {}
+        try:
+            low, high = float(constraints["MinValue"]), float(constraints["MaxValue"])
+        except (KeyError, TypeError, ValueError):
+            low, high = 0.0, 100.0
+        values = [
+            rng.randint(math.ceil(low), math.floor(high)) if math.ceil(low) <= math.floor(high) else low
+            for _ in (question.get("Statements") or [""])
+        ]
+        return {"Question Type": "Slider", "Answers": {"Values": values}}
+    if question_type == "TE":
+        return {"Question Type": "Text Entry", "Answers": {"Text": f"Mock answer {rng.randint(1, 1000)}"}}
+    options = question.get("Options") or ["Option 1"]
+    position = rng.randint(1, len(options))
+    return {"Question Type": "Single Choice", "Answers": {"SelectedByPosition": position, "SelectedText": str(options[position - 1])}}
+
+
+class MockLLM:
+    """
+    Simulated provider behaviour shared by ``provider="mock"`` and the mock server.
+
+    Args:
+        latency: Response latency distribution.
+        rate_429: Fraction of calls answered with a rate-limit error.
+        rate_500: Fraction of calls answered with a server error.
+        invalid_rate: Fraction of responses missing one answer (fails verification).
+        answer_block: Answer block template the responses satisfy.
+        seed: Seed of every random draw.
+        chars_per_token: For the reported token usage.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        rate_429: float = 0.0,
+        rate_500: float = 0.0,
+        invalid_rate: float = 0.0,
+        answer_block: Optional[List[Dict]] = None,
+        seed: int = 0,
+        chars_per_token: float = 4.0,
+    ):
+        self.latency = latency or LatencyModel()
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.invalid_rate = invalid_rate
+        self.seed = seed
+        self.chars_per_token = chars_per_token
+        self.questions = [
+            question
+            for block in (answer_block if answer_block is not None else SAMPLE_ANSWER_BLOCK)
+            for question in block["Questions"]
+            if question["QuestionType"] != "DB"
+        ]
+        self.stats = Counter()
+        self._calls = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "MockLLM":
+        """From ``provider_params``: ``mock_latency`` (e.g. "lognormal:0.5:0.5"), ``mock_rate_429``,
+        ``mock_rate_500``, ``mock_invalid_rate``, ``mock_answer_block`` (template path) and ``mock_seed``."""
+        answer_block = None
+        if params.get("mock_answer_block"):
+            with open(params["mock_answer_block"], "r", encoding="utf-8") as f:
+                answer_block = json.load(f)
+        return cls(
+            latency=LatencyModel.parse(params.get("mock_latency", "lognormal:0.5:0.5")),
+            rate_429=float(params.get("mock_rate_429", 0.0)),
+            rate_500=float(params.get("mock_rate_500", 0.0)),
+            invalid_rate=float(params.get("mock_invalid_rate", 0.0)),
+            answer_block=answer_block,
+            seed=int(params.get("mock_seed", 0)),
+            chars_per_token=float(params.get("chars_per_token", 4.0)),
+        )
+
+    def _tokens(self, text: str) -> int:
+        return int(math.ceil(len(text) / self.chars_per_token))
+
+    def plan(self, prompt: str) -> Tuple[float, Optional[int], random.Random]:
+        """(latency, injected error status or None, RNG for the answers) of the next call with ``prompt``."""
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            call_number = self._calls[digest]
+            self._calls[digest] += 1
+            self.stats["calls"] += 1
+        rng = random.Random(f"{self.seed}:{digest}:{call_number}")
+        latency = self.latency.sample(rng)
+        draw = rng.random()
+        status = 429 if draw < self.rate_429 else 500 if draw < self.rate_429 + self.rate_500 else None
+        if status is not None:
+            with self._lock:
+                self.stats[f"http_{status}"] += 1
+        return latency, status, rng
+
+    def survey_response(self, prompt: str, rng: random.Random) -> str:
+        """Survey JSON for the template; only the asked keys for a partial re-ask prompt."""
+        keys = [f"Q{i + 1}" for i in range(len(self.questions))]
+        reask = _REASK_KEYS.search(prompt)
+        if reask:
+            keys = [key for key in reask.group(1).split(", ") if key in keys]
+        answers = {}
+        for key in keys:
+            answers[key] = {**_answer(self.questions[int(key[1:]) - 1], rng), "Reasoning": "Mock reasoning."}
+        if answers and rng.random() < self.invalid_rate:
+            del answers[rng.choice(sorted(answers))]
+            with self._lock:
+                self.stats["invalid"] += 1
+        return json.dumps(answers, ensure_ascii=False)
+
+    def usage(self, prompt: str, completions: Sequence[str]) -> Dict[str, int]:
+        prompt_tokens = self._tokens(prompt)
+        completion_tokens = sum(self._tokens(text) for text in completions)
+        return {
+            "prompt_token_count": prompt_tokens,
+            "completion_token_count": completion_tokens,
+            "total_token_count": prompt_tokens + completion_tokens,
+            "cached_prompt_token_count": 0,
+        }
+
+    async def complete(self, prompt: str) -> Dict[str, Any]:
+        """One in-process call: waits the sampled latency, then answers or raises ``MockAPIError``."""
+        latency, status, rng = self.plan(prompt)
+        await asyncio.sleep(latency)
+        if status is not None:
+            raise MockAPIError(status, f"Injected mock error {status}")
+        response_text = self.survey_response(prompt, rng)
+        return {"response_text": response_text, "usage_details": self.usage(prompt, [response_text]), "provider": "mock"}
+
+
+class MockOpenAIServer:
+    """
+    Minimal asyncio HTTP/1.1 server speaking the OpenAI chat-completions protocol.
+
+    Serves ``POST /v1/chat/completions`` (including ``n`` samples) and
+    ``GET /v1/models`` from a ``MockLLM``, with keep-alive connections so
+    connection pooling behaves as against the real API. Injected 429s carry a
+    ``retry-after`` header.
+
+    For ``execution_mode: batch`` it also stubs the OpenAI Batch API
+    (``/v1/files``, ``/v1/files/{id}/content``, ``/v1/batches``) and the
+    Anthropic Message Batches API (``/v1/messages/batches`` and its
+    ``results``; point the claude provider at the server root). Files and
+    batches live in memory; a batch stays ``in_progress`` while its requests
+    run concurrently through the ``MockLLM``, and injected errors become
+    failed lines of the batch output.
+    """
+
+    def __init__(self, mock: MockLLM, host: str = "127.0.0.1", port: int = 0):
+        self.mock = mock
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._batch_tasks: set = set()
+        self._ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.base_url
+
+    async def close(self) -> None:
+        for task in list(self._batch_tasks):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "MockOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, extra_headers, payload = await self._route(method, path.split("?")[0], body, headers)
+                if isinstance(payload, bytes):  # file contents and batch results (JSONL)
+                    data, content_type = payload, "application/octet-stream"
+                else:
+                    data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}", f"content-type: {content_type}",
+                        f"content-length: {len(data)}", *(f"{k}: {v}" for k, v in extra_headers.items())]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], Any]:
+        if method == "GET" and path.endswith("/models"):
+            return 200, {}, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+        message_batch = re.search(r"/messages/batches(?:/([^/]+))?(/results)?$", path)
+        if message_batch:
+            return self._message_batches(method, message_batch.group(1), bool(message_batch.group(2)), body)
+        batch = re.search(r"/batches(?:/([^/]+))?$", path)
+        if batch:
+            return self._openai_batches(method, batch.group(1), body)
+        file = re.search(r"/files(?:/([^/]+)/content)?$", path)
+        if file:
+            return self._openai_files(method, file.group(1), body, headers.get("content-type", ""))
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return _not_found(method, path)
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {}, {"error": {"message": "Request body is not JSON", "type": "invalid_request_error"}}
+        status, payload = await self._chat_completion(request)
+        if status == 429:
+            return 429, {"retry-after": "1"}, payload
+        return status, {}, payload
+
+    async def _chat_completion(self, request: Dict[str, Any]) -> Tuple[int, Dict]:
+        # _build_chat_messages may split the prompt into a cacheable prefix and a suffix message.
+        prompt = "".join(m.get("content") or "" for m in request.get("messages", []) if m.get("role") == "user")
+        latency, status, rng = self.mock.plan(prompt)
+        await asyncio.sleep(latency)
+        if status == 429:
+            return 429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}
+        if status is not None:
+            return status, {"error": {"message": f"Injected mock error {status}", "type": "server_error"}}
+        completions = [self.mock.survey_response(prompt, rng) for _ in range(int(request.get("n") or 1))]
+        usage = self.mock.usage(prompt, completions)
+        return 200, {
+            "id": f"chatcmpl-mock-{rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [
+                {"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+                for i, text in enumerate(completions)
+            ],
+            "usage": {
+                "prompt_tokens": usage["prompt_token_count"],
+                "completion_tokens": usage["completion_token_count"],
+                "total_tokens": usage["total_token_count"],
+            },
+        }
+
+    async def _claude_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """One Message Batches result: ``succeeded`` with a message, or ``errored``."""
+        # _claude_message_kwargs may split the prompt into cache_control text blocks.
+        prompt = "".join(
+            content if isinstance(content, str) else "".join(block.get("text", "") for block in content)
+            for content in (m.get("content") or "" for m in params.get("messages", []) if m.get("role") == "user")
+        )
+        latency, status, rng = self.mock.plan(prompt)
+        await asyncio.sleep(latency)
+        if status is not None:
+            error_type = "rate_limit_error" if status == 429 else "api_error"
+            return {"type": "errored", "error": {"type": "error", "error": {"type": error_type, "message": f"Injected mock error {status}"}}}
+        text = self.mock.survey_response(prompt, rng)
+        usage = self.mock.usage(prompt, [text])
+        return {"type": "succeeded", "message": {
+            "id": f"msg_mock_{rng.getrandbits(32):08x}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model", "mock"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": usage["prompt_token_count"], "output_tokens": usage["completion_token_count"]},
+        }}
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_mock_{next(self._ids):06d}"
+
+    def _start_batch(self, run) -> None:
+        task = asyncio.ensure_future(run)
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    def _openai_files(self, method: str, file_id: Optional[str], body: bytes, content_type: str) -> Tuple[int, Dict[str, str], Any]:
+        if file_id is not None:
+            if method != "GET" or file_id not in self._files:
+                return _not_found(method, f"/files/{file_id}/content")
+            return 200, {}, self._files[file_id]
+        if method != "POST":
+            return _not_found(method, "/files")
+        form = BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()}
+        if "file" not in fields:
+            return 400, {}, {"error": {"message": "Missing multipart field 'file'", "type": "invalid_request_error"}}
+        file_id = self._new_id("file")
+        self._files[file_id] = fields["file"].get_payload(decode=True)
+        purpose = fields["purpose"].get_content().strip() if "purpose" in fields else "batch"
+        return 200, {}, {
+            "id": file_id, "object": "file", "bytes": len(self._files[file_id]), "created_at": int(time.time()),
+            "filename": fields["file"].get_filename() or file_id, "purpose": purpose, "status": "processed",
+        }
+
+    def _openai_batches(self, method: str, batch_id: Optional[str], body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        if batch_id is not None:
+            if method != "GET" or batch_id not in self._batches:
+                return _not_found(method, f"/batches/{batch_id}")
+            return 200, {}, self._batches[batch_id]
+        if method != "POST":
+            return _not_found(method, "/batches")
+        request = json.loads(body)
+        if request.get("input_file_id") not in self._files:
+            return 400, {}, {"error": {"message": f"Unknown input file {request.get('input_file_id')}", "type": "invalid_request_error"}}
+        lines = [json.loads(line) for line in self._files[request["input_file_id"]].splitlines() if line.strip()]
+        batch_id = self._new_id("batch")
+        batch = self._batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window", "24h"),
+            "status": "in_progress", "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+        }
+
+        async def run():
+            results = await asyncio.gather(*(self._chat_completion(line.get("body") or {}) for line in lines))
+            output, errors = [], []
+            for i, (line, (status, payload)) in enumerate(zip(lines, results)):
+                entry = {"id": f"batch_req_{i}", "custom_id": line.get("custom_id"), "error": None,
+                         "response": {"status_code": status, "request_id": f"req_{i}", "body": payload}}
+                (output if status == 200 else errors).append(json.dumps(entry))
+            for kind, entries in (("output_file_id", output), ("error_file_id", errors)):
+                if entries:
+                    file_id = self._new_id("file")
+                    self._files[file_id] = ("\n".join(entries) + "\n").encode("utf-8")
+                    batch[kind] = file_id
+            batch["request_counts"].update(completed=len(output), failed=len(errors))
+            batch.update(status="completed", completed_at=int(time.time()))
+
+        self._start_batch(run())
+        return 200, {}, batch
+
+    def _message_batches(self, method: str, batch_id: Optional[str], results: bool, body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        if batch_id is not None:
+            if method != "GET" or batch_id not in self._batches:
+                return _not_found(method, f"/messages/batches/{batch_id}")
+            batch = self._batches[batch_id]
+            if results:
+                if batch["processing_status"] != "ended":
+                    return 400, {}, {"type": "error", "error": {"type": "invalid_request_error", "message": "Batch has not ended"}}
+                return 200, {}, self._files[batch_id]
+            return 200, {}, batch
+        if method != "POST":
+            return _not_found(method, "/messages/batches")
+        requests = json.loads(body).get("requests", [])
+        batch_id = self._new_id("msgbatch")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        batch = self._batches[batch_id] = {
+            "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+            "request_counts": {"processing": len(requests), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": now.isoformat(), "expires_at": (now + datetime.timedelta(days=1)).isoformat(),
+            "ended_at": None, "archived_at": None, "cancel_initiated_at": None, "results_url": None,
+        }
+
+        async def run():
+            outcomes = await asyncio.gather(*(self._claude_message(request.get("params") or {}) for request in requests))
+            self._files[batch_id] = "".join(
+                json.dumps({"custom_id": request.get("custom_id"), "result": outcome}) + "\n"
+                for request, outcome in zip(requests, outcomes)
+            ).encode("utf-8")
+            succeeded = sum(outcome["type"] == "succeeded" for outcome in outcomes)
+            batch["request_counts"].update(processing=0, succeeded=succeeded, errored=len(outcomes) - succeeded)
+            batch.update(
+                processing_status="ended",
+                ended_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                results_url=f"http://{self.host}:{self.port}/v1/messages/batches/{batch_id}/results",
+            )
+
+        self._start_batch(run())
+        return 200, {}, batch
+
+
+def _not_found(method: str, path: str) -> Tuple[int, Dict[str, str], Dict]:
+    return 404, {}, {"error": {"message": f"Unknown endpoint {method} {path}", "type": "invalid_request_error"}}
+
+
+def start_server_thread(mock: MockLLM, host: str = "127.0.0.1", port: int = 0) -> Tuple[MockOpenAIServer, threading.Thread]:
+    """Run a ``MockOpenAIServer`` on its own event loop in a daemon thread, so it does not share the client's loop."""
+    server = MockOpenAIServer(mock, host, port)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="mock-openai-server", daemon=True)
+    thread.start()
+    ready.wait()
+    return server, thread
+
+
+def mock_params(args) -> Dict[str, Any]:
+    params = {
+        "mock_latency": args.latency,
+        "mock_rate_429": args.rate_429,
+        "mock_rate_500": args.rate_500,
+        "mock_invalid_rate": args.invalid_rate,
+        "mock_seed": args.seed,
+    }
+    if args.answer_block:
+        params["mock_answer_block"] = args.answer_block
+    return params
+
+
+async def _load_test_level(args, concurrency: int, num_jobs: int, work_dir: Path, base_url: Optional[str]) -> Dict[str, Any]:
+    from text_simulation.create_text_simulation_input import COMBINED_PROMPT_SEPARATOR
+    from text_simulation.llm_helper import LLMConfig, make_verification_executor, process_prompts_batch
+    from text_simulation.retry_policy import RetryPolicy
+    from text_simulation.run_LLM_simulations import save_and_verify_response
+    from text_simulation.run_metrics import RunMetrics
+
+    answer_block = SAMPLE_ANSWER_BLOCK
+    if args.answer_block:
+        with open(args.answer_block, "r", encoding="utf-8") as f:
+            answer_block = json.load(f)
+    blocks_dir = work_dir / "answer_blocks"
+    blocks_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for persona in range(args.personas):
+        pid = f"pid_{persona + 1}"
+        with open(blocks_dir / f"{pid}_wave4_Q_wave4_A.json", "w", encoding="utf-8") as f:
+            json.dump(answer_block, f)
+        prompt = f"Persona {pid}\n" + "x" * args.prompt_chars + COMBINED_PROMPT_SEPARATOR + "Answer the survey questions."
+        jobs.append((pid, prompt))
+    prompts = [
+        (f"{pid}_sim{i // args.personas + 1:04d}", prompt)
+        for i, (pid, prompt) in ((i, jobs[i % args.personas]) for i in range(num_jobs))
+    ]
+
+    provider_params = {"chars_per_token": 4.0}
+    if base_url:
+        provider = "openai"
+        provider_params["base_url"] = base_url
+    else:
+        provider = "mock"
+        provider_params.update(mock_params(args))
+    verification_executor = make_verification_executor(args.verification_executor)
+    config = LLMConfig(
+        model_name="mock",
+        max_retries=3,
+        max_concurrent_requests=concurrency,
+        provider_params=provider_params,
+        verification_callback=save_and_verify_response if not args.no_verify else None,
+        verification_callback_args={
+            "output_root": str(work_dir / "out"),
+            "question_json_base_dir": str(blocks_dir),
+            "imputed_output_format": args.imputed_output_format,
+        },
+        verification_executor=verification_executor,
+        retry_policy=RetryPolicy(base_delay=0.05, max_delay=1.0),
+    )
+    metrics = RunMetrics()
+    try:
+        await process_prompts_batch(
+            prompts, config, provider=provider, desc=f"concurrency {concurrency}", collect_results=False, metrics=metrics,
+        )
+    finally:
+        verification_executor.shutdown(wait=True)
+    snapshot = metrics.snapshot()
+    stages = snapshot["stages"]
+    latency_total = stages["latency_s"]["total_s"] or 1e-9
+    verify_total = stages["verify_s"]["total_s"] + stages["verify_wait_s"]["total_s"]
+    return {
+        "concurrency": concurrency,
+        "jobs": snapshot["jobs"],
+        "elapsed_s": snapshot["elapsed_s"],
+        "jobs_per_s": snapshot["jobs_per_s"],
+        "latency_s": {k: stages["latency_s"][k] for k in ("p50", "p95", "p99")},
+        "request_s": {k: stages["request_s"][k] for k in ("p50", "p95", "p99")},
+        "verify_ms_per_job": round(1000 * stages["verify_s"]["total_s"] / max(snapshot["jobs"], 1), 3),
+        "verifier_share": round(verify_total / latency_total, 4),
+        "statuses": snapshot["statuses"],
+        "api_retries": snapshot["api_retries"],
+    }
+
+
+def load_test(args) -> List[Dict[str, Any]]:
+    server = None
+    base_url = args.base_url
+    if args.target == "http" and not base_url:
+        server, _ = start_server_thread(MockLLM.from_params(mock_params(args)))
+        base_url = server.base_url
+    if base_url:
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+    results = []
+    for concurrency in args.concurrency:
+        num_jobs = args.jobs or max(args.min_jobs, args.jobs_per_worker * concurrency)
+        with tempfile.TemporaryDirectory(prefix="mock_llm_load_test_") as work_dir, \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # per-response verifier output
+            results.append(asyncio.run(_load_test_level(args, concurrency, num_jobs, Path(work_dir), base_url)))
+    return results
+
+
+def format_load_test(results: List[Dict[str, Any]]) -> str:
+    lines = [f"{'conc':>5} {'jobs':>6} {'jobs/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'verify/job':>11} {'verifier':>9}  statuses"]
+    for r in results:
+        latency = r["latency_s"]
+        lines.append(
+            f"{r['concurrency']:>5} {r['jobs']:>6} {r['jobs_per_s']:>9.1f} {latency['p50']:>7.3f}s {latency['p95']:>7.3f}s "
+            f"{latency['p99']:>7.3f}s {r['verify_ms_per_job']:>9.2f}ms {r['verifier_share']:>8.1%}  {r['statuses']}"
+        )
+    return "\n".join(lines)
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Concurrency levels whose throughput fell more than ``tolerance`` below the baseline."""
+    previous = {r["concurrency"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r["concurrency"])
+        if before and r["jobs_per_s"] < (1 - tolerance) * before["jobs_per_s"]:
+            regressions.append(
+                f"concurrency {r['concurrency']}: {r['jobs_per_s']:.1f} jobs/s vs baseline {before['jobs_per_s']:.1f}"
+            )
+    return regressions
+
+
+def _add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:0.5:0.5",
+                        help="Latency distribution: fixed:S, uniform:LOW:HIGH, exponential:MEAN or lognormal:MEDIAN:SIGMA.")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of calls answered with 429.")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of calls answered with 500.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of responses missing one answer.")
+    parser.add_argument("--answer-block", default=None, help="Answer block template JSON (default: built-in sample).")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock LLM server and offline load test for llm_helper.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run an OpenAI-compatible mock chat-completions server.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8089)
+    _add_mock_arguments(serve)
+
+    load = commands.add_parser("loadtest", help="Measure throughput, latency and verifier overhead per concurrency level.")
+    load.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128, 512])
+    load.add_argument("--target", choices=["inproc", "http"], default="inproc",
+                      help="inproc: provider='mock'; http: openai provider against a mock server (started in a thread).")
+    load.add_argument("--base-url", default=None, help="Use an already running mock server (implies the http target).")
+    load.add_argument("--jobs", type=int, default=None, help="Jobs per level (default: max(min-jobs, jobs-per-worker x concurrency)).")
+    load.add_argument("--jobs-per-worker", type=int, default=8)
+    load.add_argument("--min-jobs", type=int, default=200)
+    load.add_argument("--personas", type=int, default=20)
+    load.add_argument("--prompt-chars", type=int, default=8000, help="Size of each persona prompt.")
+    load.add_argument("--verification-executor", choices=["thread", "process"], default="thread")
+    load.add_argument("--imputed-output-format", choices=["blocks", "jsonl"], default="blocks")
+    load.add_argument("--no-verify", action="store_true", help="Skip save + verification, measuring the request path only.")
+    load.add_argument("--output", default=None, help="Write the results as JSON (e.g. to use as a baseline).")
+    load.add_argument("--baseline", default=None, help="Results JSON of an earlier run; exit 1 on a throughput regression.")
+    load.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop against the baseline.")
+    _add_mock_arguments(load)
+    load.set_defaults(latency="lognormal:0.05:0.5")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        async def serve_forever():
+            async with MockOpenAIServer(MockLLM.from_params(mock_params(args)), args.host, args.port) as server:
+                print(f"Mock OpenAI server on {server.base_url} (latency {args.latency}, 429 {args.rate_429:.0%}, 500 {args.rate_500:.0%})")
+                await asyncio.Event().wait()
+
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    results = load_test(args)
+    print(format_load_test(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 import os
 import json
 import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 import re # Import regex for parsing
-import copy
-from typing import Union, List, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Union, List, Dict, Any, Tuple, Optional
+
+try:
+    import orjson  # optional: several times faster than json for response parsing
+except ImportError:
+    orjson = None
 
 def is_valid_number(value: Any) -> bool:
     """Check if a value is a valid number (integer or float)."""
@@ -151,6 +159,13 @@ def validate_text_entry_response(response: Dict, question: Dict) -> bool:
     
     return True
 
+RESPONSE_VALIDATORS = {
+    "Matrix": validate_matrix_response,
+    "Single Choice": validate_single_choice_response,
+    "Slider": validate_slider_response,
+    "Text Entry": validate_text_entry_response
+}
+
 def validate_response(response: Any, question: Dict) -> bool:
     """
     Validate response based on question type.
@@ -172,14 +187,7 @@ def validate_response(response: Any, question: Dict) -> bool:
     if not question_type or not answers:
         return False
     
-    validation_functions = {
-        "Matrix": validate_matrix_response,
-        "Single Choice": validate_single_choice_response,
-        "Slider": validate_slider_response,
-        "Text Entry": validate_text_entry_response
-    }
-    
-    validation_func = validation_functions.get(question_type)
+    validation_func = RESPONSE_VALIDATORS.get(question_type)
     if not validation_func:
         return False
     
@@ -270,75 +278,299 @@ def validate_response(response: Any, question: Dict) -> bool:
 #         return False
 #     return True
 
-def update_question_json_with_response(qid, answer_block_json_path, simulation_response_data, output_dir):
+_FENCED_BLOCK = re.compile(r"```(?:json|JSON)?[ \t]*\r?\n?(.*?)```", re.DOTALL)
+
+def _loads(text):
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass  # json also accepts NaN/Infinity and a few other non-standard tokens
+    return json.loads(text)
+
+def extract_response_json(response_text):
     """
-    Load an answer block JSON, update its 'Answers' field using simulation output,
-    and save to simulation-specific output directory.
+    Parse the JSON object out of an LLM response in a single pass.
+
+    Tries, in order: a ```json fenced block, the whole text, any other fenced
+    block, and finally the outermost ``{...}`` span, so stray prose around the
+    answer does not force a retry. Raises ``ValueError`` when nothing parses.
     """
-    try:
-        with open(answer_block_json_path, 'r', encoding='utf-8') as f:
-            answer_block_data = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: Answer block JSON not found: {answer_block_json_path}")
-        return False
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode answer block JSON: {answer_block_json_path}")
-        return False
+    candidates = []
+    fenced = _FENCED_BLOCK.findall(response_text)
+    if "```json" in response_text:
+        start = response_text.index("```json") + len("```json")
+        end = response_text.find("```", start)
+        candidates.append(response_text[start:end if end != -1 else len(response_text)])
+    candidates.append(response_text)
+    candidates.extend(fenced)
+    first, last = response_text.find("{"), response_text.rfind("}")
+    if first != -1 and last > first:
+        candidates.append(response_text[first:last + 1])
+
+    error = None
+    for candidate in candidates:
+        candidate = candidate.strip()
+        if not candidate:
+            continue
+        try:
+            return _loads(candidate)
+        except ValueError as e:
+            error = error or e
+    raise ValueError(f"No JSON object found in response: {error}")
+
+class AnswerBlockValidator:
+    """
+    Validation rules of one answer block template, compiled once.
+
+    Holds the ordered non-DB questions ("Q1", "Q2", ...) with their slider
+    ranges pre-parsed, so a response is checked in one linear pass without
+    re-walking the blocks or re-deriving the rules. The accepted answers are
+    exactly those ``validate_response`` accepts.
+    """
+
+    def __init__(self, answer_block_template):
+        self.questions = []
+        for block in answer_block_template:
+            for question in block['Questions']:
+                if question['QuestionType'] == 'DB':
+                    continue
+                constraints = question.get("NumericConstraints") or {}
+                slider_range = None
+                if is_valid_number(constraints.get("MinValue")) and is_valid_number(constraints.get("MaxValue")):
+                    slider_range = (float(constraints["MinValue"]), float(constraints["MaxValue"]))
+                self.questions.append({
+                    "key": f"Q{len(self.questions) + 1}",
+                    "slider_range": slider_range,
+                    "question": question,
+                })
+
+    def _valid(self, response, spec):
+        if not isinstance(response, dict):
+            return False
+        question_type = response.get("QuestionType") or response.get("Question Type")
+        answers = response.get("Answers")
+        if not question_type or not answers:
+            return False
+        if question_type == "Slider":
+            if not isinstance(answers, dict) or not isinstance(answers.get("Values"), list):
+                return False
+            values = answers["Values"]
+            if not all(is_valid_number(val) for val in values):
+                return False
+            if spec["slider_range"] is not None:
+                min_val, max_val = spec["slider_range"]
+                return all(min_val <= float(val) <= max_val for val in values)
+            return True
+        validation_func = RESPONSE_VALIDATORS.get(question_type)
+        if validation_func is None:
+            return False
+        try:
+            return validation_func(answers, spec["question"])
+        except (TypeError, ValueError, KeyError, AttributeError, IndexError):
+            return False  # malformed answers (e.g. a number where a list is expected) are invalid, not fatal
+
+    def impute(self, response_text_json):
+        """Returns ``(imputed, failed_responses, validation_failures)``; see ``impute_answers``."""
+        if not isinstance(response_text_json, dict):
+            return {}, len(self.questions), 0
+        imputed = {}
+        failed_responses = 0
+        validation_failures = 0
+        for spec in self.questions:
+            retrieved_response = response_text_json.get(spec["key"])
+            if retrieved_response is None:
+                failed_responses += 1
+            elif not self._valid(retrieved_response, spec):
+                validation_failures += 1
+            else:
+                answer = {"Answers": retrieved_response["Answers"]}
+                if "Reasoning" in retrieved_response:
+                    answer["Reasoning"] = retrieved_response["Reasoning"]
+                imputed[spec["key"]] = answer
+        return imputed, failed_responses, validation_failures
+
+    def failed_keys(self, response_text_json):
+        """Question keys ("Qn") that are missing or invalid in a parsed response."""
+        if not isinstance(response_text_json, dict):
+            return [spec["key"] for spec in self.questions]
+        return [
+            spec["key"] for spec in self.questions
+            if response_text_json.get(spec["key"]) is None or not self._valid(response_text_json[spec["key"]], spec)
+        ]
+
+ANSWER_BLOCK_TEMPLATE_CACHE_SIZE = 256
+_answer_block_templates: "OrderedDict[str, Tuple[int, Any, AnswerBlockValidator]]" = OrderedDict()
+_answer_block_templates_lock = threading.Lock()
+
+def _load_answer_block(answer_block_json_path):
+    mtime = os.stat(answer_block_json_path).st_mtime_ns
+    with _answer_block_templates_lock:
+        cached = _answer_block_templates.get(answer_block_json_path)
+        if cached is not None and cached[0] == mtime:
+            _answer_block_templates.move_to_end(answer_block_json_path)
+            return cached[1], cached[2]
+    with open(answer_block_json_path, 'rb') as f:
+        answer_block_data = _loads(f.read())
+    validator = AnswerBlockValidator(answer_block_data)
+    with _answer_block_templates_lock:
+        _answer_block_templates[answer_block_json_path] = (mtime, answer_block_data, validator)
+        _answer_block_templates.move_to_end(answer_block_json_path)
+        while len(_answer_block_templates) > ANSWER_BLOCK_TEMPLATE_CACHE_SIZE:
+            _answer_block_templates.popitem(last=False)
+    return answer_block_data, validator
+
+def load_answer_block_template(answer_block_json_path):
+    """
+    Parsed answer block template from a per-process LRU cache.
+
+    Entries are keyed by path and validated against the file's mtime, so an
+    edited template is re-read. Every simulation of a persona shares one
+    template; the returned data is shared and must not be mutated.
+    """
+    return _load_answer_block(answer_block_json_path)[0]
+
+def load_answer_block_validator(answer_block_json_path):
+    """Compiled ``AnswerBlockValidator`` for a template, cached with it."""
+    return _load_answer_block(answer_block_json_path)[1]
+
+IMPUTED_OUTPUT_FORMATS = ("blocks", "jsonl")
+
+def impute_answers(qid, answer_block_template, response_text_json, validator: Optional[AnswerBlockValidator] = None):
+    """
+    Validated answers from a parsed LLM response, keyed by question index.
+
+    Non-DB questions of the template are numbered Q1, Q2, ... in order. Returns
+    ``(imputed, failed_responses, validation_failures)`` where ``imputed`` maps
+    "Qn" to ``{"Answers": ..., "Reasoning": ...}`` for every valid answer.
+    Pass the template's cached ``validator`` to skip compiling it again.
+    """
+    if validator is None:
+        validator = AnswerBlockValidator(answer_block_template)
+    imputed, failed_responses, validation_failures = validator.impute(response_text_json)
+
+    if failed_responses or validation_failures:
+        print(f"Warning: {failed_responses} failed, {validation_failures} invalid for {qid}")
+    return imputed, failed_responses, validation_failures
+
+def apply_imputed_answers(answer_block_template, imputed):
+    """
+    Answer blocks with ``imputed`` (``{"Qn": {"Answers", "Reasoning"}}``) answers merged in.
 
+    Non-DB questions are numbered Q1, Q2, ... in template order. The template is
+    cached and shared, so updated questions are shallow copies instead of
+    in-place edits of a deep-copied template. Also used by evaluation/json2csv.py
+    to expand compact JSONL answers, so both produce the same blocks.
+    """
+    count = 0
+    answer_block_data = []
+    for block in answer_block_template:
+        questions = []
+        for question in block.get('Questions', []):
+            if question.get('QuestionType') != 'DB':
+                count += 1
+                answer = imputed.get(f"Q{count}")
+                if answer is not None:
+                    question = {**question, "Original_Answers": question.get("Answers"), "Answers": answer["Answers"]}
+                    if "Reasoning" in answer:
+                        question['LLM_Reasoning'] = answer["Reasoning"]
+            questions.append(question)
+        answer_block_data.append({**block, 'Questions': questions})
+    return answer_block_data
+
+def _parse_response_text(qid, simulation_response_data):
+    """Parsed JSON answer object from a simulation response, or None."""
     response_text = simulation_response_data.get("response_text")
     if not response_text:
         print(f"Warning: No response_text found for {qid}. Skipping.")
-        return False
-
-    # 保存原始 response_text 以便 debug
-    raw_dir = os.path.join(output_dir, "llm_response_text")
-    os.makedirs(raw_dir, exist_ok=True)
-    with open(os.path.join(raw_dir, f"{qid}_response_text.txt"), "w", encoding="utf-8") as f:
-        f.write(response_text)
+        return None
 
     # 尝试解析 JSON 格式的响应
     try:
-        if "```json" in response_text:
-            response_text_json = json.loads(response_text.split("```json")[1].split("```")[0])
-        else:
-            response_text_json = json.loads(response_text)
-    except (json.JSONDecodeError, IndexError) as e:
+        return extract_response_json(response_text)
+    except ValueError as e:
         print(f"Error parsing response JSON for {qid}: {e}")
-        return False
+        return None
 
-    count = 0
-    failed_responses = 0
-    validation_failures = 0
-
-    for block in answer_block_data:
-        for question in block['Questions']:
-            if question['QuestionType'] != 'DB':
-                count += 1
-                try:
-                    retrieved_response = response_text_json.get(f"Q{count}")
-                    if retrieved_response is None:
-                        failed_responses += 1
-                        continue
+def _load_template_or_report(answer_block_json_path):
+    try:
+        return _load_answer_block(answer_block_json_path)
+    except FileNotFoundError:
+        print(f"Error: Answer block JSON not found: {answer_block_json_path}")
+    except ValueError:
+        print(f"Error: Could not decode answer block JSON: {answer_block_json_path}")
+    return None, None
 
-                    if not validate_response(retrieved_response, question):
-                        validation_failures += 1
-                        continue
+def update_question_json_with_response(qid, answer_block_json_path, simulation_response_data, output_dir):
+    """
+    Load an answer block JSON, update its 'Answers' field using simulation output,
+    and save to simulation-specific output directory.
+    """
+    answer_block_template, validator = _load_template_or_report(answer_block_json_path)
+    if answer_block_template is None:
+        return False
 
-                    question["Original_Answers"] = copy.deepcopy(question["Answers"])
-                    question['Answers'] = retrieved_response["Answers"]
-                    if "Reasoning" in retrieved_response:
-                        question['LLM_Reasoning'] = retrieved_response["Reasoning"]
-                except KeyError:
-                    failed_responses += 1
-                    continue
+    response_text = simulation_response_data.get("response_text")
+    if response_text:
+        # 保存原始 response_text 以便 debug
+        raw_dir = os.path.join(output_dir, "llm_response_text")
+        os.makedirs(raw_dir, exist_ok=True)
+        with open(os.path.join(raw_dir, f"{qid}_response_text.txt"), "w", encoding="utf-8") as f:
+            f.write(response_text)
+
+    response_text_json = _parse_response_text(qid, simulation_response_data)
+    if response_text_json is None:
+        return False
 
-    if failed_responses or validation_failures:
-        print(f"Warning: {failed_responses} failed, {validation_failures} invalid for {qid}")
+    imputed, failed_responses, validation_failures = impute_answers(qid, answer_block_template, response_text_json, validator)
+    answer_block_data = apply_imputed_answers(answer_block_template, imputed)
 
     # ✅ 保存到 simulation 独立目录
     output_path = os.path.join(output_dir, os.path.basename(answer_block_json_path))
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(answer_block_data, f, indent=2)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(answer_block_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(answer_block_data, f, indent=2)
+
+    return not (failed_responses or validation_failures)
+
+def append_imputed_answers_record(qid, answer_block_json_path, simulation_response_data, output_path):
+    """
+    Compact alternative to ``update_question_json_with_response``.
+
+    Appends one JSON line ``{"persona_id", "simulation_id", "answers", ...}``
+    holding only the imputed answers and reasoning to a per-persona JSONL file,
+    instead of a full answer-block copy plus a raw-text file per simulation.
+    Lines are written with a single O_APPEND write, so concurrent workers can
+    share one file. Readers keep the last line per simulation_id.
+    """
+    answer_block_template, validator = _load_template_or_report(answer_block_json_path)
+    if answer_block_template is None:
+        return False
+    response_text_json = _parse_response_text(qid, simulation_response_data)
+    if response_text_json is None:
+        return False
+
+    imputed, failed_responses, validation_failures = impute_answers(qid, answer_block_template, response_text_json, validator)
+    record = {
+        "persona_id": qid.split("_sim")[0],
+        "simulation_id": qid,
+        "answers": imputed,
+        "failed": failed_responses,
+        "invalid": validation_failures,
+    }
+    if orjson is not None:
+        line = orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
 
     return not (failed_responses or validation_failures)
 
@@ -373,19 +605,20 @@ def update_question_json_with_response(qid, answer_block_json_path, simulation_r
 #     )
 #     return success
 
-def postprocess_simulation_outputs_with_pid(question_id, simulation_output_dir, question_json_base_dir, output_updated_questions_dir):
+def postprocess_simulation_response(question_id, simulation_response_data, question_json_base_dir, output_updated_questions_dir, output_format="blocks", verbose=True):
     """
-    Finds existing simulation outputs, matches them with original answer block JSONs,
-    and updates the answer block JSONs with the generated responses.
+    Update the persona's answer block template with an in-memory simulation response.
 
-    Example expected structure:
-        ./text_simulation_output_with_context/pid_574/pid_574_sim001/pid_574_sim001_response.json
-        ./data/mega_persona_json/answer_blocks/pid_574_wave4_Q_wave4_A.json
-        ↓
-        ./text_simulation_output_with_context/answer_blocks_llm_imputed/pid_574/pid_574_sim001/pid_574_sim001_wave4_Q_wave4_A.json
-    """
-    import os, json
+    Same output as ``postprocess_simulation_outputs_with_pid`` but takes the
+    response dict directly, so a caller that has just produced the response
+    does not need to write and re-read it.
 
+    ``output_format="jsonl"`` appends a compact record to
+    ``<output_updated_questions_dir>/<pid>.jsonl`` instead of writing a full
+    answer-block copy per simulation.
+    """
+    if output_format not in IMPUTED_OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {IMPUTED_OUTPUT_FORMATS}, got {output_format!r}")
     answer_block_suffix = "_wave4_Q_wave4_A.json"
 
     # ① 解析 simulation id，例如 "pid_574_sim001"
@@ -398,6 +631,126 @@ def postprocess_simulation_outputs_with_pid(question_id, simulation_output_dir,
         print(f"⚠️ Base answer block not found: {base_answer_block_path}")
         return False
 
+    if output_format == "jsonl":
+        sim_output_dir = os.path.join(output_updated_questions_dir, f"{base_pid}.jsonl")
+        success = append_imputed_answers_record(
+            question_id,
+            base_answer_block_path,
+            simulation_response_data,
+            sim_output_dir
+        )
+    else:
+        # ④ 创建 simulation 专属输出目录
+        sim_output_dir = os.path.join(output_updated_questions_dir, base_pid, question_id)
+        os.makedirs(sim_output_dir, exist_ok=True)
+
+        # ⑤ 调用核心更新函数：将 LLM 的回答写入模板问卷中
+        success = update_question_json_with_response(
+            question_id,
+            base_answer_block_path,     # ✅ 直接使用 base 模板
+            simulation_response_data,
+            sim_output_dir              # ✅ 输出到 imputed 结果目录
+        )
+
+    # ⑥ 打印结果
+    if verbose:
+        if success:
+            print(f"[Verified ✅] Updated {persona_id} → {sim_output_dir}")
+        else:
+            print(f"[❌ Verification failed] {persona_id}")
+
+    return success
+
+
+def unanswered_question_keys(question_id, simulation_response_data, question_json_base_dir):
+    """
+    ``(failed_keys, total_keys)``: the missing or invalid "Qn" keys of a
+    simulation response and the number of questions it should answer.
+
+    Returns None when the response cannot be checked per question (no
+    template, or no parseable JSON), i.e. when only a full re-ask helps.
+    """
+    base_pid = question_id.split("_sim")[0]
+    answer_block_path = os.path.join(question_json_base_dir, f"{base_pid}_wave4_Q_wave4_A.json")
+    if not os.path.exists(answer_block_path):
+        return None
+    _, validator = _load_template_or_report(answer_block_path)
+    response_text = simulation_response_data.get("response_text")
+    if validator is None or not response_text:
+        return None
+    try:
+        response_text_json = extract_response_json(response_text)
+    except ValueError:
+        return None
+    if not isinstance(response_text_json, dict):
+        return None
+    return validator.failed_keys(response_text_json), len(validator.questions)
+
+
+class PartialReask:
+    """
+    Re-ask only the failed questions of a response instead of the whole survey.
+
+    ``prompt`` appends an instruction listing the failed "Qn" keys to the
+    original prompt (so the persona prefix stays cacheable), and ``merge``
+    splices the answers of the follow-up response into the previous one.
+    When more than ``max_fraction`` of the questions failed, a full re-ask
+    costs about the same and is used instead.
+    """
+
+    def __init__(self, max_fraction=0.5):
+        self.max_fraction = max_fraction
+
+    def worthwhile(self, failed_keys, total_questions):
+        return bool(failed_keys) and len(failed_keys) <= self.max_fraction * max(total_questions, 1)
+
+    def prompt(self, prompt_text, failed_keys):
+        keys = ", ".join(failed_keys)
+        return (
+            f"{prompt_text}\n\n"
+            f"IMPORTANT: Answer ONLY the following questions: {keys}. "
+            f"Return a single JSON object whose keys are exactly {keys}, "
+            f"each answer in the same format as requested above."
+        )
+
+    def merge(self, previous_response_data, partial_response_data, failed_keys):
+        """Response data with the failed keys replaced, or None if either response does not parse."""
+        try:
+            previous = extract_response_json(previous_response_data.get("response_text") or "")
+            partial = extract_response_json(partial_response_data.get("response_text") or "")
+        except ValueError:
+            return None
+        if not isinstance(previous, dict) or not isinstance(partial, dict):
+            return None
+        merged = dict(previous)
+        for key in failed_keys:
+            if key in partial:
+                merged[key] = partial[key]
+        usage = dict(previous_response_data.get("usage_details") or {})
+        for key, value in (partial_response_data.get("usage_details") or {}).items():
+            if isinstance(value, (int, float)) and isinstance(usage.get(key, 0), (int, float)):
+                usage[key] = usage.get(key, 0) + value
+        return {
+            **previous_response_data,
+            "response_text": json.dumps(merged, ensure_ascii=False),
+            "usage_details": usage,
+            "reasked_keys": sorted(set(previous_response_data.get("reasked_keys", [])) | set(failed_keys)),
+        }
+
+
+def postprocess_simulation_outputs_with_pid(question_id, simulation_output_dir, question_json_base_dir, output_updated_questions_dir):
+    """
+    Finds existing simulation outputs, matches them with original answer block JSONs,
+    and updates the answer block JSONs with the generated responses.
+
+    Example expected structure:
+        ./text_simulation_output_with_context/pid_574/pid_574_sim001/pid_574_sim001_response.json
+        ./data/mega_persona_json/answer_blocks/pid_574_wave4_Q_wave4_A.json
+        ↓
+        ./text_simulation_output_with_context/answer_blocks_llm_imputed/pid_574/pid_574_sim001/pid_574_sim001_wave4_Q_wave4_A.json
+    """
+    base_pid = question_id.split("_sim")[0]
+
     # ② 查找 simulation 的 LLM 输出文件
     response_filename = f"{question_id}_response.json"
     response_file_path = os.path.join(simulation_output_dir, base_pid, question_id, response_filename)
@@ -410,29 +763,16 @@ def postprocess_simulation_outputs_with_pid(question_id, simulation_output_dir,
         with open(response_file_path, 'r', encoding='utf-8') as f:
             simulation_response_data = json.load(f)
     except Exception as e:
-        print(f"❌ Error reading response JSON for {persona_id}: {e}")
+        print(f"❌ Error reading response JSON for {base_pid}: {e}")
         return False
 
-    # ④ 创建 simulation 专属输出目录
-    sim_output_dir = os.path.join(output_updated_questions_dir, base_pid, question_id)
-    os.makedirs(sim_output_dir, exist_ok=True)
-
-    # ⑤ 调用核心更新函数：将 LLM 的回答写入模板问卷中
-    success = update_question_json_with_response(
+    return postprocess_simulation_response(
         question_id,
-        base_answer_block_path,     # ✅ 直接使用 base 模板
         simulation_response_data,
-        sim_output_dir              # ✅ 输出到 imputed 结果目录
+        question_json_base_dir,
+        output_updated_questions_dir,
     )
 
-    # ⑥ 打印结果
-    if success:
-        print(f"[Verified ✅] Updated {persona_id} → {sim_output_dir}")
-    else:
-        print(f"[❌ Verification failed] {persona_id}")
-
-    return success
-
 
 
 def postprocess_simulation_outputs(simulation_output_dir, question_json_base_dir, output_updated_questions_dir):
@@ -492,19 +832,170 @@ def postprocess_simulation_outputs(simulation_output_dir, question_json_base_dir
 
     print(f"Postprocessing complete. Successful updates: {successful_updates}, Failed/Skipped: {failed_or_skipped}.")
 
+POSTPROCESS_STATE_FILENAME = ".postprocess_state.json"
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def discover_simulation_responses(run_root):
+    """
+    All simulation response files of a run, grouped by persona.
+
+    Expects the ``<run_root>/pid_XXX/pid_XXX_simNNN/pid_XXX_simNNN_response.json``
+    layout written by run_LLM_simulations.py; returns
+    ``{pid: [(question_id, response_path), ...]}``.
+    """
+    responses = {}
+    with os.scandir(run_root) as persona_entries:
+        for persona_entry in persona_entries:
+            if not persona_entry.is_dir() or not persona_entry.name.startswith("pid_"):
+                continue
+            sims = []
+            with os.scandir(persona_entry.path) as sim_entries:
+                for sim_entry in sim_entries:
+                    if not sim_entry.is_dir() or "_sim" not in sim_entry.name:
+                        continue
+                    response_path = os.path.join(sim_entry.path, f"{sim_entry.name}_response.json")
+                    if os.path.exists(response_path):
+                        sims.append((sim_entry.name, response_path))
+            if sims:
+                responses[persona_entry.name] = sorted(sims)
+    return responses
+
+def _postprocess_persona_outputs(args):
+    """
+    Worker: re-impute every simulation of one persona.
+
+    A simulation is skipped when the hash of its inputs (response file,
+    template, output format and this module's source) matches the previous
+    run, so editing a validator here re-imputes everything while a plain
+    re-run is nearly free. Returns ``(pid, [(question_id, digest, ok, skipped)])``.
+    """
+    pid, responses, question_json_base_dir, output_updated_questions_dir, output_format, previous = args
+    template_path = os.path.join(question_json_base_dir, f"{pid}_wave4_Q_wave4_A.json")
+    try:
+        inputs_digest = hashlib.sha256(
+            f"{_file_digest(__file__)}:{_file_digest(template_path)}:{output_format}".encode("utf-8")
+        )
+    except FileNotFoundError:
+        print(f"⚠️ Base answer block not found: {template_path}")
+        return pid, [(question_id, None, False, False) for question_id, _ in responses]
+
+    results = []
+    for question_id, response_path in responses:
+        with open(response_path, 'rb') as f:
+            raw = f.read()
+        digest = inputs_digest.copy()
+        digest.update(raw)
+        digest = digest.hexdigest()
+        state = previous.get(question_id)
+        if state is not None and state.get("hash") == digest:
+            results.append((question_id, digest, state.get("ok", False), True))
+            continue
+        try:
+            simulation_response_data = _loads(raw)
+            ok = postprocess_simulation_response(
+                question_id,
+                simulation_response_data,
+                question_json_base_dir,
+                output_updated_questions_dir,
+                output_format=output_format,
+                verbose=False,
+            )
+        except Exception as e:
+            print(f"❌ Error postprocessing {question_id}: {e}")
+            digest, ok = None, False
+        results.append((question_id, digest, ok, False))
+    return pid, results
+
+def _write_postprocess_state(state_path, state):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def postprocess_run_outputs(run_root, question_json_base_dir, output_updated_questions_dir=None, output_format="blocks", max_workers=None, force=False):
+    """
+    Re-impute all simulations of a run in parallel and incrementally.
+
+    Discovers every ``pid_XXX/pid_XXX_simNNN`` response under ``run_root`` and
+    processes personas across a process pool; each worker keeps its own
+    template/validator cache. Input hashes are kept in
+    ``<output_updated_questions_dir>/.postprocess_state.json`` so unchanged
+    simulations are skipped on the next call (``force=True`` redoes all).
+    """
+    if output_updated_questions_dir is None:
+        output_updated_questions_dir = os.path.join(run_root, "answer_blocks_llm_imputed")
+    os.makedirs(output_updated_questions_dir, exist_ok=True)
+    state_path = os.path.join(output_updated_questions_dir, POSTPROCESS_STATE_FILENAME)
+    state = {}
+    if not force and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    responses = discover_simulation_responses(run_root)
+    total = sum(len(sims) for sims in responses.values())
+    print(f"Found {total} simulation responses for {len(responses)} personas in {run_root}")
+
+    counts = {"updated": 0, "failed": 0, "skipped": 0}
+    tasks = [
+        (pid, sims, question_json_base_dir, output_updated_questions_dir, output_format,
+         {question_id: state[question_id] for question_id, _ in sims if question_id in state})
+        for pid, sims in sorted(responses.items())
+    ]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_postprocess_persona_outputs, task) for task in tasks]
+        with tqdm(total=total, desc="Postprocessing responses") as pbar:
+            for done, future in enumerate(as_completed(futures), 1):
+                _, results = future.result()
+                for question_id, digest, ok, skipped in results:
+                    if skipped:
+                        counts["skipped"] += 1
+                    else:
+                        counts["updated" if ok else "failed"] += 1
+                    if digest is None:
+                        state.pop(question_id, None)
+                    else:
+                        state[question_id] = {"hash": digest, "ok": ok}
+                pbar.update(len(results))
+                if done % 100 == 0:
+                    _write_postprocess_state(state_path, state)
+    _write_postprocess_state(state_path, state)
+
+    print(f"Postprocessing complete. Updated: {counts['updated']}, Failed: {counts['failed']}, Unchanged (skipped): {counts['skipped']}.")
+    return counts
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Postprocess Gemini simulation responses and update original question JSONs.")
     parser.add_argument("--simulation_output_dir", default="text_simulation_output", 
                         help="Directory containing the simulation output JSON files (e.g., text_simulation_output).")
     parser.add_argument("--question_json_dir", default="../data/mega_persona_json/answer_blocks", 
                         help="Base directory containing the original answer block JSON files (e.g., data/mega_persona_json/answer_blocks).")
-    parser.add_argument("--output_updated_questions_dir", default="./text_simulation_output/answer_blocks_llm_imputed", 
-                        help="Directory to save the updated question JSON files.")
+    parser.add_argument("--output_updated_questions_dir", default=None, 
+                        help="Directory to save the updated question JSON files "
+                             "(default: ./text_simulation_output/answer_blocks_llm_imputed, or <run_root>/answer_blocks_llm_imputed with --run_root).")
+    parser.add_argument("--run_root", "--run-root", default=None,
+                        help="Bulk mode: re-impute every pid_XXX/pid_XXX_simNNN response under this run output root in parallel.")
+    parser.add_argument("--output_format", "--output-format", default="blocks", choices=IMPUTED_OUTPUT_FORMATS,
+                        help="Bulk mode: full answer blocks per simulation or compact per-persona JSONL.")
+    parser.add_argument("--workers", type=int, default=None, help="Bulk mode: worker processes (default: CPU count).")
+    parser.add_argument("--force", action="store_true", help="Bulk mode: ignore the incremental state and redo every simulation.")
     
     args = parser.parse_args()
     
-    postprocess_simulation_outputs(
-        args.simulation_output_dir,
-        args.question_json_dir,
-        args.output_updated_questions_dir
-    ) 
+    if args.run_root:
+        postprocess_run_outputs(
+            args.run_root,
+            args.question_json_dir,
+            args.output_updated_questions_dir,
+            output_format=args.output_format,
+            max_workers=args.workers,
+            force=args.force,
+        )
+    else:
+        postprocess_simulation_outputs(
+            args.simulation_output_dir,
+            args.question_json_dir,
+            args.output_updated_questions_dir or "./text_simulation_output/answer_blocks_llm_imputed"
+        ) 
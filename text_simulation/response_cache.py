@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+CACHE_MODES = ("off", "read", "write", "readwrite")
+
+
+class ResponseCache:
+    """
+    Content-addressed, SQLite-backed cache of verified LLM responses.
+
+    Entries are keyed by a hash of the provider request exactly as it would be
+    sent (model, params, system instruction, prompt) plus a per-sample key such
+    as the simulation id, so different simulations of one persona stay distinct
+    samples while a re-run of the same simulation is served from disk.
+
+    The database uses WAL mode and a busy timeout, so several processes (or
+    several runs) can share one cache file. All access happens on the calling
+    thread; SQLite calls are short enough to run on the event loop.
+
+    Args:
+        path: SQLite file path; parent directories are created.
+        mode: One of "off", "read", "write", "readwrite"; "read" never writes to the file.
+        max_age_days: Drop entries not accessed for this many days.
+        max_size_mb: Drop least recently used entries beyond this total payload size.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        mode: str = "readwrite",
+        max_age_days: Optional[float] = None,
+        max_size_mb: Optional[float] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode must be one of {CACHE_MODES}, got {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        if mode == "read":
+            # Opened read-only, so a cache shared between runs or nodes takes no write locks;
+            # a missing cache file is an empty cache.
+            if self.path.exists():
+                uri = f"{self.path.resolve().as_uri()}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, timeout=30.0, isolation_level=None)
+        elif mode != "off":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.evict()
+
+    @property
+    def readable(self) -> bool:
+        return self.mode in ("read", "readwrite")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in ("write", "readwrite")
+
+    @staticmethod
+    def make_key(provider: str, request: Dict[str, Any], sample_key: str = "") -> str:
+        blob = json.dumps(
+            {"provider": provider.lower(), "request": request, "sample_key": sample_key},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.readable:
+            return None
+        row = None
+        if self._conn is not None:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.writable:  # read-only caches may be shared between runs: never write to them
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        if not self.writable:
+            return
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(response, ensure_ascii=False, default=str), now, now),
+        )
+
+    def delete(self, key: str) -> None:
+        if self.writable:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def evict(self) -> int:
+        """Apply the age and size limits; returns the number of removed entries."""
+        if not self.writable:
+            return 0
+        removed = 0
+        if self.max_age_days:
+            cutoff = time.time() - float(self.max_age_days) * 86400
+            removed += self._conn.execute("DELETE FROM responses WHERE accessed_at < ?", (cutoff,)).rowcount
+        if self.max_size_mb:
+            budget = float(self.max_size_mb) * 1024 * 1024
+            total = self._conn.execute("SELECT COALESCE(SUM(LENGTH(response)), 0) FROM responses").fetchone()[0]
+            if total > budget:
+                stale = []
+                for key, size in self._conn.execute("SELECT key, LENGTH(response) FROM responses ORDER BY accessed_at"):
+                    if total <= budget:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+        return removed
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self.evict()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_response_cache(
+    mode: str,
+    path: Union[str, Path, None] = None,
+    *,
+    max_age_days: Optional[float] = None,
+    max_size_mb: Optional[float] = None,
+) -> Optional[ResponseCache]:
+    """Return a ResponseCache for ``mode``, or None when caching is off."""
+    mode = (mode or "off").lower()
+    if mode == "off":
+        return None
+    if path is None:
+        path = Path(__file__).resolve().parents[1] / "cache" / "llm_responses.sqlite"
+    return ResponseCache(path, mode=mode, max_age_days=max_age_days, max_size_mb=max_size_mb)
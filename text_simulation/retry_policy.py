@@ -0,0 +1,146 @@
+"""
+Unified retry policy for LLM calls.
+
+One engine decides every retry of a run, instead of a per-call retry
+decorator, the SDKs' own hidden retries and the verification loop stacking up:
+
+* ``classify_error`` sorts failures into retryable (connection errors,
+  timeouts, 408/409/425/429, 5xx), non-retryable (other 4xx such as a bad
+  request or auth error, local configuration errors) and verification-failed;
+  non-retryable errors end the job at once.
+* ``DecorrelatedJitter`` spaces retries: each delay is drawn from
+  ``[base, 3 * previous]`` and capped, which spreads clients out better than
+  plain exponential backoff.
+* ``RetryBudget`` caps retries for the whole run to ``min_retries + ratio *
+  jobs``, so a systematic failure (bad model name, exhausted quota) stops
+  quickly instead of every job burning its full attempt allowance.
+"""
+import asyncio
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+
+RETRYABLE = "retryable"
+NON_RETRYABLE = "non_retryable"
+VERIFICATION_FAILED = "verification_failed"
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for value in (
+        getattr(exc, "status_code", None),
+        getattr(getattr(exc, "response", None), "status_code", None),
+        getattr(exc, "code", None),  # google.api_core errors carry the HTTP status here
+    ):
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def classify_status_code(status: int) -> Optional[str]:
+    """``RETRYABLE`` / ``NON_RETRYABLE`` for an HTTP error status, None for other statuses."""
+    if status in RETRYABLE_STATUS_CODES or status >= 500:
+        return RETRYABLE
+    if 400 <= status < 500:
+        return NON_RETRYABLE
+    return None
+
+
+def classify_error(exc: BaseException) -> str:
+    """``RETRYABLE`` or ``NON_RETRYABLE`` for an exception raised by an LLM call."""
+    status = _status_code(exc)
+    if status is not None and classify_status_code(status) is not None:
+        return classify_status_code(status)
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return RETRYABLE
+    if isinstance(exc, (ValueError, TypeError, KeyError, ImportError, NotImplementedError)):
+        return NON_RETRYABLE  # e.g. a missing API key or an unsupported provider
+    return RETRYABLE  # unknown SDK errors: retry, bounded by the attempt limit and the budget
+
+
+class DecorrelatedJitter:
+    """Retry delays ``min(cap, uniform(base, 3 * previous))``."""
+
+    def __init__(self, base: float = 2.0, cap: float = 60.0, rng: Optional[random.Random] = None):
+        self.base = base
+        self.cap = cap
+        self._previous = base
+        self._rng = rng or random
+
+    def next_delay(self) -> float:
+        self._previous = min(self.cap, self._rng.uniform(self.base, self._previous * 3))
+        return self._previous
+
+
+class RetryBudget:
+    """
+    Run-wide retry allowance: at most ``min_retries + ratio * jobs`` retries.
+
+    ``ratio=None`` disables the budget. API retries and verification retries
+    draw from the same budget.
+    """
+
+    def __init__(self, ratio: Optional[float] = 0.5, min_retries: int = 20):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.jobs = 0
+        self.retries = 0
+        self.denied = 0
+
+    def record_job(self, count: int = 1) -> None:
+        self.jobs += count
+
+    def try_acquire(self) -> bool:
+        if self.ratio is not None and self.retries >= self.min_retries + self.ratio * self.jobs:
+            self.denied += 1
+            return False
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"jobs": self.jobs, "retries": self.retries, "denied": self.denied}
+
+
+class RetryPolicy:
+    """
+    Retry settings shared by every job of one run (``LLMConfig.retry_policy``).
+
+    Args:
+        api_attempts: Attempts per LLM call for retryable errors.
+        base_delay: Lower bound of a retry delay, in seconds.
+        max_delay: Upper bound of a retry delay, in seconds.
+        budget: Run-wide ``RetryBudget``; a default one is created if omitted.
+    """
+
+    def __init__(
+        self,
+        api_attempts: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.api_attempts = max(1, int(api_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def backoff(self) -> DecorrelatedJitter:
+        """A fresh delay sequence for one job or call."""
+        return DecorrelatedJitter(self.base_delay, self.max_delay)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RetryPolicy":
+        """From run-config keys ``api_max_attempts``, ``retry_base_delay``, ``retry_max_delay``,
+        ``retry_budget_ratio`` (null disables the budget) and ``retry_budget_min``."""
+        return cls(
+            api_attempts=int(config.get("api_max_attempts", 5)),
+            base_delay=float(config.get("retry_base_delay", 2.0)),
+            max_delay=float(config.get("retry_max_delay", 60.0)),
+            budget=RetryBudget(
+                ratio=config.get("retry_budget_ratio", 0.5),
+                min_retries=int(config.get("retry_budget_min", 20)),
+            ),
+        )
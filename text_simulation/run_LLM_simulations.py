@@ -3,9 +3,11 @@ import asyncio
 import json
 import os
 import re
+import socket
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import yaml
 from dotenv import load_dotenv
@@ -14,8 +16,35 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from text_simulation.llm_helper import LLMConfig, process_prompts_batch
-from text_simulation.postprocess_responses import postprocess_simulation_outputs_with_pid
+from text_simulation.batch_api import run_batch_jobs
+from text_simulation.llm_helper import (
+    VERIFICATION_EXECUTORS,
+    JsonlRunLog,
+    HedgePolicy,
+    LLMConfig,
+    VerificationOutcome,
+    make_verification_executor,
+    process_prompts_batch,
+)
+from text_simulation.postprocess_responses import (
+    IMPUTED_OUTPUT_FORMATS,
+    PartialReask,
+    postprocess_simulation_response,
+    unanswered_question_keys,
+)
+from text_simulation.response_cache import CACHE_MODES, open_response_cache
+from text_simulation.retry_policy import RetryPolicy
+from text_simulation.run_metrics import RunMetrics, format_summary
+from text_simulation.run_manifest import RunManifest, open_run_manifest, record_simulation_status
+from text_simulation.sharding import (
+    CLAIM_DB_FILENAME,
+    JobClaimTable,
+    merge_shard_outputs,
+    persona_of,
+    shard_of,
+    shard_output_root,
+    worker_output_root,
+)
 
 
 def safe_name(value: str) -> str:
@@ -68,15 +97,21 @@ def get_provider_params(config: Dict) -> Dict:
     return {**selected_provider_params, **provider_params}
 
 
+def natural_sort_key(name: str) -> List[Union[int, str]]:
+    """Sort key that orders embedded numbers numerically (pid_2 before pid_10)."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
 def select_prompt_files(input_root: Path, max_personas: Optional[int], pids: Optional[List[str]]) -> List[Path]:
-    prompt_files = sorted(input_root.glob("pid_*_prompt.txt"), key=lambda p: p.name)
+    prompt_files = sorted(input_root.glob("pid_*_prompt.txt"), key=lambda p: natural_sort_key(p.name))
     if pids:
         wanted = {pid if pid.startswith("pid_") else f"pid_{pid}" for pid in pids}
         prompt_files = [
             p for p in prompt_files
             if p.name.replace("_prompt.txt", "") in wanted
         ]
-    if max_personas is not None:
+    # A negative max_personas (e.g. -1 from scripts/run_pipeline.sh) means all personas.
+    if max_personas is not None and max_personas >= 0:
         prompt_files = prompt_files[:max_personas]
     return prompt_files
 
@@ -95,23 +130,112 @@ def existing_successful_sim_dirs(output_root: Path, pid: str) -> set:
     return out
 
 
-def build_prompt_jobs(
+def plan_prompt_jobs(
     prompt_files: Iterable[Path],
     output_root: Path,
     num_simulations_per_persona: int,
     force_regenerate: bool,
-) -> List[Tuple[str, str]]:
-    jobs = []
+    manifests: Sequence[RunManifest] = (),
+    shard_index: int = 0,
+    num_shards: int = 1,
+) -> List[Tuple[Path, List[str]]]:
+    """
+    Pending prompt ids per prompt file, without reading any prompt text.
+
+    With run ``manifests`` (the run root's and, on a shard node, the node's
+    own), completed simulations come from index queries instead of a scan of
+    every simulation directory. With ``num_shards > 1`` only personas hashing
+    to ``shard_index`` are planned.
+    """
+    completed = None
+    if manifests and not force_regenerate:
+        completed = set().union(*(manifest.completed() for manifest in manifests))
+    plan = []
     for prompt_file in prompt_files:
         pid = prompt_file.name.replace("_prompt.txt", "")
+        if num_shards > 1 and shard_of(pid, num_shards) != shard_index:
+            continue
+        if force_regenerate:
+            existing = set()
+        elif completed is not None:
+            existing = completed
+        else:
+            existing = existing_successful_sim_dirs(output_root, pid)
+        prompt_ids = [
+            f"{pid}_sim{sim_idx:03d}"
+            for sim_idx in range(1, num_simulations_per_persona + 1)
+            if f"{pid}_sim{sim_idx:03d}" not in existing
+        ]
+        if prompt_ids:
+            plan.append((prompt_file, prompt_ids))
+    return plan
+
+
+SCHEDULES = ("persona", "round_robin")
+
+
+def prioritize_plan(plan: List[Tuple[Path, List[str]]], priority_ids: Iterable[str]) -> List[Tuple[Path, List[str]]]:
+    """Move personas with any job in ``priority_ids`` to the front (stable), e.g. for claim order."""
+    priority_ids = set(priority_ids)
+    if not priority_ids:
+        return plan
+    return sorted(plan, key=lambda entry: not any(prompt_id in priority_ids for prompt_id in entry[1]))
+
+
+def _iter_scheduled_jobs(plan: List[Tuple[Path, List[str]]], schedule: str) -> Iterator[Tuple[str, str]]:
+    if schedule == "round_robin":
+        for round_index in range(max((len(prompt_ids) for _, prompt_ids in plan), default=0)):
+            for prompt_file, prompt_ids in plan:
+                if round_index < len(prompt_ids):
+                    yield prompt_ids[round_index], prompt_file.read_text(encoding="utf-8")
+        return
+    for prompt_file, prompt_ids in plan:
         prompt_text = prompt_file.read_text(encoding="utf-8")
-        existing = existing_successful_sim_dirs(output_root, pid)
-        for sim_idx in range(1, num_simulations_per_persona + 1):
-            prompt_id = f"{pid}_sim{sim_idx:03d}"
-            if not force_regenerate and prompt_id in existing:
-                continue
-            jobs.append((prompt_id, prompt_text))
-    return jobs
+        for prompt_id in prompt_ids:
+            yield prompt_id, prompt_text
+
+
+def iter_prompt_jobs(
+    plan: Iterable[Tuple[Path, List[str]]],
+    schedule: str = "persona",
+    priority_ids: Iterable[str] = (),
+) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily yield (prompt_id, prompt_text) in scheduling order.
+
+    ``persona``: all pending jobs of a persona back to back; its prompt is read
+    once and shared, which keeps provider prefix caches warm and lets
+    ``samples_per_request`` group identical prompts. ``round_robin``: breadth
+    first, the first pending job of every persona, then the second, ...; a run
+    stopped early covers as many personas as possible (prompts are re-read
+    once per round). Jobs in ``priority_ids`` (e.g. previously failed ones)
+    are scheduled before all others, in the same order.
+    """
+    if schedule not in SCHEDULES:
+        raise ValueError(f"schedule must be one of {SCHEDULES}, got {schedule!r}")
+    plan = list(plan)
+    priority_ids = set(priority_ids)
+    if priority_ids:
+        first = [(prompt_file, [p for p in prompt_ids if p in priority_ids]) for prompt_file, prompt_ids in plan]
+        rest = [(prompt_file, [p for p in prompt_ids if p not in priority_ids]) for prompt_file, prompt_ids in plan]
+        yield from _iter_scheduled_jobs([entry for entry in first if entry[1]], schedule)
+        yield from _iter_scheduled_jobs([entry for entry in rest if entry[1]], schedule)
+    else:
+        yield from _iter_scheduled_jobs(plan, schedule)
+
+
+def build_prompt_jobs(
+    prompt_files: Iterable[Path],
+    output_root: Path,
+    num_simulations_per_persona: int,
+    force_regenerate: bool,
+    shard_index: int = 0,
+    num_shards: int = 1,
+) -> List[Tuple[str, str]]:
+    return list(iter_prompt_jobs(plan_prompt_jobs(
+        prompt_files, output_root, num_simulations_per_persona, force_regenerate,
+        shard_index=shard_index, num_shards=num_shards,
+    )))
 
 
 def save_and_verify_response(
@@ -121,6 +245,7 @@ def save_and_verify_response(
     *,
     output_root: str,
     question_json_base_dir: str,
+    imputed_output_format: str = "blocks",
 ):
     output_root_path = Path(output_root)
     base_pid = prompt_id.split("_sim")[0]
@@ -138,29 +263,49 @@ def save_and_verify_response(
         "reasoning_content": llm_response_data.get("reasoning_content"),
         "llm_call_error": llm_response_data.get("error"),
     }
-    with open(response_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-
     if payload["llm_call_error"]:
+        with open(response_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        record_simulation_status(output_root_path, prompt_id, "error", str(payload["llm_call_error"]))
         return False
 
-    return postprocess_simulation_outputs_with_pid(
-        prompt_id,
-        str(output_root_path),
-        question_json_base_dir,
-        str(output_root_path / "answer_blocks_llm_imputed"),
-    )
-
-
-async def run_simulations(args):
+    verified = False
+    try:
+        # Verify from the in-memory payload, then write the response once together with the outcome,
+        # so a manifest rebuilt from disk agrees with the status recorded below.
+        verified = postprocess_simulation_response(
+            prompt_id,
+            payload,
+            question_json_base_dir,
+            str(output_root_path / "answer_blocks_llm_imputed"),
+            output_format=imputed_output_format,
+        )
+    finally:
+        payload["verification_status"] = "ok" if verified else "failed"
+        with open(response_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+    record_simulation_status(output_root_path, prompt_id, "ok" if verified else "failed", None if verified else "Verification failed")
+    if verified:
+        return True
+    # Name the failed questions so the caller can re-ask only those.
+    unanswered = unanswered_question_keys(prompt_id, payload, question_json_base_dir)
+    return VerificationOutcome(False, *unanswered) if unanswered else VerificationOutcome(False)
+
+
+def resolve_config(config: Union[Dict, str, Path, None]) -> Dict:
+    """A config dict, or a YAML path (relative paths resolve against the project root)."""
     project_root = resolve_project_root()
-    load_dotenv(project_root / ".env")
-
-    config_path = Path(args.config) if args.config else project_root / "text_simulation" / "configs" / "openai_config.yaml"
+    if isinstance(config, dict):
+        config = dict(config)
+        config["provider"] = config.get("provider") or config.get("model_provider") or "openai"
+        return config
+    config_path = Path(config) if config else project_root / "text_simulation" / "configs" / "openai_config.yaml"
     if not config_path.is_absolute():
         config_path = project_root / config_path
-    config = load_config(config_path)
+    return load_config(config_path)
 
+
+def apply_cli_overrides(config: Dict, args) -> Dict:
     if args.max_personas is not None:
         config["max_personas"] = args.max_personas
     if args.num_simulations_per_persona is not None:
@@ -171,33 +316,133 @@ async def run_simulations(args):
         config["model_name"] = args.model_name
     if args.output_folder_dir:
         config["output_folder_dir"] = args.output_folder_dir
+    if args.execution_mode:
+        config["execution_mode"] = args.execution_mode
+    if args.cache_mode:
+        config["cache_mode"] = args.cache_mode
+    if args.cache_path:
+        config["cache_path"] = args.cache_path
+    if args.verification_executor:
+        config["verification_executor"] = args.verification_executor
+    if args.imputed_output_format:
+        config["imputed_output_format"] = args.imputed_output_format
+    if args.verification_workers is not None:
+        config["verification_workers"] = args.verification_workers
+    if args.partial_reask:
+        config["partial_reask"] = True
+    if args.hedge_requests:
+        config["hedge_requests"] = True
+    if args.schedule:
+        config["schedule"] = args.schedule
+    if args.retry_failed_first:
+        config["retry_failed_first"] = True
+    for key in ("shard_index", "num_shards", "claim_db", "worker_id", "claim_batch_size", "lease_seconds"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    return config
+
+
+async def simulate_personas(pids: Optional[Iterable[str]], config: Union[Dict, str, Path, None]) -> Dict:
+    """
+    Run all pending simulations for ``pids`` (all selected personas when None) in one event loop.
+
+    Personas share the worker pool and rate limiter, so there is no per-persona
+    process startup or pacing sleep. Returns a run summary with the output
+    root, the number of finished jobs and the ``{prompt_id: error}`` mapping.
+    """
+    project_root = resolve_project_root()
+    load_dotenv(project_root / ".env")
+    config = resolve_config(config)
 
     input_root = resolve_text_simulation_path(project_root, config.get("input_folder_dir", "text_simulation_input"))
     output_root = get_output_root(project_root, config)
     output_root.mkdir(parents=True, exist_ok=True)
 
-    pids = [p.strip() for p in args.pids.split(",") if p.strip()] if args.pids else None
-    prompt_files = select_prompt_files(input_root, config.get("max_personas"), pids)
+    num_shards = int(config.get("num_shards", 1))
+    shard_index = int(config.get("shard_index", 0))
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    claim_db = config.get("claim_db")
+    worker_id = config.get("worker_id") or f"{socket.gethostname()}-{os.getpid()}"
+    # Shard and claim-mode nodes write into their own subtree of output_root;
+    # `--merge-shards` folds the subtrees back in once all nodes are done.
+    if claim_db:
+        claim_db_path = output_root / CLAIM_DB_FILENAME if claim_db == "auto" else resolve_text_simulation_path(project_root, claim_db)
+        node_root = worker_output_root(output_root, worker_id)
+    elif num_shards > 1:
+        node_root = shard_output_root(output_root, shard_index, num_shards)
+    else:
+        node_root = output_root
+    node_root.mkdir(parents=True, exist_ok=True)
+
+    prompt_files = select_prompt_files(input_root, config.get("max_personas"), list(pids) if pids is not None else None)
     if not prompt_files:
         raise RuntimeError(f"No prompt files found in {input_root}")
 
-    jobs = build_prompt_jobs(
+    manifest = open_run_manifest(node_root)
+    manifests = [manifest]
+    if node_root != output_root:
+        manifests.append(open_run_manifest(output_root))
+    plan = plan_prompt_jobs(
         prompt_files,
         output_root,
         int(config.get("num_simulations_per_persona", 1)),
         bool(config.get("force_regenerate", False)),
+        manifests,
+        shard_index=shard_index,
+        num_shards=num_shards,
     )
+    schedule = config.get("schedule", "persona")
+    if schedule not in SCHEDULES:
+        raise ValueError(f"schedule must be one of {SCHEDULES}, got {schedule!r}")
+    priority_ids = set()
+    if config.get("retry_failed_first"):
+        # Simulations whose last attempt errored or failed verification go first.
+        priority_ids = {row["prompt_id"] for m in manifests for row in m.problems()}
+        plan = prioritize_plan(plan, priority_ids)
+    for root_manifest in manifests[1:]:
+        root_manifest.close()
 
     print("Simulation configuration:")
     print(f"  Provider: {config.get('provider')}")
     print(f"  Model: {config.get('model_name')}")
     print(f"  Personas selected: {len(prompt_files)}")
-    print(f"  Jobs to run: {len(jobs)}")
-    print(f"  Output root: {output_root}")
-
-    if not jobs:
+    if num_shards > 1:
+        print(f"  Shard: {shard_index + 1} of {num_shards} ({len(plan)} personas with pending jobs)")
+    num_jobs = sum(len(prompt_ids) for _, prompt_ids in plan)
+    print(f"  Jobs to run: {num_jobs}")
+    print(f"  Execution mode: {config.get('execution_mode', 'online')}")
+    print(f"  Schedule: {schedule}" + (f" ({len(priority_ids)} previously failed jobs first)" if priority_ids else ""))
+    print(f"  Output root: {node_root}")
+    if claim_db:
+        print(f"  Claim table: {claim_db_path} (worker {worker_id})")
+
+    if not num_jobs:
         print("All selected simulations already exist. Nothing to run.")
-        return
+        manifest.close()
+        return {"output_root": str(node_root), "jobs": 0, "finished": 0, "errors": {}}
+
+    cache_path = config.get("cache_path")
+    response_cache = open_response_cache(
+        config.get("cache_mode", "off"),
+        resolve_text_simulation_path(project_root, cache_path) if cache_path else None,
+        max_age_days=config.get("cache_max_age_days"),
+        max_size_mb=config.get("cache_max_size_mb"),
+    )
+    if response_cache is not None:
+        print(f"  Response cache: {response_cache.path} ({response_cache.mode})")
+    # Verification (save + parse + validate + dump) runs on its own pool, sized
+    # independently of num_workers, so it never throttles request dispatch.
+    verification_executor = make_verification_executor(
+        config.get("verification_executor", "thread"),
+        config.get("verification_workers"),
+    )
+    print(f"  Imputed answers: {config.get('imputed_output_format', 'blocks')}")
+    print(f"  Verification executor: {config.get('verification_executor', 'thread')}")
+    print(f"  Partial re-ask: {'on' if config.get('partial_reask') else 'off'}")
+    hedge_policy = HedgePolicy.from_config(config)
+    if hedge_policy is not None:
+        print(f"  Hedged requests: after p{hedge_policy.percentile:g} latency, budget {hedge_policy.budget:.0%} of calls")
 
     llm_config = LLMConfig(
         model_name=config["model_name"],
@@ -209,24 +454,195 @@ async def run_simulations(args):
         provider_params=get_provider_params(config),
         verification_callback=save_and_verify_response,
         verification_callback_args={
-            "output_root": str(output_root),
+            "output_root": str(node_root),
             "question_json_base_dir": str(project_root / "data" / "mega_persona_json" / "answer_blocks"),
+            "imputed_output_format": config.get("imputed_output_format", "blocks"),
         },
+        response_cache=response_cache,
+        verification_executor=verification_executor,
+        retry_policy=RetryPolicy.from_config(config),
+        partial_reask=PartialReask(float(config.get("partial_reask_max_fraction", 0.5))) if config.get("partial_reask") else None,
+        hedge_policy=hedge_policy,
     )
 
-    results = await process_prompts_batch(
-        jobs,
-        llm_config,
-        provider=config["provider"],
-        desc=f"{config['provider']} simulations",
-    )
-    errors = {pid: data for pid, data in results.items() if data.get("error")}
-    print(f"Finished {len(results)} jobs; errors: {len(errors)}")
+    # Results are streamed: every finished job is appended to run_log.jsonl as it
+    # completes, and only errors are kept in memory for simulation_errors.json.
+    run_log = JsonlRunLog(node_root / "run_log.jsonl")
+    run_metrics = RunMetrics()
+    errors = {}
+    finished = 0
+    on_job_finished = None  # set in claim mode to settle a persona's lease once its last job is done
+
+    def on_result(prompt_id, response_data, record):
+        nonlocal finished
+        finished += 1
+        run_log(prompt_id, response_data, record)
+        if response_data.get("error"):
+            errors[prompt_id] = response_data
+            # Verification failures were already recorded by save_and_verify_response.
+            if "llm_response_data" not in response_data:
+                manifest.record(prompt_id, "error", str(response_data["error"]))
+        if on_job_finished is not None:
+            on_job_finished(prompt_id)
+
+    async def run_jobs(jobs, desc, total=None):
+        if config.get("execution_mode", "online") == "batch":
+            await run_batch_jobs(
+                jobs,
+                llm_config,
+                config["provider"],
+                work_dir=node_root / "batch_requests",
+                poll_interval=float(config.get("batch_poll_interval", 30)),
+                desc=f"{config['provider']} batch {desc}",
+                on_result=on_result,
+                collect_results=False,
+                metrics=run_metrics,
+            )
+        else:
+            await process_prompts_batch(
+                jobs,
+                llm_config,
+                provider=config["provider"],
+                desc=f"{config['provider']} {desc}",
+                on_result=on_result,
+                collect_results=False,
+                total=total,
+                metrics=run_metrics,
+            )
+
+    async def run_claimed_jobs():
+        nonlocal on_job_finished
+        lease_seconds = float(config.get("lease_seconds", 1800))
+        num_simulations = int(config.get("num_simulations_per_persona", 1))
+        # Enough personas per claim to keep every worker busy (matters most for batch submissions).
+        claim_batch_size = int(config.get("claim_batch_size") or max(1, int(config.get("num_workers", 5)) // num_simulations))
+        pending_by_pid = {prompt_file.name.replace("_prompt.txt", ""): (prompt_file, prompt_ids) for prompt_file, prompt_ids in plan}
+        # Personas this node may still claim in this run; a persona it released is not retried until the next run.
+        claimable = dict(pending_by_pid)
+        unfinished: Dict[str, int] = {}  # claimed persona -> jobs not finished yet
+        with JobClaimTable(claim_db_path, lease_seconds=lease_seconds) as claims:
+            claims.add(pending_by_pid)
+
+            def claim_next() -> List[str]:
+                # Only personas this node has pending jobs for: another node's selection may still need the rest.
+                claimed = claims.claim(worker_id, claim_batch_size, among=claimable)
+                for pid in claimed:
+                    unfinished[pid] = len(claimable.pop(pid)[1])
+                return claimed
+
+            def settle(prompt_id):
+                pid = persona_of(prompt_id)
+                if pid not in unfinished:
+                    return
+                unfinished[pid] -= 1
+                if unfinished[pid]:
+                    return
+                del unfinished[pid]
+                # A persona is done only when every simulation verified; otherwise it goes back to
+                # pending so a later run (on any node) retries the failed simulations.
+                if set(pending_by_pid[pid][1]) <= manifest.completed(pid):
+                    claims.complete(worker_id, [pid])
+                else:
+                    claims.release(worker_id, [pid])
+
+            def claimed_jobs():
+                # Claims lazily as the worker queue drains, so all claimed personas share one worker
+                # pool, client registry and rate limiter.
+                while True:
+                    claimed = claim_next()
+                    if not claimed:
+                        return
+                    yield from iter_prompt_jobs([pending_by_pid[pid] for pid in claimed], schedule, priority_ids)
+
+            async def keep_leases():
+                while True:
+                    await asyncio.sleep(lease_seconds / 3)
+                    claims.renew(worker_id, list(unfinished))
+
+            on_job_finished = settle
+            renewer = asyncio.create_task(keep_leases())
+            try:
+                if config.get("execution_mode", "online") == "batch":
+                    # The batch runner spools its whole input before submitting, so claim one submission at a time.
+                    while True:
+                        claimed = claim_next()
+                        if not claimed:
+                            break
+                        await run_jobs(
+                            iter_prompt_jobs([pending_by_pid[pid] for pid in claimed], schedule, priority_ids),
+                            f"simulations ({', '.join(claimed)})",
+                        )
+                else:
+                    await run_jobs(claimed_jobs(), "claimed simulations")
+            finally:
+                renewer.cancel()
+                on_job_finished = None
+                # Jobs not finished (the run stopped early): let other nodes take over now rather than after the lease.
+                claims.release(worker_id, list(unfinished))
+            print(f"  Claim table: {claims.counts()}")
+
+    try:
+        if claim_db:
+            await run_claimed_jobs()
+        else:
+            await run_jobs(iter_prompt_jobs(plan, schedule, priority_ids), "simulations", total=num_jobs)
+    finally:
+        run_log.close()
+        verification_executor.shutdown(wait=True)
+        manifest.close()
+        if response_cache is not None:
+            print(f"  Response cache hits: {response_cache.hits}, misses: {response_cache.misses}")
+            response_cache.close()
+        summary_path = node_root / "run_summary.json"
+        run_summary = run_metrics.write_summary(
+            summary_path,
+            provider=config.get("provider"),
+            model_name=config.get("model_name"),
+            execution_mode=config.get("execution_mode", "online"),
+            num_workers=int(config.get("num_workers", 5)),
+            retry_budget=llm_config.retry_policy.budget.stats(),
+            hedging=hedge_policy.stats() if hedge_policy is not None else None,
+        )
+    print(f"Finished {finished} jobs; errors: {len(errors)}")
+    print(format_summary(run_summary))
+    print(f"Run log: {run_log.path}")
+    print(f"Run summary: {summary_path}")
+    print(f"Run manifest: {manifest.path}")
     if errors:
-        error_path = output_root / "simulation_errors.json"
+        error_path = node_root / "simulation_errors.json"
         with open(error_path, "w", encoding="utf-8") as f:
             json.dump(errors, f, ensure_ascii=False, indent=2)
         print(f"Saved errors to: {error_path}")
+    if node_root != output_root:
+        print(f"Node outputs are under {node_root}; run with --merge-shards once all nodes finish.")
+    return {"output_root": str(node_root), "jobs": num_jobs, "finished": finished, "errors": errors, "metrics": run_summary}
+
+
+def run_simulations_for(pids: Optional[Iterable[str]], config: Union[Dict, str, Path, None] = None) -> Dict:
+    """
+    Blocking entry point for notebooks and scripts; see ``simulate_personas``.
+
+    ``config`` is a config dict or YAML path. Inside an already running event
+    loop (e.g. Jupyter), the run is executed on a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(simulate_personas(pids, config))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, simulate_personas(pids, config)).result()
+
+
+async def run_simulations(args):
+    config = apply_cli_overrides(resolve_config(args.config), args)
+    if args.merge_shards:
+        output_root = get_output_root(resolve_project_root(), config)
+        stats = merge_shard_outputs(output_root)
+        print(f"Merged {stats['simulations']} simulations from {stats['nodes']} node(s) into {output_root}; "
+              f"unresolved errors: {stats.get('errors', 0)}")
+        return
+    pids = [p.strip() for p in args.pids.split(",") if p.strip()] if args.pids else None
+    await simulate_personas(pids, config)
 
 
 def parse_args():
@@ -235,9 +651,47 @@ def parse_args():
     parser.add_argument("--max_personas", type=int, default=None)
     parser.add_argument("--num_simulations_per_persona", type=int, default=None)
     parser.add_argument("--pids", default=None, help="Comma-separated pids, e.g. pid_1,pid_2")
-    parser.add_argument("--provider", default=None, choices=["openai", "deepseek", "claude", "anthropic", "gemini"])
+    parser.add_argument("--provider", default=None, choices=["openai", "deepseek", "claude", "anthropic", "gemini", "mock"])
     parser.add_argument("--model_name", default=None)
     parser.add_argument("--output_folder_dir", default=None)
+    parser.add_argument("--execution_mode", "--execution-mode", default=None, choices=["online", "batch"],
+                        help="online: one request per job; batch: provider Batch API (openai, claude).")
+    parser.add_argument("--cache_mode", "--cache-mode", default=None, choices=CACHE_MODES,
+                        help="Response cache mode (default: config cache_mode or off).")
+    parser.add_argument("--cache_path", "--cache-path", default=None,
+                        help="SQLite response cache file (default: cache/llm_responses.sqlite).")
+    parser.add_argument("--verification_executor", "--verification-executor", default=None, choices=VERIFICATION_EXECUTORS,
+                        help="Run response verification in a thread pool (default) or a process pool.")
+    parser.add_argument("--verification_workers", "--verification-workers", type=int, default=None,
+                        help="Verification pool size (default: config verification_workers or CPU count).")
+    parser.add_argument("--imputed_output_format", "--imputed-output-format", default=None, choices=IMPUTED_OUTPUT_FORMATS,
+                        help="blocks: full answer-block copy per simulation (default); "
+                             "jsonl: compact answer records appended to answer_blocks_llm_imputed/<pid>.jsonl.")
+    parser.add_argument("--partial_reask", "--partial-reask", action="store_true",
+                        help="When a few questions fail verification, re-ask only those and merge the answers.")
+    parser.add_argument("--schedule", default=None, choices=SCHEDULES,
+                        help="Job order: persona = all simulations of a persona back to back (default; best prefix-cache "
+                             "locality); round_robin = one simulation of every persona per round (broad coverage early).")
+    parser.add_argument("--retry_failed_first", "--retry-failed-first", action="store_true",
+                        help="Schedule simulations that errored or failed verification in an earlier run first.")
+    parser.add_argument("--hedge_requests", "--hedge-requests", action="store_true",
+                        help="Send a duplicate of requests slower than the run's p95 latency (config hedge_percentile) "
+                             "and keep the first response, within a hedge budget (config hedge_budget, default 5%%).")
+    parser.add_argument("--shard_index", "--shard-index", type=int, default=None,
+                        help="This node's shard (0-based); personas are partitioned by a stable hash of their pid.")
+    parser.add_argument("--num_shards", "--num-shards", type=int, default=None,
+                        help="Total number of shards/nodes (default: 1, no sharding).")
+    parser.add_argument("--claim_db", "--claim-db", default=None,
+                        help="Shared SQLite job table for lease-based work claiming across nodes "
+                             f"('auto' = <output_root>/{CLAIM_DB_FILENAME}). Delete it to re-run claimed personas.")
+    parser.add_argument("--worker_id", "--worker-id", default=None,
+                        help="Node name in claim mode (default: <hostname>-<pid>).")
+    parser.add_argument("--claim_batch_size", "--claim-batch-size", type=int, default=None,
+                        help="Personas leased per claim in claim mode (default: num_workers / num_simulations_per_persona).")
+    parser.add_argument("--lease_seconds", "--lease-seconds", type=float, default=None,
+                        help="Claim lease duration; leases are renewed while a node works (default: 1800).")
+    parser.add_argument("--merge_shards", "--merge-shards", action="store_true",
+                        help="Merge all node outputs under <output_root>/shards into output_root and exit.")
     return parser.parse_args()
 
 
@@ -0,0 +1,282 @@
+"""
+Per-run SQLite manifest of simulation status.
+
+Every finished simulation is recorded by ``save_and_verify_response`` as one
+row keyed by ``prompt_id`` (e.g. ``pid_574_sim001``) with status ``ok``,
+``failed`` (response saved but verification failed) or ``error`` (the LLM
+call itself failed). Resume, error listing, cleanup and completeness reports
+query this index instead of walking every simulation directory.
+
+For runs produced before the manifest existed, rebuild it from disk:
+
+    python text_simulation/run_manifest.py rebuild <run_output_root>
+    python text_simulation/run_manifest.py report <run_output_root>
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+MANIFEST_FILENAME = "run_manifest.sqlite"
+SIMULATION_STATUSES = ("ok", "failed", "error")
+JOURNAL_MODES = ("DELETE", "WAL")
+_UNRECORDED = "unrecorded"  # response written before verification_status was stored
+
+
+class RunManifest:
+    """
+    SQLite index of simulation status for one run output root.
+
+    Verification workers in several threads or processes record results
+    concurrently; each ``record`` is a single autocommitted statement and
+    writers wait on a busy timeout. The default rollback journal works on a
+    network filesystem such as an NFS output root (as long as it has working
+    file locks); WAL is faster but needs every process on one host, since
+    its index lives in shared memory.
+
+    Args:
+        path: SQLite file path; parent directories are created.
+        journal_mode: "DELETE" (default) or, for a manifest on a local disk only, "WAL".
+    """
+
+    def __init__(self, path: Union[str, Path], journal_mode: str = "DELETE"):
+        if journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of {JOURNAL_MODES}, got {journal_mode!r}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode.upper()}")
+        if journal_mode.upper() == "WAL":
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS simulations (
+                prompt_id TEXT PRIMARY KEY,
+                persona_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS simulations_persona ON simulations (persona_id, status)")
+        self._lock = threading.Lock()
+
+    def record(self, prompt_id: str, status: str, error: Optional[str] = None) -> None:
+        if status not in SIMULATION_STATUSES:
+            raise ValueError(f"status must be one of {SIMULATION_STATUSES}, got {status!r}")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO simulations (prompt_id, persona_id, status, error, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (prompt_id, prompt_id.split("_sim")[0], status, error, time.time()),
+            )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM simulations LIMIT 1").fetchone() is None
+
+    def completed(self, persona_id: Optional[str] = None) -> Set[str]:
+        """Prompt ids with status ``ok``, optionally for one persona."""
+        query, params = "SELECT prompt_id FROM simulations WHERE status = 'ok'", ()
+        if persona_id is not None:
+            query, params = query + " AND persona_id = ?", (persona_id,)
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, params)}
+
+    def problems(self) -> List[Dict[str, str]]:
+        """Simulations whose last attempt errored or failed verification."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT persona_id, prompt_id, status, error FROM simulations WHERE status != 'ok' ORDER BY persona_id, prompt_id"
+            ).fetchall()
+        return [{"persona_id": pid, "prompt_id": prompt_id, "status": status, "error": error} for pid, prompt_id, status, error in rows]
+
+    def persona_counts(self, status: str = "ok") -> Dict[str, int]:
+        """``{persona_id: number of simulations with status}``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT persona_id, COUNT(*) FROM simulations WHERE status = ? GROUP BY persona_id", (status,)
+            ).fetchall()
+        return dict(rows)
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM simulations GROUP BY status").fetchall())
+
+    def delete(self, prompt_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM simulations WHERE prompt_id = ?", [(p,) for p in prompt_ids])
+
+    def merge_from(self, other_path: Union[str, Path]) -> None:
+        """Import rows from another manifest; the most recently updated row per prompt_id wins."""
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (str(other_path),))
+            try:
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO simulations (prompt_id, persona_id, status, error, updated_at)
+                    SELECT o.prompt_id, o.persona_id, o.status, o.error, o.updated_at
+                    FROM other.simulations AS o LEFT JOIN simulations AS m ON m.prompt_id = o.prompt_id
+                    WHERE m.prompt_id IS NULL OR o.updated_at >= m.updated_at
+                    """
+                )
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+
+    def rebuild_from_disk(self, output_root: Union[str, Path]) -> int:
+        """
+        Replace the index with the state found under ``output_root``.
+
+        A simulation directory counts as ``error`` when its response records an
+        LLM call error or the directory holds a file with "error" in its name.
+        Otherwise the response's ``verification_status`` decides between ``ok``
+        and ``failed``; responses written before that field existed fall back to
+        the persona's JSONL imputed answers (a last record with failed or
+        invalid answers means ``failed``) and count as ``ok`` without one.
+        Returns the number of indexed simulations.
+        """
+        rows = []
+        now = time.time()
+        with os.scandir(output_root) as persona_entries:
+            for persona_entry in persona_entries:
+                if not persona_entry.is_dir() or not persona_entry.name.startswith("pid_"):
+                    continue
+                jsonl_failures = None  # read on first need: most responses carry verification_status
+                with os.scandir(persona_entry.path) as sim_entries:
+                    for sim_entry in sim_entries:
+                        if not sim_entry.is_dir() or "_sim" not in sim_entry.name:
+                            continue
+                        status, error = _status_on_disk(Path(sim_entry.path))
+                        if status == _UNRECORDED:
+                            if jsonl_failures is None:
+                                jsonl_failures = _jsonl_verification_failures(Path(output_root), persona_entry.name)
+                            status, error = ("failed", "Verification failed") if sim_entry.name in jsonl_failures else ("ok", None)
+                        if status is not None:
+                            rows.append((sim_entry.name, persona_entry.name, status, error, now))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM simulations")
+                self._conn.executemany(
+                    "INSERT INTO simulations (prompt_id, persona_id, status, error, updated_at) VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self) -> "RunManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _status_on_disk(sim_dir: Path):
+    response_path = sim_dir / f"{sim_dir.name}_response.json"
+    if not response_path.exists():
+        return None, None
+    error_files = [f.name for f in sim_dir.iterdir() if "error" in f.name.lower()]
+    if error_files:
+        return "error", ", ".join(error_files)
+    try:
+        with open(response_path, "r", encoding="utf-8") as f:
+            response = json.load(f)
+    except (OSError, ValueError) as e:
+        return "error", f"Unreadable response file: {e}"
+    if response.get("llm_call_error"):
+        return "error", str(response["llm_call_error"])
+    verification_status = response.get("verification_status")
+    if verification_status == "failed":
+        return "failed", "Verification failed"
+    if verification_status == "ok":
+        return "ok", None
+    return _UNRECORDED, None
+
+
+def _jsonl_verification_failures(output_root: Path, persona_id: str) -> Set[str]:
+    """Simulation ids whose last JSONL imputed-answers record has failed or invalid answers."""
+    failures: Set[str] = set()
+    try:
+        with open(output_root / "answer_blocks_llm_imputed" / f"{persona_id}.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted append
+                if record.get("failed") or record.get("invalid"):
+                    failures.add(record.get("simulation_id"))
+                else:
+                    failures.discard(record.get("simulation_id"))
+    except OSError:
+        pass
+    return failures
+
+
+def manifest_path(output_root: Union[str, Path]) -> Path:
+    return Path(output_root) / MANIFEST_FILENAME
+
+
+def open_run_manifest(output_root: Union[str, Path], *, rebuild_if_missing: bool = True) -> RunManifest:
+    """
+    Open the manifest of a run output root.
+
+    When no manifest exists yet but the run already has simulation outputs on
+    disk (a run started before the manifest existed), it is rebuilt once.
+    """
+    path = manifest_path(output_root)
+    existed = path.exists()
+    manifest = RunManifest(path)
+    if rebuild_if_missing and not existed and Path(output_root).exists() and any(Path(output_root).glob("pid_*")):
+        count = manifest.rebuild_from_disk(output_root)
+        print(f"Rebuilt run manifest from disk: {count} simulations indexed in {path}")
+    return manifest
+
+
+_worker_manifests: Dict[str, RunManifest] = {}
+_worker_manifests_lock = threading.Lock()
+
+
+def record_simulation_status(output_root: Union[str, Path], prompt_id: str, status: str, error: Optional[str] = None) -> None:
+    """Record one result from a verification worker; connections are reused per process."""
+    key = str(manifest_path(output_root))
+    with _worker_manifests_lock:
+        manifest = _worker_manifests.get(key)
+        if manifest is None:
+            manifest = _worker_manifests[key] = RunManifest(key)
+    manifest.record(prompt_id, status, error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the simulation status manifest of a run output root.")
+    parser.add_argument("command", choices=["rebuild", "report", "errors"],
+                        help="rebuild: re-index from disk; report: counts per status; errors: list failed simulations.")
+    parser.add_argument("output_root", help="Run output root containing pid_XXX/pid_XXX_simNNN directories.")
+    args = parser.parse_args()
+
+    with RunManifest(manifest_path(args.output_root)) as manifest:
+        if args.command == "rebuild":
+            started = time.monotonic()
+            count = manifest.rebuild_from_disk(args.output_root)
+            print(f"Indexed {count} simulations in {time.monotonic() - started:.1f}s → {manifest.path}")
+        elif args.command == "report":
+            counts = manifest.status_counts()
+            print(f"Simulations: {sum(counts.values())} ({', '.join(f'{k}: {v}' for k, v in sorted(counts.items())) or 'none'})")
+            print(f"Personas with completed simulations: {len(manifest.persona_counts())}")
+        else:
+            for row in manifest.problems():
+                print(f"{row['prompt_id']}\t{row['status']}\t{row['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
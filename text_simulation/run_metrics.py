@@ -0,0 +1,244 @@
+"""
+Per-job instrumentation and live run aggregates for LLM simulation runs.
+
+While a job runs, ``process_prompts_batch`` binds a metrics dict to the
+current task (``job_metrics``); the layers underneath add to it without any
+extra plumbing:
+
+* queue wait (enqueue → a worker picks the job up),
+* rate-limiter wait, time to first byte (response headers) and request time,
+* API retries of the LLM call, by exception class, and HTTP error
+  responses by status,
+* the adaptive concurrency limit at dispatch (AIMD mode) and hedged
+  duplicate requests,
+* verification attempts and partial re-asks, retry-budget denials, time queued on the verification executor and time
+  spent in the callback (save + parse + validate + dump),
+* prompt / completion / cached tokens and the final status.
+
+``job_record`` flattens these into each run_log.jsonl line. ``RunMetrics``
+folds records into live aggregates (latency percentiles, tokens/sec, error
+rate by class) and writes the end-of-run summary. Comparing the request,
+verification-queue and verification totals tells whether a slow run is
+provider-, verification- or disk-bound.
+"""
+import contextvars
+import json
+import math
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+_job_metrics: contextvars.ContextVar = contextvars.ContextVar("job_metrics", default=None)
+
+STAGE_KEYS = ("queue_wait_s", "rate_limit_wait_s", "ttfb_s", "request_s", "verify_wait_s", "verify_s", "latency_s")
+
+
+def job_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics dict of the job running in the current task, if any."""
+    return _job_metrics.get()
+
+
+def bind_job_metrics(metrics: Dict[str, Any]) -> contextvars.Token:
+    return _job_metrics.set(metrics)
+
+
+def unbind_job_metrics(token: contextvars.Token) -> None:
+    _job_metrics.reset(token)
+
+
+def add_job_metric(key: str, amount: float = 1) -> None:
+    metrics = _job_metrics.get()
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + amount
+
+
+def set_job_metric(key: str, value: Any) -> None:
+    metrics = _job_metrics.get()
+    if metrics is not None:
+        metrics[key] = value
+
+
+def count_job_event(key: str, name: str) -> None:
+    """Increment ``metrics[key][name]`` (e.g. retries per exception class)."""
+    metrics = _job_metrics.get()
+    if metrics is not None:
+        counts = metrics.setdefault(key, {})
+        counts[name] = counts.get(name, 0) + 1
+
+
+def token_counts(usage_details: Optional[Dict]) -> Dict[str, int]:
+    """Prompt / completion / cached tokens from any provider's usage_details."""
+    usage = usage_details or {}
+    completion = usage.get("completion_token_count")
+    if completion is None:
+        completion = usage.get("candidates_token_count", 0)
+    return {
+        "prompt_tokens": usage.get("prompt_token_count", 0) or 0,
+        "completion_tokens": completion or 0,
+        "cached_tokens": usage.get("cached_prompt_token_count", 0) or 0,
+    }
+
+
+def percentiles(values: List[float], points: Iterable[int] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles of ``values``."""
+    ordered = sorted(values)
+    out = {}
+    for point in points:
+        if not ordered:
+            out[f"p{point}"] = None
+            continue
+        rank = max(1, math.ceil(point / 100 * len(ordered)))
+        out[f"p{point}"] = round(ordered[rank - 1], 3)
+    return out
+
+
+class RunMetrics:
+    """
+    Aggregates of ``job_record`` dicts for one run.
+
+    ``observe`` is cheap (appends and counters); percentiles are computed only
+    when a ``snapshot`` is taken, so live progress can be refreshed about once a
+    second without slowing the event loop.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.jobs = 0
+        self.stage_values: Dict[str, List[float]] = {key: [] for key in STAGE_KEYS}
+        self.tokens = Counter()
+        self.statuses = Counter()
+        self.errors_by_class = Counter()
+        self.errors_by_kind = Counter()
+        self.api_retries_by_class = Counter()
+        self.http_errors = Counter()
+        self.verification_attempts = 0
+        self.partial_reasks = 0
+        self.retry_budget_denied = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.cache_hits = 0
+        self.concurrency_limits: List[float] = []
+        self._last_postfix = 0.0
+
+    def observe(self, record: Dict[str, Any]) -> None:
+        self.jobs += 1
+        for key in STAGE_KEYS:
+            value = record.get(key)
+            if value is not None:
+                self.stage_values[key].append(value)
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            self.tokens[key] += record.get(key) or 0
+        self.statuses[record.get("status") or "ok"] += 1
+        if record.get("error_class"):
+            self.errors_by_class[record["error_class"]] += 1
+        if record.get("error_kind"):
+            self.errors_by_kind[record["error_kind"]] += 1
+        self.api_retries_by_class.update(record.get("api_retry_errors") or {})
+        self.http_errors.update(record.get("http_errors") or {})
+        self.verification_attempts += record.get("verification_attempts") or 0
+        self.partial_reasks += record.get("partial_reasks") or 0
+        self.retry_budget_denied += bool(record.get("retry_budget_denied"))
+        self.hedged_requests += record.get("hedged_requests") or 0
+        self.hedge_wins += bool(record.get("hedge_won"))
+        self.cache_hits += bool(record.get("cache_hit"))
+        if record.get("concurrency_limit") is not None:
+            self.concurrency_limits.append(record["concurrency_limit"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total_tokens = self.tokens["prompt_tokens"] + self.tokens["completion_tokens"]
+        return {
+            "jobs": self.jobs,
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_s": round(self.jobs / elapsed, 3),
+            "statuses": dict(self.statuses),
+            "error_rate": round(sum(self.errors_by_class.values()) / self.jobs, 4) if self.jobs else 0.0,
+            "error_rate_by_class": {cls: round(n / self.jobs, 4) for cls, n in self.errors_by_class.most_common()},
+            "errors_by_class": dict(self.errors_by_class.most_common()),
+            "errors_by_kind": dict(self.errors_by_kind.most_common()),
+            "api_retries": sum(self.api_retries_by_class.values()),
+            "api_retries_by_class": dict(self.api_retries_by_class.most_common()),
+            "http_errors": dict(self.http_errors.most_common()),
+            "verification_attempts": self.verification_attempts,
+            "partial_reasks": self.partial_reasks,
+            "retry_budget_denied": self.retry_budget_denied,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "cache_hits": self.cache_hits,
+            "concurrency_limit": {
+                "last": self.concurrency_limits[-1],
+                "min": min(self.concurrency_limits),
+                "max": max(self.concurrency_limits),
+            } if self.concurrency_limits else None,
+            "tokens": dict(self.tokens),
+            "tokens_per_s": round(total_tokens / elapsed, 1),
+            "completion_tokens_per_s": round(self.tokens["completion_tokens"] / elapsed, 1),
+            # Per stage: percentiles and the total seconds summed over jobs.
+            "stages": {
+                key: {**percentiles(values), "total_s": round(sum(values), 3)}
+                for key, values in self.stage_values.items()
+            },
+        }
+
+    def postfix(self, min_interval: float = 1.0) -> Optional[Dict[str, str]]:
+        """Short live summary for a progress bar, or None if refreshed less than ``min_interval`` ago."""
+        now = time.monotonic()
+        if now - self._last_postfix < min_interval:
+            return None
+        self._last_postfix = now
+        latency = percentiles(self.stage_values["latency_s"])
+        elapsed = max(now - self.started, 1e-9)
+        errors = sum(self.errors_by_class.values())
+        postfix = {
+            "p50": f"{latency['p50'] or 0:.1f}s",
+            "p95": f"{latency['p95'] or 0:.1f}s",
+            "p99": f"{latency['p99'] or 0:.1f}s",
+            "tok/s": f"{(self.tokens['prompt_tokens'] + self.tokens['completion_tokens']) / elapsed:.0f}",
+            "err": f"{errors / self.jobs:.1%}" if self.jobs else "0%",
+        }
+        if self.concurrency_limits:
+            postfix["conc"] = f"{self.concurrency_limits[-1]:.0f}"
+        return postfix
+
+    def write_summary(self, path: Union[str, Path], **extra: Any) -> Dict[str, Any]:
+        summary = {**extra, **self.snapshot()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.3f}s"
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """A few human-readable lines for the end of a run."""
+    stages = summary["stages"]
+    lines = [
+        f"  Jobs: {summary['jobs']} in {summary['elapsed_s']:.1f}s ({summary['jobs_per_s']:.2f}/s), "
+        f"statuses: {summary['statuses']}",
+        f"  Latency p50/p95/p99: {_seconds(stages['latency_s']['p50'])}/{_seconds(stages['latency_s']['p95'])}/"
+        f"{_seconds(stages['latency_s']['p99'])}, TTFB p50: {_seconds(stages['ttfb_s']['p50'])}",
+        f"  Tokens/s: {summary['tokens_per_s']} ({summary['tokens']})",
+        "  Time by stage (summed over jobs): " + ", ".join(
+            f"{key[:-2]} {stages[key]['total_s']:.1f}s" for key in STAGE_KEYS if key != "latency_s"
+        ),
+    ]
+    if summary.get("concurrency_limit"):
+        lines.append(f"  Adaptive concurrency limit: {summary['concurrency_limit']}")
+    if summary["errors_by_class"]:
+        lines.append(f"  Errors by class: {summary['errors_by_class']}")
+    if summary.get("errors_by_kind"):
+        lines.append(f"  Errors by kind: {summary['errors_by_kind']}")
+    if summary["api_retries"]:
+        lines.append(f"  API retries: {summary['api_retries_by_class']}")
+    if summary.get("partial_reasks"):
+        lines.append(f"  Partial re-asks: {summary['partial_reasks']}")
+    if summary.get("retry_budget_denied"):
+        lines.append(f"  Jobs stopped by the retry budget: {summary['retry_budget_denied']} ({summary.get('retry_budget')})")
+    if summary.get("hedged_requests"):
+        lines.append(f"  Hedged requests: {summary['hedged_requests']} (won by the hedge: {summary['hedge_wins']})")
+    if summary["http_errors"]:
+        lines.append(f"  HTTP error responses: {summary['http_errors']}")
+    return "\n".join(lines)
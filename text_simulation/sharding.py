@@ -0,0 +1,257 @@
+"""
+Multi-node execution helpers for run_LLM_simulations.
+
+Two ways to spread one run over several machines (each with its own API key
+or quota) without two nodes simulating the same persona:
+
+* Static sharding (``--shard-index i --num-shards n``): personas are assigned
+  by a stable hash of their pid, so every node computes the same partition
+  without coordination.
+* Claim mode (``--claim-db path``): nodes lease personas from a shared SQLite
+  job table. Leases are renewed while a node works; a crashed node's leases
+  expire and idle nodes pick the personas up.
+
+Either way each node writes into its own subtree ``<output_root>/shards/<node>/``
+(same layout as a normal run root), and ``merge_shard_outputs`` folds all node
+subtrees, run logs, error files and manifests back into ``<output_root>``.
+"""
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Container, Dict, Iterable, List, Optional, Union
+
+from text_simulation.run_manifest import MANIFEST_FILENAME, RunManifest, manifest_path
+
+SHARDS_DIRNAME = "shards"
+CLAIM_DB_FILENAME = "job_claims.sqlite"
+
+
+def persona_of(prompt_id: str) -> str:
+    return prompt_id.split("_sim")[0]
+
+
+def shard_of(prompt_id: str, num_shards: int) -> int:
+    """
+    Deterministic shard of a prompt id (or pid).
+
+    Hashes the persona part only, so all simulations of a persona land on the
+    same node and keep sharing its prompt prefix. Uses sha1 rather than
+    ``hash()``, which is salted per process.
+    """
+    digest = hashlib.sha1(persona_of(prompt_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_output_root(output_root: Union[str, Path], shard_index: int, num_shards: int) -> Path:
+    return Path(output_root) / SHARDS_DIRNAME / f"shard_{shard_index:03d}_of_{num_shards:03d}"
+
+
+def worker_output_root(output_root: Union[str, Path], worker_id: str) -> Path:
+    safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in worker_id)
+    return Path(output_root) / SHARDS_DIRNAME / f"worker_{safe_id}"
+
+
+class JobClaimTable:
+    """
+    Shared SQLite table of personas to simulate, claimed under time-limited leases.
+
+    Each claim runs in an IMMEDIATE transaction, so two nodes can never lease
+    the same persona. A persona is ``pending``, ``leased`` (by a worker until
+    ``lease_expires``) or ``done``; expired leases count as pending again.
+
+    The table uses SQLite's rollback journal rather than WAL: WAL keeps its
+    index in shared memory and only works when every process runs on the same
+    host, while the nodes here reach the file over a shared filesystem. That
+    filesystem must support working POSIX file locks (e.g. NFS with a running
+    lock manager); without them SQLite cannot keep two nodes from leasing the
+    same persona.
+
+    Args:
+        path: SQLite file reachable by every node (e.g. on the shared output root).
+        lease_seconds: How long a claim stays valid without renewal.
+    """
+
+    def __init__(self, path: Union[str, Path], lease_seconds: float = 1800.0):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=DELETE")  # also converts a table created in WAL mode
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_key TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                lease_expires REAL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._lock = threading.Lock()
+
+    def add(self, job_keys: Iterable[str]) -> None:
+        """Register jobs; keys that already exist keep their state. Jobs are claimed in the order first added."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job_key, state, updated_at) VALUES (?, 'pending', ?)",
+                [(key, now) for key in job_keys],
+            )
+
+    def claim(self, worker_id: str, limit: int = 1, among: Optional[Container[str]] = None) -> List[str]:
+        """
+        Lease up to ``limit`` pending (or expired) jobs to ``worker_id``.
+
+        ``among`` restricts the claim to jobs this worker can run (e.g. its own
+        ``--pids`` selection), so it never holds jobs other workers still need.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT job_key FROM jobs WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY rowid",
+                    (now,),
+                )
+                keys = list(itertools.islice((row[0] for row in rows if among is None or row[0] in among), limit))
+                self._conn.executemany(
+                    "UPDATE jobs SET state = 'leased', worker_id = ?, lease_expires = ?, updated_at = ? WHERE job_key = ?",
+                    [(worker_id, now + self.lease_seconds, now, key) for key in keys],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return keys
+
+    def renew(self, worker_id: str, job_keys: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE job_key = ? AND worker_id = ? AND state = 'leased'",
+                [(now + self.lease_seconds, now, key, worker_id) for key in job_keys],
+            )
+
+    def release(self, worker_id: str, job_keys: Iterable[str]) -> None:
+        """Hand leased jobs back as pending, e.g. when the worker stops before running them."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = 'pending', worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE job_key = ? AND worker_id = ? AND state = 'leased'",
+                [(now, key, worker_id) for key in job_keys],
+            )
+
+    def complete(self, worker_id: str, job_keys: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = 'done', lease_expires = NULL, updated_at = ? WHERE job_key = ? AND worker_id = ?",
+                [(now, key, worker_id) for key in job_keys],
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self) -> "JobClaimTable":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _move_replacing(src: Path, dst: Path) -> None:
+    if dst.exists():
+        shutil.rmtree(dst) if dst.is_dir() else dst.unlink()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(src), str(dst))
+
+
+def _append_file(src: Path, dst: Path) -> None:
+    with open(src, "rb") as fin, open(dst, "ab") as fout:
+        shutil.copyfileobj(fin, fout)
+
+
+def _merge_simulation_dirs(src_root: Path, dst_root: Path) -> int:
+    moved = 0
+    for pid_dir in src_root.glob("pid_*"):
+        if not pid_dir.is_dir():
+            continue
+        for sim_dir in pid_dir.iterdir():
+            _move_replacing(sim_dir, dst_root / pid_dir.name / sim_dir.name)
+            moved += 1
+    return moved
+
+
+def merge_shard_outputs(output_root: Union[str, Path], remove_merged: bool = True) -> Dict[str, int]:
+    """
+    Fold every node subtree under ``<output_root>/shards/`` into ``output_root``.
+
+    Simulation and imputed-answer directories are moved (a node's copy replaces
+    an older one), compact ``<pid>.jsonl`` answer files and ``run_log.jsonl``
+    are appended, ``simulation_errors.json`` files are unioned minus anything
+    that succeeded on another node, and node manifests are merged into the
+    root manifest (newest row per prompt_id wins).
+    """
+    output_root = Path(output_root)
+    shards_dir = output_root / SHARDS_DIRNAME
+    stats = {"nodes": 0, "simulations": 0}
+    if not shards_dir.exists():
+        return stats
+
+    errors_path = output_root / "simulation_errors.json"
+    errors: Dict[str, Dict] = {}
+    if errors_path.exists():
+        with open(errors_path, "r", encoding="utf-8") as f:
+            errors = json.load(f)
+
+    with RunManifest(manifest_path(output_root)) as root_manifest:
+        for node_root in sorted(p for p in shards_dir.iterdir() if p.is_dir()):
+            stats["nodes"] += 1
+            stats["simulations"] += _merge_simulation_dirs(node_root, output_root)
+
+            imputed_dir = node_root / "answer_blocks_llm_imputed"
+            if imputed_dir.exists():
+                root_imputed = output_root / "answer_blocks_llm_imputed"
+                root_imputed.mkdir(parents=True, exist_ok=True)
+                _merge_simulation_dirs(imputed_dir, root_imputed)
+                for jsonl_path in imputed_dir.glob("pid_*.jsonl"):
+                    _append_file(jsonl_path, root_imputed / jsonl_path.name)
+
+            if (node_root / "run_log.jsonl").exists():
+                _append_file(node_root / "run_log.jsonl", output_root / "run_log.jsonl")
+            if (node_root / "simulation_errors.json").exists():
+                with open(node_root / "simulation_errors.json", "r", encoding="utf-8") as f:
+                    errors.update(json.load(f))
+            if (node_root / MANIFEST_FILENAME).exists():
+                root_manifest.merge_from(node_root / MANIFEST_FILENAME)
+
+            if remove_merged:
+                shutil.rmtree(node_root)
+            print(f"Merged {node_root.name} into {output_root}")
+
+        completed = root_manifest.completed()
+
+    errors = {prompt_id: error for prompt_id, error in errors.items() if prompt_id not in completed}
+    if errors:
+        with open(errors_path, "w", encoding="utf-8") as f:
+            json.dump(errors, f, ensure_ascii=False, indent=2)
+    elif errors_path.exists():
+        os.remove(errors_path)
+    stats["errors"] = len(errors)
+    if remove_merged and not any(shards_dir.iterdir()):
+        shards_dir.rmdir()
+    return stats